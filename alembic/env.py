@@ -7,7 +7,7 @@ from alembic import context
 from dotenv import load_dotenv
 load_dotenv()
 
-# ✅ Import your SQLAlchemy Base and engine from FastAPI
+# ✅ Import your SQLAlchemy Base and the sync engine from FastAPI (migrations stay sync)
 from app.models import Base
 from app.database import engine
 
@@ -0,0 +1,40 @@
+"""add full text search indexes
+
+Revision ID: 3a7e5c9b1d42
+Revises: 8f3b2d6c4a91
+Create Date: 2025-07-15 11:06:37.418520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7e5c9b1d42'
+down_revision: Union[str, Sequence[str], None] = '8f3b2d6c4a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match models.BOOK_SEARCH_VECTOR / REVIEW_SEARCH_VECTOR exactly, or
+# the planner won't use the indexes for search queries
+BOOK_SEARCH_VECTOR = "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', author), 'B')"
+REVIEW_SEARCH_VECTOR = "to_tsvector('english', content)"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # tsvector is Postgres only; other databases search with the in-process index
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.create_index('ix_books_search', 'books', [sa.text(f"({BOOK_SEARCH_VECTOR})")], unique=False, postgresql_using='gin')
+    op.create_index('ix_reviews_search', 'reviews', [sa.text(REVIEW_SEARCH_VECTOR)], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.drop_index('ix_reviews_search', table_name='reviews')
+    op.drop_index('ix_books_search', table_name='books')
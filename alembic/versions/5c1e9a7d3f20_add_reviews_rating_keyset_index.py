@@ -0,0 +1,28 @@
+"""add reviews rating keyset index
+
+Revision ID: 5c1e9a7d3f20
+Revises: bb0750c30255
+Create Date: 2025-07-02 10:14:08.512907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e9a7d3f20'
+down_revision: Union[str, Sequence[str], None] = 'bb0750c30255'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_reviews_book_id_rating_id', 'reviews', ['book_id', 'rating', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_reviews_book_id_rating_id', table_name='reviews')
@@ -0,0 +1,61 @@
+"""add book rating aggregates
+
+Revision ID: 8f3b2d6c4a91
+Revises: 5c1e9a7d3f20
+Create Date: 2025-07-08 15:32:51.204113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b2d6c4a91'
+down_revision: Union[str, Sequence[str], None] = '5c1e9a7d3f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RATINGS = range(1, 6)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('books', sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('books', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('books', sa.Column('average_rating', sa.Float(), nullable=True))
+    for rating in RATINGS:
+        op.add_column('books', sa.Column(f'rating_{rating}_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Ratings were unbounded before; clamp them into RATINGS so the counts,
+    # sums and averages cover the same reviews as the histogram
+    op.execute(f"""
+        UPDATE reviews SET rating = CASE WHEN rating < {min(RATINGS)} THEN {min(RATINGS)} ELSE {max(RATINGS)} END
+        WHERE rating < {min(RATINGS)} OR rating > {max(RATINGS)}
+    """)
+
+    # Backfill the aggregates from the existing reviews
+    histogram = ",\n".join(
+        f"rating_{rating}_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND reviews.rating = {rating})"
+        for rating in RATINGS
+    )
+    op.execute(f"""
+        UPDATE books SET
+            review_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id),
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id),
+            average_rating = (SELECT AVG(rating * 1.0) FROM reviews WHERE reviews.book_id = books.id),
+            {histogram}
+    """)
+
+    op.create_index('ix_books_average_rating', 'books', ['average_rating', 'review_count', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_average_rating', table_name='books')
+    for rating in reversed(RATINGS):
+        op.drop_column('books', f'rating_{rating}_count')
+    op.drop_column('books', 'average_rating')
+    op.drop_column('books', 'rating_sum')
+    op.drop_column('books', 'review_count')
@@ -0,0 +1,127 @@
+import logging
+import os
+
+import orjson
+from fastapi import Request
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Rows validated and inserted per transaction
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+async def read_items(request: Request):
+    """Yield (index, item) from a JSON array body or, incrementally, from an NDJSON stream.
+
+    Lines that aren't valid JSON are yielded as an ItemError so the row is
+    reported without aborting the rest of the stream.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_TYPES:
+        try:
+            items = orjson.loads(await request.body())
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"Body is not valid JSON: {e}")
+        if not isinstance(items, list):
+            raise ValueError("Body must be a JSON array (or send application/x-ndjson)")
+        for index, item in enumerate(items):
+            yield index, item
+        return
+
+    index, buffer = 0, b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, parse_line(line)
+                index += 1
+    if buffer.strip():
+        yield index, parse_line(buffer)
+
+
+class ItemError:
+    def __init__(self, message):
+        self.message = message
+
+
+def parse_line(line: bytes):
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError as e:
+        return ItemError(f"Invalid JSON: {e}")
+
+
+async def ingest(request: Request, db: AsyncSession, schema, insert_chunk):
+    """Validate and insert request rows in BULK_CHUNK_SIZE chunks.
+
+    `insert_chunk(db, models)` inserts one chunk and returns, per row, the new
+    id or an error message. Each chunk is its own transaction; if one fails
+    as a whole it is retried row by row so only the bad rows are reported.
+    Returns a dict matching schemas.BulkResult, and the inserted models.
+    """
+    outcomes = {}
+    inserted = []
+    chunk = []
+
+    async def flush():
+        results = await insert_chunk_or_rows(db, insert_chunk, [model for _, model in chunk])
+        for (index, model), outcome in zip(chunk, results):
+            outcomes[index] = outcome
+            if isinstance(outcome, int):
+                inserted.append(model)
+        chunk.clear()
+
+    total = 0
+    async for index, item in read_items(request):
+        total = index + 1
+        if isinstance(item, ItemError):
+            outcomes[index] = item.message
+            continue
+        try:
+            chunk.append((index, schema.model_validate(item)))
+        except ValidationError as e:
+            outcomes[index] = e.errors(include_url=False, include_context=False, include_input=False)
+            continue
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await flush()
+    await flush()
+
+    ids = [outcomes[index] if isinstance(outcomes[index], int) else None for index in range(total)]
+    errors = [
+        {"index": index, "error": outcomes[index]}
+        for index in range(total) if ids[index] is None
+    ]
+    return {"inserted": len(inserted), "ids": ids, "errors": errors}, inserted
+
+
+async def insert_chunk_or_rows(db: AsyncSession, insert_chunk, models):
+    if not models:
+        return []
+    try:
+        outcomes = await insert_chunk(db, models)
+        await db.commit()
+        return outcomes
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning("Bulk chunk of %d rows failed, retrying row by row: %s", len(models), e)
+
+    outcomes = []
+    for model in models:
+        try:
+            outcomes.extend(await insert_chunk(db, [model]))
+            await db.commit()
+        except PoolTimeout:
+            raise
+        except SQLAlchemyError as e:
+            await db.rollback()
+            outcomes.append(str(e.orig if getattr(e, "orig", None) else e))
+    return outcomes
@@ -1,56 +1,719 @@
-import json
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+
+import orjson
 import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
 from redis.exceptions import ConnectionError, RedisError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from app import database
+from app.compression import compress_for_cache
+from app.metrics import record_cache_lookup, redis_timer
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+# Connections per worker; callers wait up to REDIS_POOL_TIMEOUT for a free one
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))
+# A hung Redis turns into a cache miss after this long instead of stalling requests
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+# Retries with exponential backoff on connection errors and timeouts
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "1"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+
+def make_redis():
+    """Redis client with a bounded connection pool, from the REDIS_* settings"""
+    pool = aioredis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(ExponentialBackoff(cap=0.5, base=0.01), REDIS_RETRIES),
+        retry_on_error=[ConnectionError, RedisTimeoutError],
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+# This worker's Redis client (values are raw bytes, see encode()), created
+# by init_redis() at startup so no connection is shared across forked
+# workers; None means caching is off
+REDIS_ENABLED = os.getenv("REDIS_ENABLED", "true").lower() == "true"
+r = None
+
+
+def init_redis():
+    """Create this worker's Redis client, unless there is one or Redis is disabled"""
+    global r
+    if r is not None or not REDIS_ENABLED:
+        return r
+    try:
+        r = make_redis()
+        logger.debug("Redis client created")
+    except Exception as e:
+        logger.warning("Redis client could not be created: %s", e)
+        r = None
+    return r
+
+
+async def close_redis():
+    """Close this worker's Redis connections (worker shutdown)"""
+    global r
+    if r is not None:
+        await r.aclose()
+        r = None
+
+
+# Pages are fresh for CACHE_TTL seconds, then served stale for up to
+# CACHE_STALE_TTL more while one background task refreshes them
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "30"))
+
+# Optional Redis lock so only one worker recomputes a missing key
+CACHE_LOCK_ENABLED = os.getenv("CACHE_LOCK_ENABLED", "false").lower() == "true"
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "5"))
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# Release a lock only if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# In-process tier kept in front of Redis by every worker
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "1024"))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "5"))
+# Lookup counts are kept for about this many of the most requested keys,
+# see HotKeys (the cache warmer recomputes the hottest of them)
+CACHE_HOT_KEYS = int(os.getenv("CACHE_HOT_KEYS", "1000"))
+# Hot keys (comma separated) copied from Redis into a new worker's local
+# tier at startup, so its first requests don't all go to Redis
+WARM_CACHE_KEYS = [key.strip() for key in os.getenv("WARM_CACHE_KEYS", "books_0_10,books_top_rated_10_1").split(",") if key.strip()]
+
+# Channel the write paths publish invalidated keys on
+INVALIDATION_CHANNEL = "cache_invalidation"
+
+# Bumped by every invalidation; each invalidated tag remembers the value
+# that last hit it for TAG_GENERATION_TTL seconds (longer than any page
+# takes to compute), so a page computed from a read that started before
+# the write is not stored after the write dropped the old one
+GENERATION_KEY = "cache:generation"
+TAG_GENERATION_TTL = 600
+
+# Atomically drop every key recorded under the given tag sets (KEYS[2],
+# KEYS[4], ...), and the sets themselves, and mark the tags (KEYS[3],
+# KEYS[5], ...) with a new generation from KEYS[1]; returns the dropped keys
+INVALIDATE_TAGS_SCRIPT = """
+local generation = redis.call('INCR', KEYS[1])
+local dropped = {}
+for i = 2, #KEYS, 2 do
+    for _, key in ipairs(redis.call('SMEMBERS', KEYS[i])) do
+        redis.call('DEL', key)
+        table.insert(dropped, key)
+    end
+    redis.call('DEL', KEYS[i])
+    redis.call('SET', KEYS[i + 1], generation, 'EX', ARGV[1])
+end
+return dropped
+"""
+
+# Store KEYS[1] = ARGV[1] for ARGV[2] seconds and record it in the tag sets
+# KEYS[2], KEYS[4], ...; a set's TTL is only ever extended, so it outlives
+# every member and a write still finds the longest-lived of them. Nothing is
+# stored (returns 0) if one of the tags (KEYS[3], KEYS[5], ...) was
+# invalidated after generation ARGV[3], when that is given
+STORE_SCRIPT = """
+local since = tonumber(ARGV[3])
+if since then
+    for i = 3, #KEYS, 2 do
+        if tonumber(redis.call('GET', KEYS[i]) or '0') > since then
+            return 0
+        end
+    end
+end
+local ttl = tonumber(ARGV[2])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+for i = 2, #KEYS, 2 do
+    redis.call('SADD', KEYS[i], KEYS[1])
+    if redis.call('TTL', KEYS[i]) < ttl then
+        redis.call('EXPIRE', KEYS[i], ttl)
+    end
+end
+return 1
+"""
+
+# Tags naming the entity sets a cached page depends on
+BOOKS_TAG = "books"
+RATINGS_TAG = "ratings"
+
+
+def reviews_tag(book_id: int) -> str:
+    return f"reviews:{book_id}"
+
+
+def tag_key(tag: str) -> str:
+    """Redis set holding every cached key that depends on `tag`"""
+    return f"tag:{tag}"
+
+
+def tag_generation_key(tag: str) -> str:
+    """Generation of the last invalidation of `tag`, see GENERATION_KEY"""
+    return f"generation:{tag}"
+
+
+def tagged_keys(tags):
+    """Each tag's set and generation keys, in the order the scripts above expect"""
+    return [name for tag in tags for name in (tag_key(tag), tag_generation_key(tag))]
+
+
+def store_command(key, data: bytes, ex, tags, since):
+    """Arguments of an EVAL of STORE_SCRIPT"""
+    return (STORE_SCRIPT, 1 + 2 * len(tags), key, *tagged_keys(tags), data, ex, "" if since is None else since)
+
+
+class LocalCache:
+    """Size-bounded LRU with a per-entry TTL, holding raw cache bytes in-process"""
 
-# Redis connection with error handling
-try:
-    r = aioredis.Redis(host="localhost", port=6379, decode_responses=True)
-    print("✅ Redis connection established")
-except Exception as e:
-    print(f"⚠️ Redis connection failed: {e}")
-    r = None
+    def __init__(self, max_entries=LOCAL_CACHE_MAX_ENTRIES, ttl=LOCAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
 
-async def get_cache(key):
-    """Get data from Redis cache with error handling"""
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return data
+
+    def set(self, key, data, ex=None):
+        ttl = self.ttl if ex is None else min(ex, self.ttl)
+        self.entries[key] = (data, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+local_cache = LocalCache()
+
+
+class HotKeys:
+    """Approximate lookup counts of the most requested keys, in bounded memory.
+
+    Counts are kept for at most 2 * capacity keys; past that only the
+    capacity most requested survive, so the long tail never accumulates.
+    """
+
+    def __init__(self, capacity=CACHE_HOT_KEYS):
+        self.capacity = capacity
+        self.counts = Counter()
+
+    def record(self, key, count=1):
+        self.counts[key] += count
+        if len(self.counts) > 2 * self.capacity:
+            self.counts = Counter(dict(self.counts.most_common(self.capacity)))
+
+    def top(self, n=None):
+        return [key for key, _ in self.counts.most_common(n)]
+
+    def drain(self):
+        """Hand over the counts so far and start afresh"""
+        counts, self.counts = self.counts, Counter()
+        return counts
+
+    def __len__(self):
+        return len(self.counts)
+
+
+# Lookups of this worker, read by the cache warmer
+hot_keys = HotKeys()
+
+# Hit/miss counters per tier, see cache_stats()
+stats = Counter()
+
+
+def cache_stats():
+    """Hit/miss counts and hit ratio for each cache tier, plus stampede counters"""
+    report = {"local": {"entries": len(local_cache), "max_entries": local_cache.max_entries}}
+    for tier in ("local", "redis"):
+        hits, misses = stats[f"{tier}_hits"], stats[f"{tier}_misses"]
+        report.setdefault(tier, {}).update({
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        })
+    report["stampede"] = {
+        name: stats[name] for name in ("coalesced", "lock_waits", "stale_served", "refreshes")
+    }
+    return report
+
+
+def encode(value) -> bytes:
+    """Compact JSON encoding used for every cache entry"""
+    return orjson.dumps(value)
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag for a response body: a hash of its exact bytes"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+async def get_raw(key):
+    """Get the raw bytes stored under key, or None on a miss or Redis error.
+
+    The local tier is only used while Redis is available, since it relies on
+    Redis pub/sub to stay coherent across workers.
+    """
+    data, _ = await lookup(key)
+    return data
+
+async def lookup(key):
+    """get_raw(), plus the cache_generation() read in the same round trip when
+    key isn't in the local tier (None otherwise, or on a Redis error)"""
     if r is None:
-        print("⚠️ Redis not available, skipping cache")
-        return None
-    
+        logger.debug("Redis not available, skipping cache")
+        return None, None
+
+    hot_keys.record(key)
+    data = local_cache.get(key)
+    record_cache_lookup(key, "local", data is not None)
+    if data is not None:
+        stats["local_hits"] += 1
+        return data, None
+    stats["local_misses"] += 1
+
     try:
-        data = await r.get(key)
-        if data:
-            return json.loads(data)
-        return None
+        with redis_timer("get"):
+            data, generation = await r.mget(key, GENERATION_KEY)
+        generation = int(generation or 0)
+        record_cache_lookup(key, "redis", data is not None)
+        if data is None:
+            stats["redis_misses"] += 1
+            return None, generation
+        stats["redis_hits"] += 1
+        local_cache.set(key, data)
+        return data, generation
     except (ConnectionError, RedisError) as e:
-        print(f"⚠️ Redis error in get_cache: {e}")
+        logger.warning("Redis error in cache lookup: %s", e, extra={"key": key})
+        return None, None
+    except Exception:
+        logger.exception("Unexpected error in cache lookup", extra={"key": key})
+        return None, None
+
+async def set_raw(key, data: bytes, ex=60, tags=(), since=None):
+    """Store raw bytes under key, recording it under each of its tags.
+
+    With `since` (a cache_generation() read before the data was computed)
+    nothing is stored if one of the tags has been invalidated since.
+    """
+    if r is None:
+        logger.debug("Redis not available, skipping cache")
+        return
+
+    try:
+        with redis_timer("set"):
+            stored = await r.eval(*store_command(key, data, ex, tags, since))
+        if not stored:
+            stats["stale_writes_skipped"] += 1
+            logger.debug("Not caching data computed before a write", extra={"key": key})
+            return
+        local_cache.set(key, data, ex=ex)
+        logger.debug("Cached data", extra={"key": key})
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in set_raw: %s", e, extra={"key": key})
+    except Exception:
+        logger.exception("Unexpected error in set_raw", extra={"key": key})
+
+async def get_many_raw(keys):
+    """Raw bytes for each of keys (None for a miss), with a single MGET for the
+    keys the local tier doesn't hold; a Redis error counts as all misses"""
+    values, _ = await lookup_many(keys)
+    return values
+
+async def lookup_many(keys):
+    """get_many_raw(), plus the cache_generation() read by the same MGET (None
+    if every key was in the local tier, or on a Redis error)"""
+    if r is None:
+        logger.debug("Redis not available, skipping cache")
+        return [None] * len(keys), None
+
+    found, remote = {}, []
+    for key in keys:
+        hot_keys.record(key)
+        data = local_cache.get(key)
+        record_cache_lookup(key, "local", data is not None)
+        if data is None:
+            stats["local_misses"] += 1
+            remote.append(key)
+        else:
+            stats["local_hits"] += 1
+            found[key] = data
+    if not remote:
+        return [found[key] for key in keys], None
+
+    try:
+        with redis_timer("mget"):
+            *values, generation = await r.mget(*remote, GENERATION_KEY)
+        generation = int(generation or 0)
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in get_many_raw: %s", e, extra={"keys": len(remote)})
+        values, generation = [None] * len(remote), None
+    for key, data in zip(remote, values):
+        record_cache_lookup(key, "redis", data is not None)
+        if data is None:
+            stats["redis_misses"] += 1
+            continue
+        stats["redis_hits"] += 1
+        local_cache.set(key, data)
+        found[key] = data
+    return [found.get(key) for key in keys], generation
+
+async def set_many_raw(entries, ex=CACHE_TTL, since=None):
+    """Store (key, data, tags) entries like set_raw(), all in one pipelined round trip"""
+    if r is None or not entries:
+        return
+
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            for key, data, tags in entries:
+                pipe.eval(*store_command(key, data, ex, tags, since))
+            with redis_timer("set_many"):
+                stored = await pipe.execute()
+        for (key, data, _), was_stored in zip(entries, stored):
+            if was_stored:
+                local_cache.set(key, data, ex=ex)
+            else:
+                stats["stale_writes_skipped"] += 1
+        logger.debug("Cached %d entries", len(entries))
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in set_many_raw: %s", e, extra={"keys": len(entries)})
+    except Exception:
+        logger.exception("Unexpected error in set_many_raw")
+
+async def get_cached_entry(key):
+    """Get a cached response as (body, headers, fresh_until), body left as encoded bytes"""
+    return parse_entry(key, await get_raw(key))
+
+def parse_entry(key, data):
+    """(body, headers, fresh_until) from what response_entry() stored, or None"""
+    if not data:
         return None
-    except Exception as e:
-        print(f"⚠️ Unexpected error in get_cache: {e}")
+    meta_line, _, body = data.partition(b"\n")
+    try:
+        meta = orjson.loads(meta_line)
+        return body, meta["headers"], meta["fresh_until"]
+    except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+        logger.warning("Ignoring malformed cache entry: %s", e, extra={"key": key})
         return None
 
-async def set_cache(key, value, ex=60):
-    """Set data in Redis cache with error handling"""
+async def get_cached_response(key):
+    """Get a cached response as (body, headers), whether fresh or stale"""
+    entry = await get_cached_entry(key)
+    if entry is None:
+        return None
+    body, headers, _ = entry
+    return body, headers
+
+async def set_cached_response(key, body: bytes, headers=None, ex=CACHE_TTL, tags=(), stale_ttl=CACHE_STALE_TTL, since=None):
+    """Cache an already-encoded JSON response body together with its headers.
+
+    The entry is fresh for `ex` seconds and kept for `stale_ttl` more so it
+    can be served while it is being refreshed.
+    """
+    await set_raw(key, response_entry(body, headers, ex), ex=ex + stale_ttl, tags=tags, since=since)
+
+async def set_cached_responses(responses, ex=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, since=None):
+    """Cache (key, body, headers, tags) responses as compute_and_store() would, in one pipeline"""
+    entries = []
+    for key, body, headers, tags in responses:
+        body, headers = finish_response(body, headers)
+        entries.append((key, response_entry(body, headers, ex), tags))
+    await set_many_raw(entries, ex=ex + stale_ttl, since=since)
+
+def response_entry(body: bytes, headers=None, ex=CACHE_TTL) -> bytes:
+    """What is stored for a cached response: a metadata line, then the body"""
+    meta = {"headers": headers or {}, "fresh_until": time.time() + ex}
+    return encode(meta) + b"\n" + body
+
+def finish_response(body: bytes, headers):
+    """Add the ETag and, for large bodies, gzip for the cache (see compression.compress_for_cache())"""
+    headers = {**headers, "ETag": etag_for(body)}
+    return compress_for_cache(body, headers)
+
+async def invalidate_tags(*tags):
+    """Drop every cached key that depends on any of `tags`, in every worker.
+
+    The tag sets are read and their keys deleted in one atomic script, so a
+    page cached while the write is in flight can't slip through untracked.
+    """
     if r is None:
-        print("⚠️ Redis not available, skipping cache")
+        logger.debug("Redis not available, skipping cache")
         return
-    
+
     try:
-        await r.set(key, json.dumps(value), ex=ex)
-        print(f"✅ Cached data for key: {key}")
+        with redis_timer("invalidate_tags"):
+            dropped = await r.eval(
+                INVALIDATE_TAGS_SCRIPT, 1 + 2 * len(tags), GENERATION_KEY, *tagged_keys(tags), TAG_GENERATION_TTL
+            )
+        keys = [key.decode() if isinstance(key, bytes) else key for key in dropped]
+        if keys:
+            local_cache.delete(*keys)
+            await r.publish(INVALIDATION_CHANNEL, encode(keys))
+        logger.debug("Invalidated %d cached keys", len(keys), extra={"tags": tags})
     except (ConnectionError, RedisError) as e:
-        print(f"⚠️ Redis error in set_cache: {e}")
-    except Exception as e:
-        print(f"⚠️ Unexpected error in set_cache: {e}")
+        logger.warning("Redis error in invalidate_tags: %s", e, extra={"tags": tags})
+    except Exception:
+        logger.exception("Unexpected error in invalidate_tags", extra={"tags": tags})
 
-async def test_redis_connection():
-    """Test Redis connection"""
+async def cache_generation():
+    """Invalidations so far, read before computing a page (see GENERATION_KEY); None without Redis"""
     if r is None:
-        return False
-    
+        return None
     try:
-        await r.ping()
-        print("✅ Redis connection test successful")
-        return True
-    except Exception as e:
-        print(f"❌ Redis connection test failed: {e}")
-        return False
+        with redis_timer("generation"):
+            return int(await r.get(GENERATION_KEY) or 0)
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in cache_generation: %s", e)
+        return None
+
+# --- STAMPEDE PROTECTION ---
+
+# Computations and background refreshes in flight in this worker, by key,
+# and the cache_generation() each computation started from
+inflight = {}
+inflight_generations = {}
+
+
+def forget_flight(key, task):
+    if inflight.get(key) is task:
+        del inflight[key]
+        inflight_generations.pop(key, None)
+
+
+async def single_flight(key, fn, generation=None):
+    """Run fn() once per key at a time in this worker; concurrent callers share the result.
+
+    A caller that saw a later `generation` than the running call started
+    from (a write happened in between) runs its own call instead.
+    """
+    task = inflight.get(key)
+    started = inflight_generations.get(key)
+    if task is None or (generation is not None and started is not None and generation > started):
+        task = asyncio.ensure_future(fn())
+        inflight[key] = task
+        inflight_generations[key] = generation
+        task.add_done_callback(lambda done: forget_flight(key, done))
+    else:
+        stats["coalesced"] += 1
+    # A caller going away must not cancel the computation the others wait on
+    return await asyncio.shield(task)
+
+async def acquire_lock(key, timeout=CACHE_LOCK_TIMEOUT):
+    """Try once to take the cross-worker lock for key; returns the token or None"""
+    if r is None:
+        return None
+    token = os.urandom(8).hex()
+    try:
+        with redis_timer("acquire_lock"):
+            acquired = await r.set(f"lock:{key}", token, nx=True, px=int(timeout * 1000))
+        if acquired:
+            return token
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in acquire_lock: %s", e, extra={"key": key})
+    return None
+
+async def release_lock(key, token):
+    try:
+        with redis_timer("release_lock"):
+            await r.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in release_lock: %s", e, extra={"key": key})
+
+@contextlib.asynccontextmanager
+async def fill_session(db):
+    """The session to compute a cache entry on: db, or a primary session if db reads from a replica.
+
+    A replica lagging behind a write still returns the old rows after the
+    write's invalidation, and the generation check can't tell, so the old
+    page would be cached for every client; entries are built from the primary.
+    """
+    if r is None or db is None or not db.info.get("replica"):
+        yield db
+        return
+    async with database.AsyncSessionLocal() as primary:
+        yield primary
+
+async def compute_and_store(key, compute, db, ex, stale_ttl, since=None):
+    """Build the response with compute(db) and cache it, with its ETag, under its tags.
+
+    It is not cached if one of its tags is invalidated after generation
+    `since` (read here unless given), i.e. while it was being computed.
+    Large bodies are stored gzipped, see compression.compress_for_cache().
+    """
+    if since is None:
+        since = await cache_generation()
+    async with fill_session(db) as db:
+        body, headers, tags = await compute(db)
+    body, headers = finish_response(body, headers)
+    await set_cached_response(key, body, headers, ex=ex, tags=tags, stale_ttl=stale_ttl, since=since)
+    return body, headers
+
+async def compute_with_lock(key, compute, db, ex, stale_ttl, lock, since=None):
+    """Miss path: if locking, wait for the worker holding the lock instead of recomputing"""
+    if not lock or r is None:
+        return await compute_and_store(key, compute, db, ex, stale_ttl, since)
+
+    token = await acquire_lock(key)
+    deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+    while token is None and time.monotonic() < deadline:
+        await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+        cached = await get_cached_response(key)
+        if cached is not None:
+            stats["lock_waits"] += 1
+            return cached
+        token = await acquire_lock(key)
+
+    try:
+        return await compute_and_store(key, compute, db, ex, stale_ttl, since)
+    finally:
+        if token is not None:
+            await release_lock(key, token)
+
+async def refresh_in_background(key, compute, ex, stale_ttl, lock):
+    """Recompute a stale key on a fresh session after the response has gone out"""
+    token = None
+    if lock and r is not None:
+        token = await acquire_lock(key)
+        if token is None:
+            return  # another worker is already refreshing it
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await compute_and_store(key, compute, db, ex, stale_ttl)
+        stats["refreshes"] += 1
+    except Exception:
+        logger.exception("Background refresh failed", extra={"key": key})
+    finally:
+        if token is not None:
+            await release_lock(key, token)
+
+def schedule_refresh(key, compute, ex, stale_ttl, lock):
+    """Start a background refresh of key unless one is already running"""
+    refresh_key = f"refresh:{key}"
+    if refresh_key in inflight:
+        return
+    task = asyncio.ensure_future(refresh_in_background(key, compute, ex, stale_ttl, lock))
+    inflight[refresh_key] = task
+    task.add_done_callback(lambda _: inflight.pop(refresh_key, None))
+
+async def cached_response(key, compute, db, ex=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, lock=None):
+    """Serve (body, headers) for key from the cache, computing it at most once at a time.
+
+    `compute(db)` must return (body, headers, tags). Concurrent misses in a
+    worker share one computation; with `lock` (CACHE_LOCK_ENABLED by default)
+    other workers wait for the one holding the Redis lock. Once an entry is
+    past its fresh TTL it keeps being served while a single background task
+    refreshes it. Entries are always computed on the primary (see fill_session()).
+    """
+    lock = CACHE_LOCK_ENABLED if lock is None else lock
+    data, since = await lookup(key)
+    entry = parse_entry(key, data)
+    if entry is not None:
+        body, headers, fresh_until = entry
+        if fresh_until <= time.time():
+            stats["stale_served"] += 1
+            schedule_refresh(key, compute, ex, stale_ttl, lock)
+        logger.debug("Returning cached response", extra={"key": key})
+        return body, headers
+
+    # Misses after a write don't join a computation that started before it
+    return await single_flight(key, lambda: compute_with_lock(key, compute, db, ex, stale_ttl, lock, since), since)
+
+async def cached_entities(ids, key_for, fetch, db, ex=CACHE_TTL):
+    """Encoded entities for ids as {id: bytes}, for batch reads.
+
+    Hits come from one get_many_raw() lookup; the misses are loaded with a
+    single `fetch(db, missing_ids)` call, which must return {id: (bytes, tags)}
+    and may leave out ids that don't exist, and are written back with one
+    set_many_raw(). Like cached_response(), misses are loaded from the primary.
+    """
+    keys = [key_for(entity_id) for entity_id in ids]
+    cached, since = await lookup_many(keys)
+
+    found = {entity_id: data for entity_id, data in zip(ids, cached) if data is not None}
+    missing = [entity_id for entity_id in ids if entity_id not in found]
+    if missing:
+        if since is None:
+            since = await cache_generation()
+        async with fill_session(db) as fill_db:
+            fetched = await fetch(fill_db, missing)
+        entries = [(key_for(entity_id), data, tags) for entity_id, (data, tags) in fetched.items()]
+        await set_many_raw(entries, ex=ex, since=since)
+        found.update((entity_id, data) for entity_id, (data, _) in fetched.items())
+    logger.debug("Resolved batch", extra={"requested": len(ids), "fetched": len(missing)})
+    return found
+
+async def warm_local_cache(keys=None):
+    """Fill the local tier with the given (default WARM_CACHE_KEYS) entries from Redis; returns how many were found"""
+    keys = WARM_CACHE_KEYS if keys is None else keys
+    if r is None or not keys:
+        return 0
+    return sum(data is not None for data in await get_many_raw(keys))
+
+async def listen_for_invalidations(client=None, local=None, subscribed=None):
+    """Drop keys from the local tier whenever any worker publishes an invalidation.
+
+    Runs until cancelled; the local tier is flushed on every (re)subscribe
+    since messages may have been missed while disconnected. `subscribed`
+    (an asyncio.Event) is set once the first subscription is in place.
+    """
+    client = r if client is None else client
+    local = local_cache if local is None else local
+    if client is None:
+        return
+
+    while True:
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            local.clear()
+            if subscribed is not None:
+                subscribed.set()
+            logger.info("Subscribed to %s", INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    local.delete(*orjson.loads(message["data"]))
+        except (ConnectionError, RedisError) as e:
+            logger.warning("Redis error in invalidation listener: %s", e)
+            local.clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
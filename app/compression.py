@@ -0,0 +1,121 @@
+import gzip
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+
+try:
+    import brotli
+except ImportError:  # optional; without it responses are only gzipped
+    brotli = None
+
+# Bodies smaller than this go out as-is; compressing them saves less than it costs
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def encoding_weights(accept_encoding: str) -> dict:
+    """{coding: q} from an Accept-Encoding header; an unreadable q counts as 0"""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        params = params.strip()
+        q = 1.0
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding.strip():
+            weights[coding.strip()] = q
+    return weights
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Content codings from an Accept-Encoding header, minus those with q=0"""
+    return {coding for coding, q in encoding_weights(accept_encoding).items() if q > 0}
+
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    """Whether the client takes `coding`: named, or covered by "*" without being refused (q=0)"""
+    weights = encoding_weights(accept_encoding)
+    return weights.get(coding, weights.get("*", 0)) > 0
+
+
+def preferred_encoding(accept_encoding: str):
+    """Best coding the client accepts: "br", then "gzip", else None"""
+    if brotli is not None and accepts_encoding(accept_encoding, "br"):
+        return "br"
+    if accepts_encoding(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+
+def compress_for_cache(body: bytes, headers: dict):
+    """Gzip a response body once, before it is cached, if it is worth compressing.
+
+    The stored headers say Content-Encoding: gzip, so the middleware leaves
+    such responses alone and cache hits cost no compression at all.
+    """
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body, headers
+    return gzip.compress(body, GZIP_LEVEL, mtime=0), {**headers, "Content-Encoding": "gzip"}
+
+
+def decode_for_client(accept_encoding: str, body: bytes, headers: dict):
+    """The representation of a cached body to send to a client, as (body, headers).
+
+    Gzipped entries are unpacked for the rare client that can't take gzip;
+    the ETag of the gzipped variant is kept distinct from the plain one.
+    """
+    if headers.get("Content-Encoding") != "gzip":
+        return body, headers
+    if accepts_encoding(accept_encoding, "gzip"):
+        headers = dict(headers)
+        etag = headers.get("ETag")
+        if etag:
+            headers["ETag"] = etag[:-1] + '-gzip"'
+        return body, headers
+    headers = {name: value for name, value in headers.items() if name != "Content-Encoding"}
+    return gzip.decompress(body), headers
+
+
+# IdentityResponder and its apply_compression() hook are starlette internals;
+# requirements.txt pins starlette to the versions this was checked against
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            return self.compressor.process(body) + self.compressor.flush()
+        return self.compressor.process(body) + self.compressor.finish()
+
+
+class CompressionMiddleware:
+    """Brotli or gzip for responses of at least minimum_size bytes.
+
+    Responses that already carry a Content-Encoding (gzipped cache entries,
+    exports) are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = preferred_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding == "br":
+            responder = BrotliResponder(self.app, self.minimum_size)
+        elif encoding == "gzip":
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=GZIP_LEVEL)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -1,34 +1,267 @@
-from sqlalchemy.orm import Session
+from typing import Optional
+from sqlalchemy import and_, bindparam, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, contains_eager, selectinload
 from app import models, schemas
 
 
 # --- BOOK CRUD ---
 
-def get_books(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Book).offset(skip).limit(limit).all()
+BOOK_COLUMNS = ("id", "title", "author", "review_count", "average_rating")
 
+# Reviews embedded in each book read by id (GET /books/{id}, ?ids=); the
+# rest are paged through GET /reviews/{book_id}
+BOOK_REVIEWS_LIMIT = 50
 
-def get_book(db: Session, book_id: int):
-    return db.query(models.Book).filter(models.Book.id == book_id).first()
 
+def paginate_books(stmt, skip: int, limit: int, after_id: Optional[int]):
+    """Order by primary key and seek past after_id (keyset) or fall back to OFFSET"""
+    stmt = stmt.order_by(models.Book.id)
+    if after_id is not None:
+        stmt = stmt.filter(models.Book.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    return stmt.limit(limit)
 
-def create_book(db: Session, book: schemas.BookCreate):
-    db_book = models.Book(**book.dict())
+
+async def get_books(db: AsyncSession, skip: int = 0, limit: int = 10, after_id: Optional[int] = None):
+    # Reviews must be loaded up front: lazy loads can't run under AsyncSession.
+    # selectinload fetches the reviews for the whole page in one IN (...) query.
+    stmt = select(models.Book).options(selectinload(models.Book.reviews))
+    result = await db.execute(paginate_books(stmt, skip, limit, after_id))
+    return result.scalars().all()
+
+
+async def get_book_columns(db: AsyncSession, columns, skip: int = 0, limit: int = 10, after_id: Optional[int] = None):
+    """Fetch only the given Book columns as dicts, without touching reviews"""
+    stmt = select(*(getattr(models.Book, column) for column in columns))
+    result = await db.execute(paginate_books(stmt, skip, limit, after_id))
+    return [dict(row._mapping) for row in result]
+
+
+async def get_book(db: AsyncSession, book_id: int):
+    stmt = (
+        select(models.Book)
+        .options(selectinload(models.Book.reviews))
+        .filter(models.Book.id == book_id)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+
+async def get_books_by_ids(db: AsyncSession, book_ids, reviews_limit: Optional[int] = None):
+    """Books with the given ids (unknown ids are skipped), each with its first
+    `reviews_limit` (default BOOK_REVIEWS_LIMIT) reviews by id; review_count
+    tells whether there are more.
+
+    A single round trip: one LEFT JOIN, filtered with books.id IN (...), to
+    the reviews numbered per book as in get_first_reviews_by_books().
+    """
+    reviews_limit = BOOK_REVIEWS_LIMIT if reviews_limit is None else reviews_limit
+    Book, Review = models.Book, models.Review
+    numbered = (
+        select(Review, func.row_number().over(partition_by=Review.book_id, order_by=Review.id).label("position"))
+        .filter(Review.book_id.in_(book_ids))
+        .subquery()
+    )
+    first_reviews = aliased(Review, numbered)
+    stmt = (
+        select(Book)
+        .outerjoin(first_reviews, and_(first_reviews.book_id == Book.id, numbered.c.position <= reviews_limit))
+        .options(contains_eager(Book.reviews.of_type(first_reviews)))
+        .filter(Book.id.in_(book_ids))
+        .order_by(Book.id, numbered.c.id)
+    )
+    result = await db.execute(stmt)
+    return result.unique().scalars().all()
+
+
+async def get_top_rated_books(db: AsyncSession, limit: int = 10, min_reviews: int = 1):
+    """Best average rating first, read straight off the ix_books_average_rating index"""
+    stmt = (
+        select(models.Book)
+        .filter(models.Book.review_count >= min_reviews)
+        .order_by(
+            models.Book.average_rating.desc(),
+            models.Book.review_count.desc(),
+            models.Book.id.desc()
+        )
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def insert_many(conn, table, rows):
+    """executemany INSERT ... RETURNING id, with ids in the same order as rows.
+
+    SQLAlchemy batches this into multi-row INSERTs where the dialect can
+    keep RETURNING in parameter order (Postgres) and falls back to one
+    statement per row, still in the same transaction, where it can't (SQLite).
+    """
+    if not rows:
+        return []
+    stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    result = await conn.execute(stmt, rows)
+    return result.scalars().all()
+
+
+async def bulk_create_books(db: AsyncSession, books):
+    """Insert a chunk of schemas.BookCreate with one executemany, returning the new ids"""
+    conn = await db.connection()
+    return await insert_many(conn, models.Book.__table__, [book.model_dump() for book in books])
+
+
+async def stream_partitions(db: AsyncSession, stmt, batch_size: int):
+    """Yield lists of row dicts from a server-side cursor, batch_size rows at a time"""
+    result = await db.stream(stmt.execution_options(yield_per=batch_size))
+    async for partition in result.mappings().partitions():
+        yield partition
+
+
+async def stream_books(db: AsyncSession, batch_size: int = 1000):
+    """Every book's columns in id order, streamed without loading the table into memory"""
+    stmt = select(*(getattr(models.Book, column) for column in BOOK_COLUMNS)).order_by(models.Book.id)
+    async for partition in stream_partitions(db, stmt, batch_size):
+        yield partition
+
+
+async def create_book(db: AsyncSession, book: schemas.BookCreate):
+    db_book = models.Book(**book.model_dump())
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    await db.commit()
+    await db.refresh(db_book, attribute_names=["reviews"])
     return db_book
 
 
 # --- REVIEW CRUD ---
 
-def create_review(db: Session, review: schemas.ReviewCreate, book_id: int):
-    db_review = models.Review(**review.dict(), book_id=book_id)
+def build_add_ratings():
+    """Core UPDATE folding a batch of new ratings into one book's aggregates.
+
+    Increments are done in SQL so concurrent reviews never lose an update.
+    Takes the parameters made by rating_deltas and can run as executemany.
+    """
+    books = models.Book.__table__
+    count, total = bindparam("new_count"), bindparam("new_total")
+    values = {
+        "review_count": books.c.review_count + count,
+        "rating_sum": books.c.rating_sum + total,
+        "average_rating": (books.c.rating_sum + total) * 1.0 / (books.c.review_count + count),
+    }
+    for rating in models.RATINGS:
+        column = books.c[f"rating_{rating}_count"]
+        values[column.name] = column + bindparam(f"new_{rating}_count")
+    return update(books).where(books.c.id == bindparam("book_id_")).values(values)
+
+
+ADD_RATINGS = build_add_ratings()
+
+
+def rating_deltas(book_id: int, ratings) -> dict:
+    """ADD_RATINGS parameters for adding `ratings` to one book"""
+    params = {"book_id_": book_id, "new_count": len(ratings), "new_total": sum(ratings)}
+    for rating in models.RATINGS:
+        params[f"new_{rating}_count"] = sum(1 for r in ratings if r == rating)
+    return params
+
+
+async def create_review(db: AsyncSession, review: schemas.ReviewCreate, book_id: int):
+    db_review = models.Review(**review.model_dump(), book_id=book_id)
     db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
+    # Same transaction as the insert, so the aggregates never drift
+    conn = await db.connection()
+    await conn.execute(ADD_RATINGS, rating_deltas(book_id, [review.rating]))
+    await db.commit()
+    await db.refresh(db_review)
     return db_review
 
 
-def get_reviews_by_book(db: Session, book_id: int):
-    return db.query(models.Review).filter(models.Review.book_id == book_id).all()
+async def bulk_create_reviews(db: AsyncSession, reviews):
+    """Insert a chunk of schemas.ReviewBulkItem, returning the new id or an error per row.
+
+    Rows for unknown books are rejected up front; the rest go in with one
+    executemany INSERT and one aggregate UPDATE per book.
+    """
+    conn = await db.connection()
+    book_ids = {review.book_id for review in reviews}
+    existing = set((await conn.execute(
+        select(models.Book.id).filter(models.Book.id.in_(book_ids))
+    )).scalars())
+
+    valid = [review for review in reviews if review.book_id in existing]
+    new_ids = iter(await insert_many(conn, models.Review.__table__, [review.model_dump() for review in valid]))
+
+    ratings_by_book = {}
+    for review in valid:
+        ratings_by_book.setdefault(review.book_id, []).append(review.rating)
+    if ratings_by_book:
+        await conn.execute(ADD_RATINGS, [rating_deltas(book_id, ratings) for book_id, ratings in ratings_by_book.items()])
+
+    return [
+        next(new_ids) if review.book_id in existing else f"Book {review.book_id} not found"
+        for review in reviews
+    ]
+
+
+async def stream_reviews(db: AsyncSession, batch_size: int = 1000):
+    """Every review in id order, streamed without loading the table into memory"""
+    Review = models.Review
+    stmt = select(Review.id, Review.book_id, Review.content, Review.rating).order_by(Review.id)
+    async for partition in stream_partitions(db, stmt, batch_size):
+        yield partition
+
+
+# Sort orders for a book's reviews and the keyset columns each one pages on
+REVIEW_SORT_KEYS = {
+    "id": ("id",),
+    "rating": ("rating", "id"),
+    "-rating": ("rating", "id"),
+}
+
+
+async def get_reviews_by_book(
+    db: AsyncSession,
+    book_id: int,
+    limit: int = 50,
+    sort: str = "id",
+    after: Optional[dict] = None
+):
+    """Page through a book's reviews, seeking past the `after` keyset position"""
+    Review = models.Review
+    stmt = select(Review).filter(Review.book_id == book_id)
+    if sort == "id":
+        if after is not None:
+            stmt = stmt.filter(Review.id > after["id"])
+        stmt = stmt.order_by(Review.id)
+    elif sort == "rating":
+        if after is not None:
+            stmt = stmt.filter(tuple_(Review.rating, Review.id) > tuple_(after["rating"], after["id"]))
+        stmt = stmt.order_by(Review.rating, Review.id)
+    elif sort == "-rating":
+        if after is not None:
+            stmt = stmt.filter(tuple_(Review.rating, Review.id) < tuple_(after["rating"], after["id"]))
+        stmt = stmt.order_by(Review.rating.desc(), Review.id.desc())
+    else:
+        raise ValueError(f"Unknown review sort: {sort}")
+    result = await db.execute(stmt.limit(limit))
+    return result.scalars().all()
+
+
+async def get_first_reviews_by_books(db: AsyncSession, book_ids, limit: int = 50):
+    """The first `limit` reviews (by id) of each book, in one query, grouped as {book_id: [reviews]}.
+
+    Every requested book gets an entry, empty if it has no reviews.
+    """
+    Review = models.Review
+    numbered = (
+        select(Review, func.row_number().over(partition_by=Review.book_id, order_by=Review.id).label("position"))
+        .filter(Review.book_id.in_(book_ids))
+        .subquery()
+    )
+    ranked = aliased(Review, numbered)
+    stmt = select(ranked).filter(numbered.c.position <= limit).order_by(numbered.c.book_id, numbered.c.id)
+    grouped = {book_id: [] for book_id in book_ids}
+    for review in (await db.execute(stmt)).scalars():
+        grouped[review.book_id].append(review)
+    return grouped
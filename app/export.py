@@ -0,0 +1,46 @@
+import os
+import zlib
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app import database
+from app.compression import accepts_encoding
+
+# Rows fetched from the server-side cursor per round trip
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+async def ndjson_chunks(stream_rows, compress: bool):
+    """Encode partitions from stream_rows(db, batch_size) as NDJSON, optionally gzipped.
+
+    The export runs on its own (replica, if configured) session because it
+    outlives the request handler. Rows are pulled from the cursor only as fast as the response is
+    sent, so a slow client slows the export instead of piling up memory.
+    """
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    async with database.read_sessionmaker()() as db:
+        async for partition in stream_rows(db, EXPORT_BATCH_SIZE):
+            chunk = b"".join(orjson.dumps(dict(row)) + b"\n" for row in partition)
+            if gzip is not None:
+                chunk = gzip.compress(chunk)
+            if chunk:
+                yield chunk
+    if gzip is not None:
+        yield gzip.flush()
+
+
+def export_response(request: Request, stream_rows, filename: str):
+    """StreamingResponse exporting every row as NDJSON, gzipped if that is the coding the
+    client prefers (others are left to CompressionMiddleware)"""
+    compress = accepts_encoding(request.headers.get("accept-encoding", ""), "gzip")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(
+        ndjson_chunks(stream_rows, compress),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
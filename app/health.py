@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from app import cache, database
+
+logger = logging.getLogger(__name__)
+
+# Dependencies are probed in the background every HEALTH_CHECK_INTERVAL
+# seconds; each probe gives up after HEALTH_CHECK_TIMEOUT. Health endpoints
+# only read the last result, so a wedged database can't stall them.
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Not ready once this share of the connection pool is checked out, so the
+# orchestrator routes traffic elsewhere before requests start getting 503s
+HEALTH_POOL_SATURATION = float(os.getenv("HEALTH_POOL_SATURATION", "0.9"))
+# Replicas further behind than this are reported as lagging
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))
+
+# Seconds since the replica last replayed a transaction, 0 when it is caught up
+REPLICA_LAG_SQL = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+""")
+
+# Last probe result, see probe()
+latest = None
+
+
+async def timed(check):
+    """Run a probe coroutine under HEALTH_CHECK_TIMEOUT, as a status dict"""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(check, HEALTH_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {"status": "error", "error": f"timed out after {HEALTH_CHECK_TIMEOUT}s"}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+    return {"status": "ok", "latency_ms": round((time.perf_counter() - start) * 1000, 2), **(result or {})}
+
+
+async def check_database(engine):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def check_replica(engine):
+    async with engine.connect() as conn:
+        if engine.dialect.name != "postgresql":
+            await conn.execute(text("SELECT 1"))
+            return {"lag_seconds": None}
+        lag = float(await conn.scalar(REPLICA_LAG_SQL) or 0)
+    return {"lag_seconds": round(lag, 3)}
+
+
+async def check_redis():
+    if not await cache.r.ping():
+        raise ConnectionError("PING failed")
+
+
+def pool_usage(engine, max_overflow=None) -> dict:
+    """Checked-out connections against what the pool can hand out (in memory, no I/O).
+
+    Capacity is pool.size() plus max_overflow, the configured DB_MAX_OVERFLOW
+    unless given; `overflow` is how many connections are open beyond pool.size().
+    """
+    pool = getattr(engine, "sync_engine", engine).pool
+    max_overflow = database.DB_MAX_OVERFLOW if max_overflow is None else max_overflow
+    # Only QueuePool is sized; NullPool and StaticPool report no saturation
+    if not all(hasattr(pool, method) for method in ("checkedout", "size", "overflow")):
+        return {"in_use": None, "overflow": None, "capacity": None, "saturation": None}
+    in_use = pool.checkedout()
+    overflow = max(0, pool.overflow())
+    if max_overflow < 0:
+        return {"in_use": in_use, "overflow": overflow, "capacity": None, "saturation": None}
+    capacity = pool.size() + max_overflow
+    return {"in_use": in_use, "overflow": overflow, "capacity": capacity, "saturation": round(in_use / capacity, 3)}
+
+
+async def probe(engine=None, replicas=None):
+    """Probe the primary, the replicas and Redis concurrently and store the result"""
+    engine = database.async_engine if engine is None else engine
+    replicas = database.replica_engines if replicas is None else replicas
+    checks = [timed(check_database(engine)), *(timed(check_replica(replica)) for replica in replicas)]
+    if cache.r is not None:
+        checks.append(timed(check_redis()))
+    results = await asyncio.gather(*checks)
+
+    report = {
+        "checked_at": time.time(),
+        "database": results[0],
+        "replicas": [
+            {"url": replica.url.render_as_string(hide_password=True), **result}
+            for replica, result in zip(replicas, results[1:1 + len(replicas)])
+        ],
+        "redis": results[-1] if cache.r is not None else {"status": "disabled"},
+    }
+    checked = [("database", report["database"]), ("redis", report["redis"])]
+    checked.extend((replica["url"], replica) for replica in report["replicas"])
+    for name, result in checked:
+        if result["status"] == "error":
+            logger.warning("Health check failed for %s: %s", name, result["error"])
+
+    global latest
+    latest = report
+    return report
+
+
+async def monitor(interval=HEALTH_CHECK_INTERVAL):
+    """Re-probe every `interval` seconds until cancelled (the first probe runs at startup)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await probe()
+        except Exception:
+            logger.exception("Health probe failed")
+
+
+def readiness(report=None, engine=None, now=None):
+    """(ready, body) from the last probe plus the pool's current saturation.
+
+    Not ready: no probe yet, the last one is too old (the monitor is stuck),
+    the primary failed it, or the pool is nearly exhausted. Redis being down
+    or a lagging replica only degrade the service.
+    """
+    report = latest if report is None else report
+    engine = database.async_engine if engine is None else engine
+    now = time.time() if now is None else now
+    if report is None:
+        return False, {"status": "not_ready", "reasons": ["no health check has completed yet"]}
+
+    pool = pool_usage(engine)
+    reasons, warnings = [], []
+    age = now - report["checked_at"]
+    if age > 3 * HEALTH_CHECK_INTERVAL + HEALTH_CHECK_TIMEOUT:
+        reasons.append(f"last health check is {age:.0f}s old")
+    if report["database"]["status"] != "ok":
+        reasons.append("database unavailable")
+    if pool["saturation"] is not None and pool["saturation"] >= HEALTH_POOL_SATURATION:
+        reasons.append(f"connection pool {pool['saturation']:.0%} in use")
+    if report["redis"]["status"] == "error":
+        warnings.append("redis unavailable")
+    for replica in report["replicas"]:
+        if replica["status"] != "ok":
+            warnings.append(f"replica {replica['url']} unavailable")
+        elif replica["lag_seconds"] is not None and replica["lag_seconds"] > DB_REPLICA_MAX_LAG:
+            warnings.append(f"replica {replica['url']} is {replica['lag_seconds']:.0f}s behind")
+
+    ready = not reasons
+    status = "not_ready" if reasons else "degraded" if warnings else "ready"
+    return ready, {
+        "status": status,
+        "reasons": reasons,
+        "warnings": warnings,
+        "age_seconds": round(age, 3),
+        "pool": pool,
+        **report,
+    }
@@ -0,0 +1,45 @@
+import os
+
+from fastapi import Request, Response
+
+from app import database
+from app.cache import etag_for
+from app.compression import decode_for_client
+
+# Shared caches (a CDN in front of the API) may serve a page for
+# HTTP_CACHE_S_MAXAGE seconds, then keep serving it for
+# HTTP_CACHE_STALE_SECONDS while they revalidate with If-None-Match.
+# Browsers always revalidate, which costs a 304 and no database work.
+HTTP_CACHE_S_MAXAGE = int(os.getenv("HTTP_CACHE_S_MAXAGE", "5"))
+HTTP_CACHE_STALE_SECONDS = int(os.getenv("HTTP_CACHE_STALE_SECONDS", "30"))
+
+CACHE_CONTROL = f"public, max-age=0, s-maxage={HTTP_CACHE_S_MAXAGE}, stale-while-revalidate={HTTP_CACHE_STALE_SECONDS}"
+# Reads that must see the client's own recent write are never stored by a
+# shared cache (the CDN must also bypass its cache on the sticky cookie)
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match comparison: weak, against any of a comma separated list, or *"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def json_response(request: Request, body: bytes, headers: dict) -> Response:
+    """Response for a cached JSON body, or an empty 304 if the client's copy is current"""
+    body, headers = decode_for_client(request.headers.get("accept-encoding", ""), body, headers)
+    headers = dict(headers)
+    headers["Vary"] = "Accept-Encoding"
+    headers["Cache-Control"] = PRIVATE_CACHE_CONTROL if database.sticky_to_primary(request) else CACHE_CONTROL
+    etag = headers.get("ETag")
+    if_none_match = request.headers.get("if-none-match")
+    if etag and if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def entities_response(request: Request, parts) -> Response:
+    """json_response for a JSON array assembled from already-encoded items (batch reads)"""
+    body = b"[" + b",".join(parts) + b"]"
+    return json_response(request, body, {"ETag": etag_for(body)})
@@ -1,18 +1,122 @@
-from fastapi import FastAPI, HTTPException
-from sqlalchemy import text
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from app import cache, database, health, review_queue, warmer
 from app.routers import books, reviews
-from app.database import engine
-from app.cache import test_redis_connection
+from app.database import ReadYourWritesMiddleware
+from app.compression import CompressionMiddleware
+from app.logging_config import configure_logging
+from app.metrics import CONTENT_TYPE, POOL_TIMEOUTS, MetricsMiddleware, render_metrics
+from app.profiling import ProfilingMiddleware
+from app.ratelimit import RateLimitMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Seconds clients are told to wait when no database connection is free
+DB_RETRY_AFTER = os.getenv("DB_RETRY_AFTER", "1")
+# Warming the pool and the local cache tier at startup gives up after this
+# many seconds; the worker then starts cold rather than not at all
+STARTUP_WARM_TIMEOUT = float(os.getenv("STARTUP_WARM_TIMEOUT", "5"))
+
+async def warm_pool():
+    try:
+        await asyncio.wait_for(database.warm_pool(), STARTUP_WARM_TIMEOUT)
+    except Exception as e:
+        logger.warning("Could not warm the connection pool: %s", e)
+
+async def warm_local_cache(subscribed: asyncio.Event):
+    try:
+        # The listener flushes the local tier when it subscribes
+        await asyncio.wait_for(subscribed.wait(), STARTUP_WARM_TIMEOUT)
+        return await asyncio.wait_for(cache.warm_local_cache(), STARTUP_WARM_TIMEOUT)
+    except Exception as e:
+        logger.warning("Could not warm the local cache: %s", e)
+        return 0
+
+async def warm_up(report: dict, subscribed: asyncio.Event):
+    """Open pooled connections and copy hot keys into the local tier, skipping
+    whatever the startup probe found down; returns the number of keys warmed"""
+    pool = asyncio.create_task(warm_pool()) if report["database"]["status"] == "ok" else None
+    warmed = await warm_local_cache(subscribed) if report["redis"]["status"] == "ok" else 0
+    if pool is not None:
+        await pool
+    return warmed
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker resources: created here, after any fork, and released on shutdown"""
+    start = time.perf_counter()
+    # Log records are written by a background thread; see app/logging_config.py
+    configure_logging()
+    database.init_engines()
+    cache.init_redis()
+    # Keep this worker's local cache tier coherent with the other workers
+    subscribed = asyncio.Event()
+    cache_listener = asyncio.create_task(cache.listen_for_invalidations(subscribed=subscribed))
+    # Know whether we're ready before taking traffic, then keep checking
+    report = await health.probe()
+    warmed_keys = await warm_up(report, subscribed)
+    health_monitor = asyncio.create_task(health.monitor())
+    # Batch writer for reviews accepted with 202
+    review_writer = asyncio.create_task(review_queue.run_worker()) if review_queue.REVIEW_WRITE_BEHIND else None
+    # Recompute the most requested pages before they expire
+    cache_warmer = asyncio.create_task(warmer.run_warmer()) if warmer.CACHE_WARM_ENABLED else None
+    for route in app.routes:
+        logger.debug("Registered route %s %s", sorted(getattr(route, "methods", None) or ()), route.path)
+    logger.info("Worker started", extra={
+        "pid": os.getpid(),
+        "startup_ms": round((time.perf_counter() - start) * 1000, 1),
+        "warmed_keys": warmed_keys,
+    })
+    try:
+        yield
+    finally:
+        tasks = [task for task in (cache_warmer, review_writer, health_monitor, cache_listener) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if review_queue.local_queue is not None:
+            await review_queue.local_queue.close()
+        await cache.close_redis()
+        await database.dispose_engines()
+        logger.info("Worker stopped", extra={"pid": os.getpid()})
 
 app = FastAPI(
     title="Book Review API",
     description="A FastAPI backend for managing books and reviews with Redis caching",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Outermost last: metrics time the whole request, compression included
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+# Opt-in per-request profile, returned in Server-Timing (see app/profiling.py)
+app.add_middleware(ProfilingMiddleware)
+# Admission control: per-client rate limits and load shedding (see app/ratelimit.py)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(books.router)
 app.include_router(reviews.router)
 
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    """Shed load with a 503 once the pool has been exhausted for DB_POOL_TIMEOUT seconds"""
+    POOL_TIMEOUTS.inc()
+    logger.warning("Database pool exhausted", extra={"path": request.url.path})
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, retry shortly"},
+        headers={"Retry-After": DB_RETRY_AFTER}
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -24,52 +128,51 @@ async def root():
             "reviews": "/reviews/{book_id}",
             "docs": "/docs",
             "redoc": "/redoc",
-            "health": "/health"
+            "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "cache_stats": "/cache/stats",
+            "metrics": "/metrics"
         },
         "status": "running"
     }
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint to test database and Redis connections"""
-    health_status = {
-        "status": "healthy",
-        "database": "unknown",
-        "redis": "unknown",
-        "errors": []
+    """Database and Redis status from the last background health check"""
+    report = health.latest
+    if report is None:
+        return {"status": "unknown", "database": "unknown", "redis": "unknown", "errors": []}
+
+    states = {"ok": "connected", "error": "error"}
+    errors = [
+        f"{name.capitalize()}: {report[name]['error']}"
+        for name in ("database", "redis") if report[name]["status"] == "error"
+    ]
+    return {
+        "status": "healthy" if report["database"]["status"] == "ok" else "unhealthy",
+        "database": states[report["database"]["status"]],
+        "redis": states.get(report["redis"]["status"], report["redis"]["status"]),
+        "errors": errors
     }
-    
-    # Test database connection
-    try:
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT 1"))
-            result.fetchone()
-        health_status["database"] = "connected"
-        print("✅ Database connection successful")
-    except Exception as e:
-        health_status["database"] = "error"
-        health_status["errors"].append(f"Database: {str(e)}")
-        print(f"❌ Database connection failed: {e}")
-    
-    # Test Redis connection
-    try:
-        redis_ok = await test_redis_connection()
-        health_status["redis"] = "connected" if redis_ok else "error"
-        if not redis_ok:
-            health_status["errors"].append("Redis: Connection failed")
-    except Exception as e:
-        health_status["redis"] = "error"
-        health_status["errors"].append(f"Redis: {str(e)}")
-    
-    # Overall status
-    if health_status["database"] == "error":
-        health_status["status"] = "unhealthy"
-    
-    return health_status
-
-# Debug: Print all registered routes
-print("🔍 Registered routes:")
-for route in app.routes:
-    print(f"  {route.methods} {route.path}")
-
-print("✅ FastAPI app initialized successfully!")
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: answers as long as the event loop does; never touches dependencies"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness from the last background probe plus current pool saturation (503 when not ready)"""
+    ready, body = health.readiness()
+    return ORJSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    """Hit/miss counters for the local and Redis cache tiers of this worker"""
+    return cache.cache_stats()
+
+@app.get("/metrics")
+async def read_metrics():
+    """Prometheus metrics for this worker: route latency, DB and Redis timings, cache hit ratio"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
@@ -0,0 +1,263 @@
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import profiling
+
+# Per-worker metrics in the Prometheus text format, served at GET /metrics.
+# Updates are a dict lookup and a few additions, so they stay on the hot path.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labelnames, labels, extra=""):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, *labels, value):
+        self.values[labels] = value
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # One count per bucket plus +Inf, then sum and count
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+registry = []
+
+REQUEST_DURATION = HistogramMetric(
+    "http_request_duration_seconds", "Time to fully send the response, by route template",
+    ("method", "route")
+)
+REQUESTS = CounterMetric("http_requests_total", "Responses sent, by route template and status", ("method", "route", "status"))
+IN_FLIGHT = GaugeMetric("http_requests_in_flight", "Requests currently being handled", ("method",))
+QUERIES_PER_REQUEST = HistogramMetric(
+    "db_queries_per_request", "SQL statements executed while handling one request",
+    ("route",), buckets=COUNT_BUCKETS
+)
+POOL_CHECKOUT_WAIT = HistogramMetric(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=FAST_BUCKETS
+)
+POOL_TIMEOUTS = CounterMetric("db_pool_timeouts_total", "Requests answered with 503 because no database connection was free")
+POOL_WAITING = GaugeMetric("db_pool_waiting", "Requests currently waiting for a pooled database connection")
+RATE_LIMITED = CounterMetric("http_rate_limited_total", "Requests answered with 429 because the client was over its rate limit")
+REQUESTS_SHED = CounterMetric("http_requests_shed_total", "Low-priority requests answered with 503 while the worker was overloaded")
+REDIS_DURATION = HistogramMetric(
+    "redis_command_duration_seconds", "Redis round-trip time, by cache operation",
+    ("operation",), buckets=FAST_BUCKETS
+)
+CACHE_REQUESTS = CounterMetric("cache_requests_total", "Cache lookups, by key prefix, tier and result", ("prefix", "tier", "result"))
+CACHE_HIT_RATIO = GaugeMetric("cache_hit_ratio", "Share of lookups answered by either cache tier, by key prefix", ("prefix",))
+
+# Statements executed by the current request, see instrument_engine()
+query_count = contextvars.ContextVar("query_count", default=None)
+
+# Smoothed pool checkout wait and when it was last updated, see recent_pool_wait()
+POOL_WAIT_SMOOTHING = 0.2
+pool_wait = {"seconds": 0.0, "at": 0.0}
+
+
+def key_prefix(key: str) -> str:
+    """Metric label for a cache key: books_1_10 -> books"""
+    return key.split("_", 1)[0]
+
+
+def record_cache_lookup(key: str, tier: str, hit: bool):
+    CACHE_REQUESTS.inc(key_prefix(key), tier, "hit" if hit else "miss")
+
+
+@contextmanager
+def redis_timer(operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REDIS_DURATION.observe(elapsed, operation)
+        profiling.record_cache_call(elapsed)
+
+
+def record_pool_wait(elapsed: float):
+    POOL_CHECKOUT_WAIT.observe(elapsed)
+    pool_wait["seconds"] += POOL_WAIT_SMOOTHING * (elapsed - pool_wait["seconds"])
+    pool_wait["at"] = time.monotonic()
+
+
+def recent_pool_wait(window=1.0) -> float:
+    """Smoothed checkout wait in seconds, or 0 when nothing was checked out within `window` seconds"""
+    if time.monotonic() - pool_wait["at"] > window:
+        return 0.0
+    return pool_wait["seconds"]
+
+
+def instrument_engine(engine):
+    """Count statements per request and time pool checkouts on an (async) engine.
+
+    Statements are also timed for the request profiler and the slow-query log.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    profiling.instrument_engine(sync_engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = query_count.get()
+        if counter is not None:
+            counter[0] += 1
+
+    time_checkouts(sync_engine.pool)
+
+    @event.listens_for(sync_engine, "engine_disposed")
+    def time_new_pool(engine):
+        # dispose() replaces the pool with a fresh, untimed one
+        time_checkouts(engine.pool)
+
+
+def time_checkouts(pool):
+    """Count callers waiting on `pool` and time how long they wait for a connection.
+
+    The pool has no event for "started waiting", so its public connect(),
+    which the engine calls for every checkout, is wrapped on the instance.
+    """
+    if getattr(pool, "checkouts_timed", False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        POOL_WAITING.inc()
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_WAITING.dec()
+            record_pool_wait(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    pool.checkouts_timed = True
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        counter = [0]
+        token = query_count.set(counter)
+        IN_FLIGHT.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec(method)
+            query_count.reset(token)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            path = route.path if route is not None else "<unmatched>"
+            REQUEST_DURATION.observe(elapsed, method, path)
+            REQUESTS.inc(method, path, status[0])
+            QUERIES_PER_REQUEST.observe(counter[0], path)
+
+
+def update_cache_hit_ratio():
+    totals = {}
+    for (prefix, tier, result), count in CACHE_REQUESTS.values.items():
+        hits_and_lookups = totals.setdefault(prefix, [0, 0])
+        if result == "hit":
+            hits_and_lookups[0] += count
+        # Every lookup goes to the local tier first; a local miss then asks Redis
+        if tier == "local":
+            hits_and_lookups[1] += count
+    for prefix, (hits, lookups) in totals.items():
+        CACHE_HIT_RATIO.set(prefix, value=hits / lookups if lookups else 0.0)
+
+
+def render_metrics() -> str:
+    update_cache_hit_ratio()
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Index
+from sqlalchemy import Column, Float, Integer, String, Text, ForeignKey, Index, func, text
+from sqlalchemy.dialects import postgresql  # noqa: F401 - registers the tsvector functions
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# Valid review ratings; each one has a histogram column on Book
+RATINGS = range(1, 6)
+
+
 class Book(Base):
     __tablename__ = "books"
 
@@ -9,8 +14,27 @@ class Book(Base):
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
 
+    # Rating aggregates, kept up to date by crud.create_review
+    review_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    average_rating = Column(Float, nullable=True)
+    rating_1_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_2_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_3_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_4_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_5_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     reviews = relationship("Review", back_populates="book")
 
+    # Serves the top rated listing without a GROUP BY over reviews
+    __table_args__ = (
+        Index('ix_books_average_rating', "average_rating", "review_count", "id"),
+    )
+
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, f"rating_{rating}_count") or 0 for rating in RATINGS}
+
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -23,6 +47,26 @@ class Review(Base):
     book = relationship("Book", back_populates="reviews")
 
     # Create an index on book_id to optimize filtering
+    # and one on (book_id, rating, id) for keyset pages sorted by rating
     __table_args__ = (
         Index('ix_reviews_book_id', "book_id"),
+        Index('ix_reviews_book_id_rating_id', "book_id", "rating", "id"),
     )
+
+
+# --- Full-text search (Postgres) ---
+# The config and weights are inlined as SQL text, not bind parameters, so
+# queries render the exact expressions the GIN indexes below were built on.
+SEARCH_CONFIG = text("'english'")
+
+
+def search_vector(column, weight: str):
+    return func.setweight(func.to_tsvector(SEARCH_CONFIG, column), text(f"'{weight}'"))
+
+
+# Title matches outrank author matches
+BOOK_SEARCH_VECTOR = search_vector(Book.title, "A").op("||")(search_vector(Book.author, "B"))
+REVIEW_SEARCH_VECTOR = func.to_tsvector(SEARCH_CONFIG, Review.content)
+
+Index("ix_books_search", BOOK_SEARCH_VECTOR, postgresql_using="gin").ddl_if(dialect="postgresql")
+Index("ix_reviews_search", REVIEW_SEARCH_VECTOR, postgresql_using="gin").ddl_if(dialect="postgresql")
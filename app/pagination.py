@@ -0,0 +1,72 @@
+import base64
+import json
+import math
+
+# Response header carrying the cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Most ids one batch read (?ids=1,2,3) may ask for
+MAX_BATCH_IDS = 100
+
+# Largest `limit` a paginated endpoint accepts
+MAX_PAGE_SIZE = 500
+
+# Cursor integers must fit a signed 64-bit column (BIGINT, SQLite INTEGER)
+MIN_CURSOR_INT = -2**63
+MAX_CURSOR_INT = 2**63 - 1
+
+
+def encode_cursor(values: dict) -> str:
+    """Pack the keyset position of the last row into an opaque cursor string"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys, float_keys=()) -> dict:
+    """Unpack a cursor made by encode_cursor, raising ValueError if it is malformed.
+
+    Values must be integers in the signed 64-bit range, except for keys in
+    float_keys (e.g. a search rank), which may also be finite floats.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(values, dict) or set(values) != set(keys):
+        raise ValueError("Invalid cursor: unexpected keys")
+    for key in keys:
+        value = values[key]
+        if key in float_keys and isinstance(value, float):
+            if not math.isfinite(value):
+                raise ValueError(f"Invalid cursor: {key} must be a finite number")
+        elif isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"Invalid cursor: {key} must be {'a number' if key in float_keys else 'an integer'}")
+        elif not MIN_CURSOR_INT <= value <= MAX_CURSOR_INT:
+            raise ValueError(f"Invalid cursor: {key} is out of range")
+    return values
+
+
+def next_cursor(page, limit: int, keys):
+    """Cursor for the page after `page`, or None when this was the last page.
+
+    `page` may hold ORM objects or dicts; the cursor is built from the last row.
+    """
+    if not page or len(page) < limit:
+        return None
+    last = page[-1]
+    if isinstance(last, dict):
+        return encode_cursor({key: last[key] for key in keys})
+    return encode_cursor({key: getattr(last, key) for key in keys})
+
+
+def parse_ids(ids: str, name: str = "ids") -> list:
+    """Turn a comma separated id list into unique ints in request order, raising ValueError if invalid"""
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"{name} must be a comma-separated list of integers")
+    unique = list(dict.fromkeys(parsed))
+    if not unique or len(unique) > MAX_BATCH_IDS:
+        raise ValueError(f"{name} must list between 1 and {MAX_BATCH_IDS} ids")
+    return unique
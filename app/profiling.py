@@ -0,0 +1,203 @@
+import contextvars
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Requests sending PROFILE_TOKEN in PROFILE_HEADER are profiled and get a
+# Server-Timing header (never while PROFILE_TOKEN is unset); a
+# PROFILE_SAMPLE_RATE fraction of all requests is profiled into the log only
+PROFILE_HEADER = "X-Profile"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# A statement run this many times in one request is reported as a likely N+1
+PROFILE_DUPLICATE_THRESHOLD = int(os.getenv("PROFILE_DUPLICATE_THRESHOLD", "3"))
+# Statements slower than this are logged with their plan, profiled or not
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+# Plans are captured once per statement per worker within this many seconds
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+# Only plans of reads are captured: EXPLAIN never runs them, and a failing
+# EXPLAIN can't abort a transaction that was going to write
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+# Profile of the current request, None when it isn't being profiled
+current_profile = contextvars.ContextVar("current_profile", default=None)
+# Route of the current request, for the slow-query log
+current_path = contextvars.ContextVar("current_path", default=None)
+
+# statement -> when its plan was last captured
+explained = {}
+
+
+class RequestProfile:
+    """Where one request spent its time: SQL statements and Redis calls"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = Counter()
+        self.db_time = 0.0
+        self.cache_time = 0.0
+        self.cache_calls = 0
+
+    def add_statement(self, statement: str, elapsed: float):
+        self.statements[statement] += 1
+        self.db_time += elapsed
+
+    def add_cache_call(self, elapsed: float):
+        self.cache_calls += 1
+        self.cache_time += elapsed
+
+    def duplicates(self, threshold=None) -> list:
+        """(statement, count) for statements repeated often enough to look like N+1 loads"""
+        threshold = PROFILE_DUPLICATE_THRESHOLD if threshold is None else threshold
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "statements": sum(self.statements.values()),
+            "db_ms": round(self.db_time * 1000, 3),
+            "cache_calls": self.cache_calls,
+            "cache_ms": round(self.cache_time * 1000, 3),
+            "duplicates": [{"statement": statement, "count": count} for statement, count in self.duplicates()],
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: DB and Redis time with counts, total time and how
+        often N+1 suspects ran; the statements themselves only go to the log"""
+        summary = self.summary()
+        timings = [
+            f'db;dur={summary["db_ms"]};desc="{summary["statements"]} statements"',
+            f'cache;dur={summary["cache_ms"]};desc="{summary["cache_calls"]} calls"',
+            f'app;dur={summary["total_ms"]}',
+        ]
+        for duplicate in summary["duplicates"][:3]:
+            timings.append(f'n_plus_one;desc="repeated {duplicate["count"]}x"')
+        return ", ".join(timings)
+
+
+def record_cache_call(elapsed: float):
+    """Called by metrics.redis_timer for every Redis round trip"""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_cache_call(elapsed)
+
+
+def profile_requested(headers) -> bool:
+    """Whether the request carries PROFILE_TOKEN, and so gets a Server-Timing header"""
+    if not PROFILE_TOKEN:
+        return False
+    name = PROFILE_HEADER.lower().encode()
+    requested = next((value for key, value in headers if key == name), None)
+    return requested is not None and requested.decode("latin-1") == PROFILE_TOKEN
+
+
+def sampled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def explain(conn, statement, parameters):
+    """The plan lines for a statement that just ran, on the same connection"""
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name, "EXPLAIN ")
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def log_slow_query(conn, statement, parameters, executemany, elapsed):
+    plan = None
+    now = time.monotonic()
+    if (
+        SLOW_QUERY_EXPLAIN and not executemany and EXPLAINABLE.match(statement)
+        and now - explained.get(statement, float("-inf")) >= SLOW_QUERY_EXPLAIN_INTERVAL
+    ):
+        if len(explained) >= 1000:
+            explained.clear()
+        explained[statement] = now
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception as e:
+            logger.debug("Could not capture query plan: %s", e)
+    logger.warning("Slow query", extra={
+        "duration_ms": round(elapsed * 1000, 3),
+        "statement": statement,
+        "plan": plan,
+        "path": current_path.get(),
+    })
+
+
+def instrument_engine(engine):
+    """Time every statement on an (async) engine for the profiler and the slow-query log"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        profile = current_profile.get()
+        if profile is not None:
+            profile.add_statement(statement, elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def drop_timer(context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling opted-in and sampled requests; opted-in ones get Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path_token = current_path.set(scope["path"])
+        requested = profile_requested(scope["headers"])
+        if not requested and not sampled():
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                current_path.reset(path_token)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+
+        async def send_with_timing(message):
+            if requested and message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"server-timing", profile.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_profile.reset(token)
+            current_path.reset(path_token)
+            summary = profile.summary()
+            level = logging.WARNING if summary["duplicates"] else logging.INFO
+            route = scope.get("route")
+            logger.log(level, "Request profile", extra={
+                "method": scope["method"],
+                "path": route.path if route is not None else scope["path"],
+                **summary,
+            })
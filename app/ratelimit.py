@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+import orjson
+from redis.exceptions import ConnectionError, RedisError
+
+from app import cache
+from app.metrics import IN_FLIGHT, POOL_WAITING, RATE_LIMITED, REQUESTS_SHED, recent_pool_wait, redis_timer
+
+logger = logging.getLogger(__name__)
+
+# Token bucket per client (API key, else IP): RATE_LIMIT_BURST requests at
+# once, refilled at RATE_LIMIT_RATE per second. Kept in Redis so the limit
+# holds across workers; while Redis is down each worker limits on its own.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+# A page skipping past this many rows costs one more token per as many rows,
+# so scraping deep offset pages runs out of tokens long before the pool does
+RATE_LIMIT_OFFSET_COST = int(os.getenv("RATE_LIMIT_OFFSET_COST", "1000"))
+# Take the client IP from X-Forwarded-For (only behind a proxy that sets it)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+# Clients tracked per worker by the in-process fallback
+RATE_LIMIT_LOCAL_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_CLIENTS", "10000"))
+# After a Redis error the worker limits locally for this many seconds
+# instead of making every request wait out the Redis timeout again
+RATE_LIMIT_REDIS_BACKOFF = float(os.getenv("RATE_LIMIT_REDIS_BACKOFF", "5"))
+
+# Load shedding: low-priority requests get a 503 while this worker has
+# SHED_MAX_IN_FLIGHT requests in flight, SHED_POOL_WAITING of them waiting
+# for a database connection, or connections took SHED_POOL_WAIT_MS to get
+# (0 turns a check off)
+SHED_MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", "0"))
+SHED_POOL_WAITING = int(os.getenv("SHED_POOL_WAITING", "5"))
+SHED_POOL_WAIT_MS = float(os.getenv("SHED_POOL_WAIT_MS", "100"))
+# Seconds clients are told to wait after a 503
+SHED_RETRY_AFTER = os.getenv("SHED_RETRY_AFTER", "1")
+
+API_KEY_HEADER = b"x-api-key"
+# Never limited or shed: probes and scrapes must keep working under load
+EXEMPT_PATHS = ("/health", "/metrics")
+# Bulk reads that can wait
+LOW_PRIORITY_PATHS = ("/books/export", "/reviews/export", "/books/search")
+
+# Takes `cost` tokens from the bucket if it holds that many, refilling it
+# first for the time since the last call (by the Redis clock, so workers on
+# different hosts agree). Returns {allowed, tokens left, seconds until
+# `cost` tokens are available}; fractions travel as strings.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(tokens), tostring(math.max(0, cost - tokens) / rate)}
+"""
+
+
+class LocalBuckets:
+    """In-process token buckets, least recently seen clients dropped first"""
+
+    def __init__(self, max_clients=RATE_LIMIT_LOCAL_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+
+    def take(self, key, cost, rate, burst, now=None):
+        """(allowed, tokens left, seconds until `cost` tokens are available), as the script returns"""
+        now = time.monotonic() if now is None else now
+        tokens, at = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + max(0.0, now - at) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        while len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return allowed, tokens, max(0.0, cost - tokens) / rate
+
+    def clear(self):
+        self.buckets.clear()
+
+
+local_buckets = LocalBuckets()
+
+# TOKEN_BUCKET_SCRIPT registered with the current Redis client, so requests
+# send its SHA (EVALSHA) rather than the whole script
+token_bucket_script = None
+# time.monotonic() before which Redis is not tried, see RATE_LIMIT_REDIS_BACKOFF
+redis_retry_at = 0.0
+
+
+def bucket_key(client: str) -> str:
+    return f"ratelimit:{client}"
+
+
+def token_bucket():
+    global token_bucket_script
+    if token_bucket_script is None or token_bucket_script.registered_client is not cache.r:
+        token_bucket_script = cache.r.register_script(TOKEN_BUCKET_SCRIPT)
+    return token_bucket_script
+
+
+def client_id(scope, headers) -> str:
+    """Who a request counts against: its API key (hashed), else its IP"""
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key:
+        return "key:" + hashlib.blake2b(api_key, digest_size=12).hexdigest()
+    if RATE_LIMIT_TRUST_FORWARDED and b"x-forwarded-for" in headers:
+        return "ip:" + headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def offset_of(scope) -> int:
+    for name, value in parse_qsl(scope.get("query_string", b"").decode("latin-1")):
+        if name == "skip":
+            try:
+                return max(0, int(value))
+            except ValueError:
+                return 0
+    return 0
+
+
+def request_cost(scope) -> float:
+    """Tokens a request takes: one, plus one per RATE_LIMIT_OFFSET_COST rows skipped"""
+    cost = 1 + offset_of(scope) // RATE_LIMIT_OFFSET_COST if RATE_LIMIT_OFFSET_COST > 0 else 1
+    # A request costing more than the bucket holds could never be served
+    return min(cost, RATE_LIMIT_BURST)
+
+
+def low_priority(scope) -> bool:
+    """Bulk reads and deep offset pages; shed first when the worker is overloaded"""
+    if scope["method"] not in ("GET", "HEAD"):
+        return False
+    return scope["path"].startswith(LOW_PRIORITY_PATHS) or request_cost(scope) > 1
+
+
+def overloaded() -> bool:
+    """Whether this worker is past a load-shedding threshold"""
+    if SHED_MAX_IN_FLIGHT and sum(IN_FLIGHT.values.values()) >= SHED_MAX_IN_FLIGHT:
+        return True
+    if SHED_POOL_WAITING and sum(POOL_WAITING.values.values()) >= SHED_POOL_WAITING:
+        return True
+    return bool(SHED_POOL_WAIT_MS) and recent_pool_wait() * 1000 >= SHED_POOL_WAIT_MS
+
+
+async def take(client: str, cost: float):
+    """(allowed, tokens left, retry after seconds) from the client's bucket in Redis, or the local one"""
+    global redis_retry_at
+    if cache.r is not None and time.monotonic() >= redis_retry_at:
+        try:
+            with redis_timer("rate_limit"):
+                allowed, tokens, retry_after = await token_bucket()(
+                    keys=[bucket_key(client)], args=[RATE_LIMIT_RATE, RATE_LIMIT_BURST, cost]
+                )
+            return bool(allowed), float(tokens), float(retry_after)
+        except (ConnectionError, RedisError) as e:
+            redis_retry_at = time.monotonic() + RATE_LIMIT_REDIS_BACKOFF
+            logger.warning("Redis error in rate limiter, limiting locally for %ss: %s", RATE_LIMIT_REDIS_BACKOFF, e)
+    return local_buckets.take(client, cost, RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+
+
+async def reject(send, status: int, detail: str, headers):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), *headers],
+    })
+    await send({"type": "http.response.body", "body": orjson.dumps({"detail": detail})})
+
+
+class RateLimitMiddleware:
+    """ASGI middleware: 503 for low-priority requests while overloaded, 429 for clients over their rate"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        if low_priority(scope) and overloaded():
+            REQUESTS_SHED.inc()
+            logger.warning("Shed low-priority request", extra={"path": scope["path"]})
+            return await reject(send, 503, "Server busy, retry shortly", [(b"retry-after", SHED_RETRY_AFTER.encode())])
+
+        if not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        client = client_id(scope, dict(scope["headers"]))
+        allowed, tokens, retry_after = await take(client, request_cost(scope))
+        limit_headers = [
+            (b"x-ratelimit-limit", str(int(RATE_LIMIT_BURST)).encode()),
+            (b"x-ratelimit-remaining", str(int(tokens)).encode()),
+        ]
+        if not allowed:
+            RATE_LIMITED.inc()
+            logger.info("Rate limited", extra={"client": client, "path": scope["path"]})
+            retry = str(max(1, math.ceil(retry_after))).encode()
+            return await reject(send, 429, "Too many requests", [(b"retry-after", retry), *limit_headers])
+
+        async def send_with_limits(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *limit_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_limits)
@@ -0,0 +1,393 @@
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+
+import orjson
+from redis.exceptions import ConnectionError, RedisError, ResponseError
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, bindparam, delete, event, insert, or_, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import cache, crud, database, schemas
+from app.bulk import insert_chunk_or_rows
+from app.cache import RATINGS_TAG, encode, invalidate_tags, reviews_tag
+from app.metrics import redis_timer
+
+logger = logging.getLogger(__name__)
+
+# Write-behind: POST /reviews/ queues the review and answers 202; a
+# background worker inserts queued reviews in batches
+REVIEW_WRITE_BEHIND = os.getenv("REVIEW_WRITE_BEHIND", "false").lower() == "true"
+REVIEW_QUEUE_BATCH_SIZE = int(os.getenv("REVIEW_QUEUE_BATCH_SIZE", "500"))
+# How long the worker sleeps when the queue is empty
+REVIEW_QUEUE_POLL_INTERVAL = float(os.getenv("REVIEW_QUEUE_POLL_INTERVAL", "0.2"))
+# Entries claimed by a worker that died are retried after this many seconds
+REVIEW_QUEUE_CLAIM_TIMEOUT = float(os.getenv("REVIEW_QUEUE_CLAIM_TIMEOUT", "60"))
+# Submission statuses, and so idempotency keys, are kept this long
+REVIEW_STATUS_TTL = int(os.getenv("REVIEW_STATUS_TTL", "86400"))
+# SQLite file queueing reviews while Redis is unavailable
+REVIEW_QUEUE_PATH = os.getenv("REVIEW_QUEUE_PATH", "review_queue.db")
+
+QUEUED, STORED, FAILED = "queued", "stored", "failed"
+
+STREAM_KEY = "reviews:ingest"
+CONSUMER_GROUP = "review-writers"
+
+# Record the submission's status and append it to the stream, unless the
+# id is already taken; returns the existing status in that case
+SUBMIT_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    redis.call('XADD', KEYS[2], '*', 'data', ARGV[3])
+    return false
+end
+return redis.call('GET', KEYS[1])
+"""
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different review"""
+
+
+def status_key(submission_id: str) -> str:
+    return f"review_submission:{submission_id}"
+
+
+def new_submission(book_id: int, review: schemas.ReviewCreate, idempotency_key=None) -> dict:
+    """Queue record for a review; the id is derived from the idempotency key if there is one"""
+    if idempotency_key:
+        submission_id = hashlib.sha256(idempotency_key.encode()).hexdigest()[:32]
+    else:
+        submission_id = uuid.uuid4().hex
+    payload = [book_id, review.content, review.rating]
+    return {
+        "id": submission_id,
+        "fingerprint": hashlib.sha256(orjson.dumps(payload)).hexdigest()[:32],
+        "book_id": book_id,
+        "content": review.content,
+        "rating": review.rating,
+    }
+
+
+def submission_status(record: dict, status: str, review_id=None, error=None) -> dict:
+    return {
+        "id": record["id"],
+        "status": status,
+        "book_id": record["book_id"],
+        "review_id": review_id,
+        "error": error,
+        "fingerprint": record["fingerprint"],
+    }
+
+
+class RedisReviewQueue:
+    """Redis stream read through a consumer group, so every worker takes a share"""
+
+    def __init__(self, client):
+        self.r = client
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.group_created = False
+
+    async def submit(self, record):
+        with redis_timer("review_submit"):
+            existing = await self.r.eval(
+                SUBMIT_SCRIPT, 2, status_key(record["id"]), STREAM_KEY,
+                encode(submission_status(record, QUEUED)), REVIEW_STATUS_TTL, encode(record)
+            )
+        return None if existing is None else orjson.loads(existing)
+
+    async def status(self, submission_id):
+        data = await self.r.get(status_key(submission_id))
+        return orjson.loads(data) if data else None
+
+    async def claim(self, count):
+        """Up to count (entry id, record) pairs: abandoned entries first, then new ones"""
+        if not self.group_created:
+            try:
+                await self.r.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self.group_created = True
+
+        _, entries, *_ = await self.r.xautoclaim(
+            STREAM_KEY, CONSUMER_GROUP, self.consumer,
+            min_idle_time=int(REVIEW_QUEUE_CLAIM_TIMEOUT * 1000), start_id="0-0", count=count
+        )
+        if not entries:
+            response = await self.r.xreadgroup(CONSUMER_GROUP, self.consumer, {STREAM_KEY: ">"}, count=count)
+            entries = response[0][1] if response else []
+        return [(entry_id, orjson.loads(fields[b"data"])) for entry_id, fields in entries if fields]
+
+    async def complete(self, claimed, statuses):
+        entry_ids = [entry_id for entry_id, _ in claimed]
+        async with self.r.pipeline(transaction=False) as pipe:
+            for (_, record), status in zip(claimed, statuses):
+                pipe.set(status_key(record["id"]), encode(status), ex=REVIEW_STATUS_TTL)
+            pipe.xack(STREAM_KEY, CONSUMER_GROUP, *entry_ids)
+            pipe.xdel(STREAM_KEY, *entry_ids)
+            await pipe.execute()
+
+
+queue_metadata = MetaData()
+
+# Kept out of the app's Base: this table lives in its own local file
+submissions = Table(
+    "review_submissions",
+    queue_metadata,
+    Column("seq", Integer, primary_key=True),
+    Column("id", String, nullable=False, unique=True),
+    Column("record", Text, nullable=False),
+    # queued -> claimed -> done
+    Column("state", String, nullable=False, index=True),
+    Column("status", Text, nullable=False),
+    Column("claimed_at", Float),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+def durable_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.close()
+
+
+class LocalReviewQueue:
+    """SQLite file queue for when Redis is unavailable; shared by the workers of one host"""
+
+    def __init__(self, path=REVIEW_QUEUE_PATH):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        event.listen(self.engine.sync_engine, "connect", durable_pragmas)
+        self.created = False
+
+    async def create(self):
+        if not self.created:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(queue_metadata.create_all)
+            self.created = True
+
+    async def submit(self, record):
+        await self.create()
+        async with self.engine.begin() as conn:
+            result = await conn.execute(insert(submissions).prefix_with("OR IGNORE").values(
+                id=record["id"],
+                record=encode(record).decode(),
+                state=QUEUED,
+                status=encode(submission_status(record, QUEUED)).decode(),
+                updated_at=time.time(),
+            ))
+            if result.rowcount:
+                return None
+            existing = await conn.scalar(select(submissions.c.status).where(submissions.c.id == record["id"]))
+        return orjson.loads(existing)
+
+    async def status(self, submission_id):
+        await self.create()
+        async with self.engine.connect() as conn:
+            data = await conn.scalar(select(submissions.c.status).where(submissions.c.id == submission_id))
+        return orjson.loads(data) if data else None
+
+    async def claim(self, count):
+        await self.create()
+        now = time.time()
+        claimable = (
+            select(submissions.c.seq)
+            .where(or_(
+                submissions.c.state == QUEUED,
+                (submissions.c.state == "claimed") & (submissions.c.claimed_at < now - REVIEW_QUEUE_CLAIM_TIMEOUT),
+            ))
+            .order_by(submissions.c.seq)
+            .limit(count)
+        )
+        # One UPDATE, so two workers never claim the same rows
+        async with self.engine.begin() as conn:
+            rows = (await conn.execute(
+                update(submissions)
+                .where(submissions.c.seq.in_(claimable.scalar_subquery()))
+                .values(state="claimed", claimed_at=now)
+                .returning(submissions.c.seq, submissions.c.record)
+            )).all()
+        return sorted((seq, orjson.loads(record)) for seq, record in rows)
+
+    async def complete(self, claimed, statuses):
+        now = time.time()
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                update(submissions).where(submissions.c.seq == bindparam("b_seq")).values(
+                    state="done", status=bindparam("b_status"), updated_at=now
+                ),
+                [{"b_seq": seq, "b_status": encode(status).decode()} for (seq, _), status in zip(claimed, statuses)]
+            )
+            # Forget finished submissions once their idempotency window is over
+            await conn.execute(delete(submissions).where(
+                submissions.c.state == "done", submissions.c.updated_at < now - REVIEW_STATUS_TTL
+            ))
+
+    async def close(self):
+        await self.engine.dispose()
+
+
+redis_queue = None
+local_queue = None
+
+
+def queues():
+    """The Redis queue (while there is a Redis client) and the on-disk one, if any worker used it"""
+    global redis_queue
+    active = []
+    if cache.r is not None:
+        if redis_queue is None or redis_queue.r is not cache.r:
+            redis_queue = RedisReviewQueue(cache.r)
+        active.append(redis_queue)
+    disk = disk_queue()
+    if disk is not None:
+        active.append(disk)
+    return active
+
+
+def get_local_queue():
+    global local_queue
+    if local_queue is None:
+        local_queue = LocalReviewQueue(REVIEW_QUEUE_PATH)
+    return local_queue
+
+
+def disk_queue():
+    """The queue at REVIEW_QUEUE_PATH if this or another worker of the host created it, else None"""
+    if local_queue is None and not os.path.exists(REVIEW_QUEUE_PATH):
+        return None
+    return get_local_queue()
+
+
+def public_status(status: dict) -> dict:
+    return {key: value for key, value in status.items() if key != "fingerprint"}
+
+
+async def submit(book_id: int, review: schemas.ReviewCreate, idempotency_key=None) -> dict:
+    """Durably queue a review, returning its status.
+
+    Resubmitting with the same idempotency key returns the first
+    submission's status instead of queueing it again, whether that one went
+    to Redis or to disk. A retry queued on disk because Redis was down is
+    dropped when the batch writer finds the key in Redis, see process_batch().
+    """
+    record = new_submission(book_id, review, idempotency_key)
+    existing = None
+    disk = disk_queue()
+    if idempotency_key and disk is not None and cache.r is not None:
+        # The first attempt may have gone to disk while Redis was down
+        existing = await disk.status(record["id"])
+    if existing is None and cache.r is not None:
+        try:
+            existing = await queues()[0].submit(record)
+        except (ConnectionError, RedisError) as e:
+            logger.warning("Redis unavailable, queueing review on disk: %s", e)
+            existing = await get_local_queue().submit(record)
+    elif existing is None:
+        existing = await get_local_queue().submit(record)
+
+    if existing is None:
+        return public_status(submission_status(record, QUEUED))
+    if existing["fingerprint"] != record["fingerprint"]:
+        raise IdempotencyConflict("Idempotency-Key was already used for a different review")
+    return public_status(existing)
+
+
+async def get_status(submission_id: str):
+    for queue in queues():
+        try:
+            status = await queue.status(submission_id)
+        except (ConnectionError, RedisError) as e:
+            logger.warning("Redis error reading review status: %s", e)
+            continue
+        if status is not None:
+            return public_status(status)
+    return None
+
+
+async def process_batch(queue, batch_size=REVIEW_QUEUE_BATCH_SIZE) -> int:
+    """Insert one batch of queued reviews and invalidate their caches once; returns the batch size"""
+    claimed = await queue.claim(batch_size)
+    if not claimed:
+        return 0
+
+    duplicates = await accepted_by_redis([record for _, record in claimed]) if queue is local_queue else {}
+    items = [
+        schemas.ReviewBulkItem(book_id=record["book_id"], content=record["content"], rating=record["rating"])
+        for _, record in claimed if record["id"] not in duplicates
+    ]
+    outcomes = []
+    if items:
+        async with database.AsyncSessionLocal() as db:
+            outcomes = await insert_chunk_or_rows(db, crud.bulk_create_reviews, items)
+    outcome_of = iter(outcomes)
+    statuses = []
+    for _, record in claimed:
+        if record["id"] in duplicates:
+            statuses.append(duplicates[record["id"]])
+            continue
+        outcome = next(outcome_of)
+        if isinstance(outcome, int):
+            statuses.append(submission_status(record, STORED, review_id=outcome))
+        else:
+            statuses.append(submission_status(record, FAILED, error=str(outcome)))
+    await queue.complete(claimed, statuses)
+
+    book_ids = {item.book_id for item, outcome in zip(items, outcomes) if isinstance(outcome, int)}
+    if book_ids:
+        try:
+            await invalidate_tags(*(reviews_tag(book_id) for book_id in book_ids), RATINGS_TAG)
+        except Exception as cache_error:
+            logger.warning("Failed to invalidate cache: %s", cache_error)
+    stored = sum(status["status"] == STORED for status in statuses)
+    logger.info("Stored queued reviews", extra={"stored": stored, "failed": len(statuses) - stored})
+    return len(claimed)
+
+
+async def accepted_by_redis(records) -> dict:
+    """Statuses Redis holds for any of the records, by id: reviews first queued
+    there and retried with the same idempotency key while Redis was down"""
+    if cache.r is None:
+        return {}
+    try:
+        with redis_timer("review_status"):
+            found = await cache.r.mget([status_key(record["id"]) for record in records])
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error checking queued reviews: %s", e)
+        return {}
+    return {record["id"]: orjson.loads(data) for record, data in zip(records, found) if data}
+
+
+async def drain() -> int:
+    """Process batches until every queue is empty; returns how many reviews were handled"""
+    total = 0
+    while True:
+        handled = 0
+        for queue in queues():
+            try:
+                handled += await process_batch(queue)
+            except (ConnectionError, RedisError) as e:
+                # Keep draining the local queue while Redis is down
+                logger.warning("Redis error in review queue worker: %s", e)
+        if not handled:
+            return total
+        total += handled
+
+
+async def run_worker():
+    """Background batch writer; runs until cancelled"""
+    logger.info("Review write-behind worker started")
+    # Reviews left on disk by an earlier run are picked up through queues()
+    while True:
+        try:
+            if not await drain():
+                await asyncio.sleep(REVIEW_QUEUE_POLL_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Claimed entries stay claimed and are retried after the claim timeout
+            logger.exception("Review write-behind batch failed")
+            await asyncio.sleep(1)
@@ -1,83 +1,348 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+import orjson
 from app import schemas, crud
+from app.bulk import ingest
 from app.database import get_db
-from app.cache import get_cache, set_cache
-import traceback
+from app.export import export_response
+from app.search import SEARCH_CURSOR_KEYS, search_books as run_search
+from app.cache import BOOKS_TAG, RATINGS_TAG, cached_entities, cached_response, encode, etag_for, invalidate_tags, reviews_tag
+from app.http_cache import entities_response, json_response
+from app.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, next_cursor, parse_ids
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/books",
     tags=["books"]
 )
 
+BOOK_FIELDS = crud.BOOK_COLUMNS + ("reviews",)
+BOOK_CURSOR_KEYS = ("id",)
+# Fields that change whenever one of the book's reviews does
+REVIEW_DEPENDENT_FIELDS = {"reviews", "review_count", "average_rating"}
+
+
+def parse_fields(fields: Optional[str], include_reviews: bool):
+    """Turn the fields/include_reviews query params into a projection (None = full books)"""
+    if fields is None:
+        if include_reviews:
+            return None
+        return crud.BOOK_COLUMNS
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(BOOK_FIELDS)
+    if not requested or unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"fields must be a comma-separated subset of {', '.join(BOOK_FIELDS)}"
+        )
+    if not include_reviews:
+        requested.discard("reviews")
+    # id is always returned so the page can be continued with a cursor
+    requested.add("id")
+    return tuple(field for field in BOOK_FIELDS if field in requested)
+
+
 @router.get("/", response_model=list[schemas.Book])
-async def read_books(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    """Get all books with pagination"""
-    print(f"📚 GET /books/ called with skip={skip}, limit={limit}")
-    try:
-        # Try to get from cache first
+async def read_books(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_reviews: bool = True,
+    fields: Optional[str] = None,
+    ids: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get all books with pagination, or just the books listed in `ids`.
+
+    Pages are ordered by id. Pass the X-Next-Cursor header of a page back as
+    `cursor` to seek straight to the next one (keyset pagination, `skip` is
+    then ignored); `skip` keeps working as a plain OFFSET.
+
+    Pass include_reviews=false or fields=id,title,... to project the page;
+    projections without reviews never query the reviews table.
+
+    ids=1,2,3 is a batch read: those books in the order given (unknown ids
+    are left out), each served from its own cache entry; paging params are
+    ignored.
+    """
+    logger.debug("GET /books/", extra={"skip": skip, "limit": limit, "cursor": cursor, "fields": fields, "ids": ids})
+    projection = parse_fields(fields, include_reviews)
+    if ids is not None:
+        return await read_books_by_id(request, ids, projection, db)
+    after_id = None
+    if cursor is not None:
         try:
-            cache_key = f"books_{skip}_{limit}"
-            cached_books = await get_cache(cache_key)
-            if cached_books:
-                print("✅ Returning cached books")
-                return cached_books
-        except Exception as cache_error:
-            print(f"⚠️ Cache error (continuing without cache): {cache_error}")
-        
-        # Fetch from database
-        print("🔄 Fetching books from database")
-        books = crud.get_books(db, skip=skip, limit=limit)
-        print(f"✅ Retrieved {len(books)} books from database")
+            after_id = decode_cursor(cursor, BOOK_CURSOR_KEYS)["id"]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        cache_key = f"books_{skip}_{limit}" if after_id is None else f"books_after_{after_id}_{limit}"
+        if projection is not None:
+            cache_key += "_" + ",".join(projection)
+
+        # Served from the cache when possible (stored bytes go straight back
+        # out); concurrent misses share a single database fetch
+        body, headers = await cached_response(
+            cache_key,
+            lambda session: build_books_page(session, projection, skip, limit, after_id),
+            db
+        )
+        # Rows were validated once by dump_rows, so skip response_model
+        return json_response(request, body, headers)
         
-        # Try to cache the result
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.exception("Database error in read_books")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database connection error: {str(db_error)}"
+        )
+    except Exception:
+        logger.exception("Unexpected error in read_books")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def build_books_page(db: AsyncSession, projection, skip: int, limit: int, after_id: Optional[int]):
+    """Fetch and encode one page of books, returning (body, headers, cache tags)"""
+    if projection is not None:
+        books = await read_book_projection(db, projection, skip, limit, after_id)
+    else:
+        books = schemas.dump_rows(schemas.BookList, await crud.get_books(db, skip=skip, limit=limit, after_id=after_id))
+        logger.debug("Fetched books from database", extra={"rows": len(books)})
+    return books_page(books, limit, projection)
+
+def books_page(books, limit: int, projection=None):
+    """Encode a page of JSON-ready books as (body, headers, cache tags)"""
+    # Tag the page with everything it shows
+    tags = [BOOKS_TAG]
+    if projection is None or REVIEW_DEPENDENT_FIELDS.intersection(projection):
+        tags.extend(reviews_tag(book["id"]) for book in books)
+    return encode(books), cursor_headers(books, limit), tags
+
+def cursor_headers(books, limit: int):
+    """X-Next-Cursor header for a page of books (empty on the last page)"""
+    cursor = next_cursor(books, limit, BOOK_CURSOR_KEYS)
+    return {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+
+async def read_book_projection(db: AsyncSession, projection, skip: int, limit: int, after_id: Optional[int]):
+    """Load a page restricted to the projected fields, as JSON-ready dicts"""
+    logger.debug("Fetching projected books from database", extra={"fields": projection})
+    if "reviews" not in projection:
+        return await crud.get_book_columns(db, projection, skip=skip, limit=limit, after_id=after_id)
+    books = await crud.get_books(db, skip=skip, limit=limit, after_id=after_id)
+    return [
+        {field: book[field] for field in projection}
+        for book in schemas.dump_rows(schemas.BookList, books)
+    ]
+
+def book_key(book_id: int) -> str:
+    return f"book_{book_id}"
+
+async def fetch_books(db: AsyncSession, book_ids):
+    """Load and encode books by id in one query, as {id: (body, cache tags)}"""
+    books = schemas.dump_rows(schemas.BookList, await crud.get_books_by_ids(db, book_ids))
+    logger.debug("Fetched books by id from database", extra={"requested": len(book_ids), "rows": len(books)})
+    return {book["id"]: (encode(book), [reviews_tag(book["id"])]) for book in books}
+
+async def read_books_by_id(request: Request, ids: str, projection, db: AsyncSession):
+    """Batch read: one MGET for the cached books, one query for the rest"""
+    try:
+        book_ids = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        books = await cached_entities(book_ids, book_key, fetch_books, db)
+        parts = [books[book_id] for book_id in book_ids if book_id in books]
+        if projection is not None:
+            parts = [encode({field: book[field] for field in projection}) for book in map(orjson.loads, parts)]
+        return entities_response(request, parts)
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.exception("Database error in read_books_by_id")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database connection error: {str(db_error)}"
+        )
+    except Exception:
+        logger.exception("Unexpected error in read_books_by_id")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/export")
+async def export_books(request: Request):
+    """Stream every book as NDJSON (gzipped when the client sends Accept-Encoding: gzip)"""
+    logger.debug("GET /books/export")
+    return export_response(request, crud.stream_books, "books.ndjson")
+
+@router.get("/search", response_model=list[schemas.BookSearchResult])
+async def search_books(
+    request: Request,
+    q: str,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    match_reviews: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Full-text search over titles and authors, best match first.
+
+    Every word of q must match. With match_reviews=true, books whose reviews
+    match are found as well. Follow X-Next-Cursor for the next page.
+    """
+    logger.debug("GET /books/search", extra={"q": q, "limit": limit, "cursor": cursor, "match_reviews": match_reviews})
+    q = q.strip()
+    if not q or len(q) > 200:
+        raise HTTPException(status_code=422, detail="q must be between 1 and 200 characters")
+    after = None
+    if cursor is not None:
         try:
-            await set_cache(cache_key, [book.__dict__ for book in books])
-            print("✅ Books cached successfully")
-        except Exception as cache_error:
-            print(f"⚠️ Failed to cache books: {cache_error}")
-        
-        return books
-        
+            after = decode_cursor(cursor, SEARCH_CURSOR_KEYS, float_keys=("rank",))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        body, headers = await cached_response(
+            f"books_search_{limit}_{int(match_reviews)}_{cursor or ''}_{q}",
+            lambda session: build_search_page(session, q, limit, after, match_reviews),
+            db
+        )
+        return json_response(request, body, headers)
+    except PoolTimeout:
+        raise
     except SQLAlchemyError as db_error:
-        print(f"❌ Database error: {db_error}")
-        print(f"❌ Full traceback: {traceback.format_exc()}")
+        logger.exception("Database error in search_books")
         raise HTTPException(
             status_code=500, 
             detail=f"Database connection error: {str(db_error)}"
         )
-    except Exception as e:
-        print(f"❌ Unexpected error in read_books: {e}")
-        print(f"❌ Full traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Unexpected error in search_books")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+async def build_search_page(db: AsyncSession, q: str, limit: int, after, match_reviews: bool):
+    """Run one page of a search, returning (body, headers, cache tags)"""
+    books = schemas.dump_rows(schemas.BookSearchList, await run_search(db, q, limit, after, match_reviews))
+    cursor = next_cursor(books, limit, SEARCH_CURSOR_KEYS)
+    # Results show review counts and, with match_reviews, depend on review content
+    return encode(books), {NEXT_CURSOR_HEADER: cursor} if cursor else {}, [BOOKS_TAG, RATINGS_TAG]
+
+@router.get("/top-rated", response_model=list[schemas.BookRating])
+async def read_top_rated_books(
+    request: Request,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    min_reviews: int = 1,
+    db: AsyncSession = Depends(get_db)
+):
+    """Books with the best average rating, with their review count and rating histogram"""
+    logger.debug("GET /books/top-rated", extra={"limit": limit, "min_reviews": min_reviews})
+    if min_reviews < 1:
+        raise HTTPException(status_code=422, detail="min_reviews must be at least 1")
+    try:
+        body, headers = await cached_response(
+            f"books_top_rated_{limit}_{min_reviews}",
+            lambda session: build_top_rated_page(session, limit, min_reviews),
+            db
+        )
+        return json_response(request, body, headers)
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.exception("Database error in read_top_rated_books")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database connection error: {str(db_error)}"
+        )
+    except Exception:
+        logger.exception("Unexpected error in read_top_rated_books")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def build_top_rated_page(db: AsyncSession, limit: int, min_reviews: int):
+    """Fetch and encode the top rated listing, returning (body, headers, cache tags)"""
+    books = schemas.dump_rows(schemas.BookRatingList, await crud.get_top_rated_books(db, limit, min_reviews))
+    return encode(books), {}, [BOOKS_TAG, RATINGS_TAG]
+
 @router.post("/", response_model=schemas.Book)
-async def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
+async def create_book(book: schemas.BookCreate, db: AsyncSession = Depends(get_db)):
     """Create a new book"""
-    print(f"📚 POST /books/ called with book: {book.title}")
+    logger.debug("POST /books/", extra={"title": book.title})
     try:
-        db_book = crud.create_book(db, book)
-        # Clear cache for books list
+        db_book = await crud.create_book(db, book)
+        # Clear every cached books page
         try:
-            await set_cache("books_0_10", None, ex=1)  # Invalidate cache
-            print("✅ Cache invalidated")
+            await invalidate_tags(BOOKS_TAG)
         except Exception as cache_error:
-            print(f"⚠️ Failed to invalidate cache: {cache_error}")
-        
-        print(f"✅ Created book: {db_book.title}")
-        return db_book
+            logger.warning("Failed to invalidate cache: %s", cache_error)
+
+        logger.info("Created book", extra={"book_id": db_book.id})
+        return Response(content=schemas.dump_json(schemas.Book, db_book), media_type="application/json")
+    except PoolTimeout:
+        raise
     except SQLAlchemyError as db_error:
-        print(f"❌ Database error in create_book: {db_error}")
+        logger.error("Database error in create_book: %s", db_error)
         raise HTTPException(
             status_code=500, 
             detail=f"Database error: {str(db_error)}"
         )
-    except Exception as e:
-        print(f"❌ Error in create_book: {e}")
+    except Exception:
+        logger.exception("Error in create_book")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def create_books_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Create many books from a JSON array or an NDJSON stream (Content-Type: application/x-ndjson).
+
+    Rows are inserted in chunks; invalid rows are reported by index in
+    `errors` without aborting the rest of the batch.
+    """
+    logger.debug("POST /books/bulk")
+    try:
+        result, inserted = await ingest(request, db, schemas.BookCreate, crud.bulk_create_books)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.error("Database error in create_books_bulk: %s", db_error)
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database error: {str(db_error)}"
+        )
+
+    # One invalidation for the whole batch
+    if inserted:
+        try:
+            await invalidate_tags(BOOKS_TAG)
+        except Exception as cache_error:
+            logger.warning("Failed to invalidate cache: %s", cache_error)
+
+    logger.info("Bulk created books", extra={"inserted": result["inserted"], "rejected": len(result["errors"])})
+    return result
+
 @router.get("/test")
 async def test_books():
     """Simple test endpoint to verify router is working"""
     return {"message": "Books router is working!", "status": "success"}
+
+@router.get("/{book_id}", response_model=schemas.Book)
+async def read_book(request: Request, book_id: int, db: AsyncSession = Depends(get_db)):
+    """Get one book with its first crud.BOOK_REVIEWS_LIMIT reviews (shares its cache entry with batch reads)"""
+    logger.debug("GET /books/{book_id}", extra={"book_id": book_id})
+    try:
+        books = await cached_entities([book_id], book_key, fetch_books, db)
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.exception("Database error in read_book")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database connection error: {str(db_error)}"
+        )
+    except Exception:
+        logger.exception("Unexpected error in read_book")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if book_id not in books:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return json_response(request, books[book_id], {"ETag": etag_for(books[book_id])})
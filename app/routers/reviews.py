@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from app import schemas, crud
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from app import schemas, crud, review_queue
+from app.bulk import ingest
 from app.database import get_db
-from app.cache import get_cache, set_cache
-import traceback
+from app.export import export_response
+from app.cache import RATINGS_TAG, cached_entities, cached_response, encode, invalidate_tags, reviews_tag
+from app.http_cache import entities_response, json_response
+from app.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, next_cursor, parse_ids
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/reviews",
@@ -16,68 +23,223 @@ async def test_reviews():
     """Simple test endpoint to verify router is working"""
     return {"message": "Reviews router is working!", "status": "success"}
 
-@router.get("/{book_id}", response_model=list[schemas.Review])
-async def read_reviews(book_id: int, db: Session = Depends(get_db)):
-    """Get all reviews for a specific book"""
-    print(f"📝 GET /reviews/{book_id} called")
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def create_reviews_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Create many reviews from a JSON array or an NDJSON stream (Content-Type: application/x-ndjson).
+
+    Each row carries its book_id. Rows are inserted in chunks together with
+    the books' rating aggregates; invalid rows (including unknown books) are
+    reported by index in `errors` without aborting the rest of the batch.
+    """
+    logger.debug("POST /reviews/bulk")
     try:
-        # Try to get from cache first
+        result, inserted = await ingest(request, db, schemas.ReviewBulkItem, crud.bulk_create_reviews)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.error("Database error in create_reviews_bulk: %s", db_error)
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database error: {str(db_error)}"
+        )
+
+    # One invalidation for the whole batch
+    if inserted:
         try:
-            cache_key = f"reviews_{book_id}"
-            cached_reviews = await get_cache(cache_key)
-            if cached_reviews:
-                print("✅ Returning cached reviews")
-                return cached_reviews
+            book_ids = {review.book_id for review in inserted}
+            await invalidate_tags(*(reviews_tag(book_id) for book_id in book_ids), RATINGS_TAG)
         except Exception as cache_error:
-            print(f"⚠️ Cache error (continuing without cache): {cache_error}")
-        
-        # Fetch from database
-        print("🔄 Fetching reviews from database")
-        reviews = crud.get_reviews_by_book(db, book_id)
-        print(f"✅ Retrieved {len(reviews)} reviews from database")
-        
-        # Try to cache the result
+            logger.warning("Failed to invalidate cache: %s", cache_error)
+
+    logger.info("Bulk created reviews", extra={"inserted": result["inserted"], "rejected": len(result["errors"])})
+    return result
+
+@router.get("/", response_model=list[schemas.BookReviews])
+async def read_reviews_for_books(
+    request: Request,
+    book_ids: str,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """Batch read: the first `limit` reviews of each book in book_ids=1,2,3, in that order.
+
+    Follow up on a single book with GET /reviews/{book_id} for further pages.
+    """
+    logger.debug("GET /reviews/", extra={"book_ids": book_ids, "limit": limit})
+    try:
+        ids = parse_ids(book_ids, "book_ids")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        pages = await cached_entities(
+            ids,
+            lambda book_id: f"bookreviews_{book_id}_{limit}",
+            lambda session, missing: fetch_first_reviews(session, missing, limit),
+            db
+        )
+        return entities_response(request, [pages[book_id] for book_id in ids])
+    except PoolTimeout:
+        raise
+    except SQLAlchemyError as db_error:
+        logger.exception("Database error in read_reviews_for_books")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Database connection error: {str(db_error)}"
+        )
+    except Exception:
+        logger.exception("Unexpected error in read_reviews_for_books")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def fetch_first_reviews(db: AsyncSession, book_ids, limit: int):
+    """Load and encode each book's first reviews in one query, as {book_id: (body, cache tags)}"""
+    grouped = await crud.get_first_reviews_by_books(db, book_ids, limit)
+    return {
+        book_id: (encode({"book_id": book_id, "reviews": schemas.dump_rows(schemas.ReviewList, reviews)}), [reviews_tag(book_id)])
+        for book_id, reviews in grouped.items()
+    }
+
+@router.get("/export")
+async def export_reviews(request: Request):
+    """Stream every review as NDJSON (gzipped when the client sends Accept-Encoding: gzip)"""
+    logger.debug("GET /reviews/export")
+    return export_response(request, crud.stream_reviews, "reviews.ndjson")
+
+@router.get("/{book_id}", response_model=list[schemas.Review])
+async def read_reviews(
+    request: Request,
+    book_id: int,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    sort: str = "id",
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get reviews for a specific book, one page at a time.
+
+    sort is one of id, rating or -rating. Pass the X-Next-Cursor header of a
+    page back as `cursor` to fetch the next one.
+    """
+    logger.debug("GET /reviews/{book_id}", extra={"book_id": book_id, "limit": limit, "sort": sort, "cursor": cursor})
+    cursor_keys = crud.REVIEW_SORT_KEYS.get(sort)
+    if cursor_keys is None:
+        raise HTTPException(
+            status_code=422,
+            detail=f"sort must be one of {', '.join(crud.REVIEW_SORT_KEYS)}"
+        )
+    after = None
+    if cursor is not None:
         try:
-            await set_cache(cache_key, [review.__dict__ for review in reviews])
-            print("✅ Reviews cached successfully")
-        except Exception as cache_error:
-            print(f"⚠️ Failed to cache reviews: {cache_error}")
-        
-        return reviews
+            after = decode_cursor(cursor, cursor_keys)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # The default first page keeps the plain reviews_{book_id} key
+        cache_key = f"reviews_{book_id}"
+        if (limit, sort, after) != (50, "id", None):
+            cache_key += f"_{sort}_{limit}_{encode_cursor(after) if after else ''}"
+
+        # Served from the cache when possible (stored bytes go straight back
+        # out); concurrent misses share a single database fetch
+        body, headers = await cached_response(
+            cache_key,
+            lambda session: build_reviews_page(session, book_id, limit, sort, after),
+            db
+        )
+        # Rows were validated once by dump_rows, so skip response_model
+        return json_response(request, body, headers)
         
+    except PoolTimeout:
+        raise
     except SQLAlchemyError as db_error:
-        print(f"❌ Database error: {db_error}")
-        print(f"❌ Full traceback: {traceback.format_exc()}")
+        logger.exception("Database error in read_reviews")
         raise HTTPException(
             status_code=500, 
             detail=f"Database connection error: {str(db_error)}"
         )
-    except Exception as e:
-        print(f"❌ Unexpected error in read_reviews: {e}")
-        print(f"❌ Full traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Unexpected error in read_reviews")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/", response_model=schemas.Review)
-async def create_review(review: schemas.ReviewCreate, book_id: int, db: Session = Depends(get_db)):
-    """Create a new review for a book"""
-    print(f"📝 POST /reviews/ called for book_id: {book_id}")
+async def build_reviews_page(db: AsyncSession, book_id: int, limit: int, sort: str, after: Optional[dict]):
+    """Fetch and encode one page of a book's reviews, returning (body, headers, cache tags)"""
+    reviews = await crud.get_reviews_by_book(db, book_id, limit=limit, sort=sort, after=after)
+    logger.debug("Fetched reviews from database", extra={"book_id": book_id, "rows": len(reviews)})
+    return reviews_page(book_id, schemas.dump_rows(schemas.ReviewList, reviews), limit, sort)
+
+def reviews_page(book_id: int, reviews, limit: int, sort: str = "id"):
+    """Encode a page of a book's JSON-ready reviews as (body, headers, cache tags)"""
+    headers = cursor_headers(reviews, limit, crud.REVIEW_SORT_KEYS[sort])
+    return encode(reviews), headers, [reviews_tag(book_id)]
+
+def cursor_headers(reviews, limit: int, cursor_keys):
+    """X-Next-Cursor header for a page of reviews (empty on the last page)"""
+    cursor = next_cursor(reviews, limit, cursor_keys)
+    return {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+
+@router.post("/", response_model=schemas.Review, responses={202: {"model": schemas.ReviewSubmission}})
+async def create_review(
+    review: schemas.ReviewCreate,
+    book_id: int,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a new review for a book.
+
+    In write-behind mode (REVIEW_WRITE_BEHIND) the review is queued and
+    acknowledged with 202 and a Location to poll; resending with the same
+    Idempotency-Key never queues it twice.
+    """
+    logger.debug("POST /reviews/", extra={"book_id": book_id})
+    if review_queue.REVIEW_WRITE_BEHIND:
+        return await queue_review(review, book_id, idempotency_key)
     try:
-        db_review = crud.create_review(db, review, book_id)
-        # Clear cache for this book's reviews
+        db_review = await crud.create_review(db, review, book_id)
+        # Clear every cached page showing this book's reviews or ratings
         try:
-            await set_cache(f"reviews_{book_id}", None, ex=1)  # Invalidate cache
-            print("✅ Cache invalidated")
+            await invalidate_tags(reviews_tag(book_id), RATINGS_TAG)
         except Exception as cache_error:
-            print(f"⚠️ Failed to invalidate cache: {cache_error}")
-        
-        print(f"✅ Created review for book {book_id}")
-        return db_review
+            logger.warning("Failed to invalidate cache: %s", cache_error)
+
+        logger.info("Created review", extra={"review_id": db_review.id, "book_id": book_id})
+        return Response(content=schemas.dump_json(schemas.Review, db_review), media_type="application/json")
+    except PoolTimeout:
+        raise
     except SQLAlchemyError as db_error:
-        print(f"❌ Database error in create_review: {db_error}")
+        logger.error("Database error in create_review: %s", db_error)
         raise HTTPException(
             status_code=500, 
             detail=f"Database error: {str(db_error)}"
         )
-    except Exception as e:
-        print(f"❌ Error in create_review: {e}")
+    except Exception:
+        logger.exception("Error in create_review")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def queue_review(review: schemas.ReviewCreate, book_id: int, idempotency_key: Optional[str]):
+    try:
+        submission = await review_queue.submit(book_id, review, idempotency_key)
+    except review_queue.IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception:
+        logger.exception("Error in queue_review")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    logger.debug("Queued review", extra={"submission_id": submission["id"], "book_id": book_id})
+    return Response(
+        content=encode(submission),
+        status_code=202,
+        media_type="application/json",
+        headers={"Location": f"/reviews/submissions/{submission['id']}"}
+    )
+
+@router.get("/submissions/{submission_id}", response_model=schemas.ReviewSubmission)
+async def read_review_submission(submission_id: str):
+    """Status of a review queued in write-behind mode: queued, stored (with review_id) or failed"""
+    try:
+        submission = await review_queue.get_status(submission_id)
+    except Exception:
+        logger.exception("Error in read_review_submission")
         raise HTTPException(status_code=500, detail="Internal server error")
+    if submission is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return submission
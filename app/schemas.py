@@ -1,12 +1,14 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Any, Dict, List, Optional
 
 class ReviewBase(BaseModel):
     content: str
     rating: int
 
 class ReviewCreate(ReviewBase):
-    pass
+    # Part of the POST contract since the rating aggregates: every new
+    # rating must have a histogram column on its book (models.RATINGS)
+    rating: int = Field(ge=1, le=5, description="Whole number from 1 to 5")
 
 class Review(ReviewBase):
     id: int
@@ -17,6 +19,12 @@ class Review(ReviewBase):
     }
 
 
+class BookReviews(BaseModel):
+    """One book's first page of reviews, as returned by a batch read"""
+    book_id: int
+    reviews: List[Review]
+
+
 class BookBase(BaseModel):
     title: str
     author: str
@@ -26,8 +34,76 @@ class BookCreate(BookBase):
 
 class Book(BookBase):
     id: int
+    review_count: int = 0
+    average_rating: Optional[float] = None
     reviews: List[Review] = []
 
     model_config = {
         "from_attributes": True
     }
+
+
+class BookRating(BookBase):
+    id: int
+    review_count: int
+    average_rating: Optional[float] = None
+    rating_histogram: Dict[int, int]
+
+    model_config = {
+        "from_attributes": True
+    }
+
+
+class BookSearchResult(BookBase):
+    id: int
+    review_count: int = 0
+    average_rating: Optional[float] = None
+    # Higher is a better match; only comparable within one search
+    rank: float
+
+
+# Adapters that validate a whole page of ORM rows in one pass
+BookList = TypeAdapter(List[Book])
+BookRatingList = TypeAdapter(List[BookRating])
+BookSearchList = TypeAdapter(List[BookSearchResult])
+ReviewList = TypeAdapter(List[Review])
+
+
+def dump_rows(adapter: TypeAdapter, rows) -> list:
+    """Validate ORM rows through a list adapter and return plain JSON-ready dicts"""
+    return adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+
+
+def dump_json(model, obj) -> bytes:
+    """Validate one ORM object and encode it straight to JSON bytes.
+
+    Handlers return these bytes in a Response, which FastAPI sends as-is
+    instead of validating against response_model a second time.
+    """
+    return model.model_validate(obj, from_attributes=True).model_dump_json().encode()
+
+
+class ReviewBulkItem(ReviewCreate):
+    book_id: int
+
+
+class ReviewSubmission(BaseModel):
+    """A review accepted in write-behind mode (see app/review_queue.py)"""
+    id: str
+    # queued, stored or failed
+    status: str
+    book_id: int
+    review_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkError(BaseModel):
+    index: int
+    error: Any
+
+
+class BulkResult(BaseModel):
+    inserted: int
+    # New id per input row, in input order; None where the row failed
+    ids: List[Optional[int]]
+    errors: List[BulkError]
@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+import re
+from array import array
+from collections import Counter, defaultdict
+from typing import Optional
+
+from sqlalchemy import and_, func, or_, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, models
+
+# Keyset columns of a search page: best match first, ties broken by id
+SEARCH_CURSOR_KEYS = ("rank", "id")
+
+# How much a match in each field adds to the rank, roughly ts_rank's
+# default weights for the A, B and D labels
+TITLE_WEIGHT = 1.0
+AUTHOR_WEIGHT = 0.4
+REVIEW_WEIGHT = 0.1
+
+# Rows read per round trip while the in-process index catches up
+INDEX_BATCH_SIZE = 10_000
+
+
+def tokenize(text: str):
+    """Lowercased words of text, as the in-process index stores them"""
+    return re.findall(r"\w+", text.lower())
+
+
+async def search_books(
+    db: AsyncSession,
+    q: str,
+    limit: int = 10,
+    after: Optional[dict] = None,
+    match_reviews: bool = False
+):
+    """Books matching every word of q, best match first, as dicts with a `rank`.
+
+    Postgres uses the tsvector GIN indexes; other databases (SQLite in tests)
+    fall back to an in-process inverted index. With match_reviews, books are
+    also found, and ranked higher, through the content of their reviews.
+    """
+    if db.bind.dialect.name == "postgresql":
+        result = await db.execute(build_postgres_search(q, limit, after, match_reviews))
+        return [dict(row._mapping) for row in result]
+    return await search_in_process(db, q, limit, after, match_reviews)
+
+
+def seek_after(rank, book_id, after: Optional[dict]):
+    """Keyset filter for rows after `after` in (rank desc, id) order"""
+    return or_(rank < after["rank"], and_(rank == after["rank"], book_id > after["id"]))
+
+
+def build_postgres_search(q: str, limit: int, after: Optional[dict], match_reviews: bool):
+    """SELECT for one page of ranked results, matching on the indexed tsvector expressions"""
+    Book, Review = models.Book, models.Review
+    query = func.websearch_to_tsquery(models.SEARCH_CONFIG, q)
+    rank = func.ts_rank(models.BOOK_SEARCH_VECTOR, query)
+    candidates = select(Book.id).filter(models.BOOK_SEARCH_VECTOR.op("@@")(query))
+    if match_reviews:
+        review_matches = models.REVIEW_SEARCH_VECTOR.op("@@")(query)
+        # Each side of the UNION is answered from its own GIN index
+        candidates = union(candidates, select(Review.book_id).filter(review_matches))
+        matching_reviews = (
+            select(func.count())
+            .filter(Review.book_id == Book.id, review_matches)
+            .scalar_subquery()
+        )
+        rank = rank + REVIEW_WEIGHT * matching_reviews
+
+    columns = (getattr(Book, column) for column in crud.BOOK_COLUMNS)
+    ranked = (
+        select(*columns, rank.label("rank"))
+        .filter(Book.id.in_(candidates))
+        .subquery()
+    )
+    stmt = select(ranked).order_by(ranked.c.rank.desc(), ranked.c.id)
+    if after is not None:
+        stmt = stmt.filter(seek_after(ranked.c.rank, ranked.c.id, after))
+    return stmt.limit(limit)
+
+
+class SearchIndex:
+    """Inverted index over book titles and authors, and review content on demand.
+
+    Posting lists hold one book (or review) id per occurrence of a word.
+    Rows are only ever inserted, so the index catches up by reading the
+    rows past the last id it has seen.
+    """
+
+    def __init__(self):
+        self.titles = defaultdict(lambda: array("q"))
+        self.authors = defaultdict(lambda: array("q"))
+        self.reviews = defaultdict(lambda: array("q"))
+        self.review_books = {}
+        self.last_book_id = 0
+        # Reviews are only indexed once a search asks for them
+        self.last_review_id = None
+        self.lock = asyncio.Lock()
+
+    async def catch_up(self, db: AsyncSession, reviews: bool):
+        async with self.lock:
+            Book, Review = models.Book, models.Review
+            stmt = (
+                select(Book.id, Book.title, Book.author)
+                .filter(Book.id > self.last_book_id)
+                .order_by(Book.id)
+            )
+            async for partition in crud.stream_partitions(db, stmt, INDEX_BATCH_SIZE):
+                for row in partition:
+                    for word in tokenize(row["title"]):
+                        self.titles[word].append(row["id"])
+                    for word in tokenize(row["author"]):
+                        self.authors[word].append(row["id"])
+                self.last_book_id = partition[-1]["id"]
+
+            if not reviews:
+                return
+            stmt = (
+                select(Review.id, Review.book_id, Review.content)
+                .filter(Review.id > (self.last_review_id or 0))
+                .order_by(Review.id)
+            )
+            self.last_review_id = self.last_review_id or 0
+            async for partition in crud.stream_partitions(db, stmt, INDEX_BATCH_SIZE):
+                for row in partition:
+                    self.review_books[row["id"]] = row["book_id"]
+                    for word in set(tokenize(row["content"])):
+                        self.reviews[word].append(row["id"])
+                self.last_review_id = partition[-1]["id"]
+
+    def score(self, words, match_reviews: bool) -> dict:
+        """Rank of every book matching all of `words`, keyed by book id"""
+        scores = None
+        # Rarest word first keeps the running intersection small
+        for word in sorted(words, key=lambda word: len(self.titles.get(word, ())) + len(self.authors.get(word, ()))):
+            word_scores = Counter()
+            for book_id in self.titles.get(word, ()):
+                word_scores[book_id] += TITLE_WEIGHT
+            for book_id in self.authors.get(word, ()):
+                word_scores[book_id] += AUTHOR_WEIGHT
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {book_id: rank + word_scores[book_id] for book_id, rank in scores.items() if book_id in word_scores}
+        if scores is None:
+            scores = {}
+
+        if match_reviews:
+            review_ids = None
+            for word in words:
+                postings = set(self.reviews.get(word, ()))
+                review_ids = postings if review_ids is None else review_ids & postings
+            for book_id, count in Counter(self.review_books[i] for i in review_ids or ()).items():
+                scores[book_id] = scores.get(book_id, 0.0) + REVIEW_WEIGHT * count
+        return scores
+
+
+# One index per database, keyed by URL
+indexes = {}
+
+
+def index_for(db: AsyncSession) -> SearchIndex:
+    key = str(db.bind.url)
+    if key not in indexes:
+        indexes[key] = SearchIndex()
+    return indexes[key]
+
+
+async def search_in_process(db: AsyncSession, q: str, limit: int, after: Optional[dict], match_reviews: bool):
+    words = list(dict.fromkeys(tokenize(q)))
+    if not words:
+        return []
+    index = index_for(db)
+    await index.catch_up(db, reviews=match_reviews)
+
+    scores = index.score(words, match_reviews)
+    if after is not None:
+        scores = {
+            book_id: rank for book_id, rank in scores.items()
+            if rank < after["rank"] or (rank == after["rank"] and book_id > after["id"])
+        }
+    page = heapq.nsmallest(limit, ((-rank, book_id) for book_id, rank in scores.items()))
+    if not page:
+        return []
+
+    Book = models.Book
+    stmt = select(*(getattr(Book, column) for column in crud.BOOK_COLUMNS)).filter(Book.id.in_([book_id for _, book_id in page]))
+    rows = {row.id: dict(row._mapping) for row in await db.execute(stmt)}
+    return [{**rows[book_id], "rank": -negative_rank} for negative_rank, book_id in page if book_id in rows]
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+
+from redis.exceptions import ConnectionError, RedisError
+
+from app import cache, crud, database, schemas
+from app.logging_config import configure_logging
+from app.metrics import redis_timer
+from app.pagination import MAX_BATCH_IDS
+from app.routers import books, reviews
+
+logger = logging.getLogger(__name__)
+
+# Every CACHE_WARM_INTERVAL seconds (and at startup) the CACHE_WARM_TOP_K
+# most requested pages are recomputed and written back, so they are fresh
+# again before their CACHE_TTL runs out and never go cold under traffic
+CACHE_WARM_ENABLED = os.getenv("CACHE_WARM_ENABLED", "true").lower() == "true"
+CACHE_WARM_INTERVAL = float(os.getenv("CACHE_WARM_INTERVAL", "30"))
+CACHE_WARM_TOP_K = int(os.getenv("CACHE_WARM_TOP_K", "100"))
+# Key list (one per line, see `python -m app.warmer --save`) warmed when
+# Redis has no lookup counts yet, e.g. after it was flushed
+CACHE_WARM_KEYS_FILE = os.getenv("CACHE_WARM_KEYS_FILE", "")
+# Adjacent pages of books are loaded together, up to this many rows a query
+CACHE_WARM_MAX_ROWS = int(os.getenv("CACHE_WARM_MAX_ROWS", "500"))
+
+# Lookup counts of all workers, halved after every warming so they follow
+# current traffic; kept in Redis so they outlive a restart of the app
+HOT_KEYS_KEY = "cache:hot_keys"
+HOT_KEYS_TTL = 86400
+HOT_KEYS_DECAY = 0.5
+# Taken for half an interval by the worker that warms, so the workers
+# between them warm about once per interval
+WARM_LOCK = "cache_warmer"
+
+# Keys the warmer can rebuild: first pages of books and of a book's reviews
+BOOKS_PAGE_KEY = re.compile(r"books_(\d+)_(\d+)")
+REVIEWS_PAGE_KEY = re.compile(r"reviews_(\d+)")
+# Page size of the plain reviews_{book_id} key (GET /reviews/{book_id} defaults)
+REVIEWS_PAGE_LIMIT = 50
+
+
+def warmable(key: str) -> bool:
+    return bool(BOOKS_PAGE_KEY.fullmatch(key) or REVIEWS_PAGE_KEY.fullmatch(key))
+
+
+def load_keys(path: str) -> list:
+    """Keys listed in a file, one per line; blank lines and # comments are skipped"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def book_page_runs(pages):
+    """Group (key, skip, limit) pages into runs of overlapping or adjacent pages
+    spanning at most CACHE_WARM_MAX_ROWS rows, as (start, end, pages)"""
+    runs = []
+    for page in sorted(pages, key=lambda page: page[1]):
+        _, skip, limit = page
+        if runs:
+            start, end, run = runs[-1]
+            if skip <= end and max(end, skip + limit) - start <= CACHE_WARM_MAX_ROWS:
+                runs[-1] = (start, max(end, skip + limit), run + [page])
+                continue
+        runs.append((skip, skip + limit, [page]))
+    return runs
+
+
+async def build_books_pages(db, keys):
+    """(key, body, headers, tags) for each books_{skip}_{limit} key, one query per run of pages"""
+    pages = [(key, int(match[1]), int(match[2])) for key in keys if (match := BOOKS_PAGE_KEY.fullmatch(key))]
+    responses = []
+    for start, end, run in book_page_runs(pages):
+        rows = schemas.dump_rows(schemas.BookList, await crud.get_books(db, skip=start, limit=end - start))
+        for key, skip, limit in run:
+            responses.append((key, *books.books_page(rows[skip - start:skip - start + limit], limit)))
+    return responses
+
+
+async def build_reviews_pages(db, keys):
+    """(key, body, headers, tags) for each reviews_{book_id} key, one query per MAX_BATCH_IDS books"""
+    pages = [(key, int(match[1])) for key in keys if (match := REVIEWS_PAGE_KEY.fullmatch(key))]
+    responses = []
+    for i in range(0, len(pages), MAX_BATCH_IDS):
+        chunk = pages[i:i + MAX_BATCH_IDS]
+        grouped = await crud.get_first_reviews_by_books(db, [book_id for _, book_id in chunk], REVIEWS_PAGE_LIMIT)
+        for key, book_id in chunk:
+            rows = schemas.dump_rows(schemas.ReviewList, grouped[book_id])
+            responses.append((key, *reviews.reviews_page(book_id, rows, REVIEWS_PAGE_LIMIT)))
+    return responses
+
+
+async def warm(keys) -> int:
+    """Recompute the warmable keys among `keys` on the primary and store them in one pipeline; returns how many"""
+    keys = list(dict.fromkeys(key for key in keys if warmable(key)))
+    if cache.r is None or not keys:
+        return 0
+    since = await cache.cache_generation()
+    async with database.AsyncSessionLocal() as db:
+        responses = await build_books_pages(db, keys) + await build_reviews_pages(db, keys)
+    await cache.set_cached_responses(responses, since=since)
+    return len(responses)
+
+
+async def share_counts():
+    """Add this worker's lookups since the last call to the counts in Redis"""
+    counts = cache.hot_keys.drain()
+    if not counts:
+        return
+    async with cache.r.pipeline(transaction=False) as pipe:
+        for key, count in counts.items():
+            pipe.zincrby(HOT_KEYS_KEY, count, key)
+        pipe.expire(HOT_KEYS_KEY, HOT_KEYS_TTL)
+        with redis_timer("share_hot_keys"):
+            await pipe.execute()
+
+
+async def hottest_keys(n=None) -> list:
+    """The n (default CACHE_WARM_TOP_K) most requested warmable keys across the workers, hottest first"""
+    n = CACHE_WARM_TOP_K if n is None else n
+    with redis_timer("hot_keys"):
+        keys = await cache.r.zrevrange(HOT_KEYS_KEY, 0, cache.CACHE_HOT_KEYS - 1)
+    keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+    return [key for key in keys if warmable(key)][:n]
+
+
+async def decay_counts():
+    """Halve the counts in Redis and forget all but the CACHE_HOT_KEYS hottest keys"""
+    async with cache.r.pipeline(transaction=False) as pipe:
+        pipe.zunionstore(HOT_KEYS_KEY, {HOT_KEYS_KEY: HOT_KEYS_DECAY})
+        pipe.zremrangebyrank(HOT_KEYS_KEY, 0, -(cache.CACHE_HOT_KEYS + 1))
+        pipe.expire(HOT_KEYS_KEY, HOT_KEYS_TTL)
+        with redis_timer("decay_hot_keys"):
+            await pipe.execute()
+
+
+async def run_cycle() -> int:
+    """Share this worker's counts, then warm the hottest keys unless another
+    worker did within the last half interval; returns how many keys were warmed"""
+    if cache.r is None:
+        return 0
+    try:
+        await share_counts()
+        if await cache.acquire_lock(WARM_LOCK, timeout=CACHE_WARM_INTERVAL / 2) is None:
+            return 0
+        keys = await hottest_keys()
+        if keys:
+            await decay_counts()
+        elif CACHE_WARM_KEYS_FILE and os.path.exists(CACHE_WARM_KEYS_FILE):
+            keys = load_keys(CACHE_WARM_KEYS_FILE)[:CACHE_WARM_TOP_K]
+    except (ConnectionError, RedisError) as e:
+        logger.warning("Redis error in cache warmer: %s", e)
+        return 0
+
+    start = time.perf_counter()
+    warmed = await warm(keys)
+    if warmed:
+        logger.info("Warmed cache", extra={"keys": warmed, "duration_ms": round((time.perf_counter() - start) * 1000, 1)})
+    return warmed
+
+
+async def run_warmer(interval=CACHE_WARM_INTERVAL):
+    """Warm at startup, then every `interval` seconds; runs until cancelled"""
+    while True:
+        try:
+            await run_cycle()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache warming failed")
+        await asyncio.sleep(interval)
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Record the hottest cache keys, or warm the cache from a recorded key list",
+        epilog="python -m app.warmer --save hot_keys.txt; python -m app.warmer hot_keys.txt",
+    )
+    parser.add_argument("keys_file", nargs="?", help="recompute and cache the keys listed in this file")
+    parser.add_argument("--save", metavar="FILE", help="write the hottest keys, one per line, to FILE")
+    parser.add_argument("--top", type=int, default=None, help="how many keys to save (default CACHE_WARM_TOP_K)")
+    args = parser.parse_args()
+    if not args.keys_file and not args.save:
+        parser.error("give a key list to warm from, --save FILE, or both")
+
+    configure_logging()
+    database.init_engines()
+    if cache.init_redis() is None:
+        print("❌ Redis is not available", file=sys.stderr)
+        return 1
+    try:
+        if args.save:
+            keys = await hottest_keys(args.top)
+            with open(args.save, "w") as f:
+                f.writelines(f"{key}\n" for key in keys)
+            print(f"💾 saved {len(keys)} keys to {args.save}")
+        if args.keys_file:
+            print(f"🔥 warmed {await warm(load_keys(args.keys_file))} keys")
+    except (ConnectionError, RedisError) as e:
+        print(f"❌ Redis error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        await cache.close_redis()
+        await database.dispose_engines()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
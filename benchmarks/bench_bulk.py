@@ -0,0 +1,88 @@
+"""
+Ingestion throughput benchmark: single-row POST /books/ vs POST /books/bulk
+
+Inserts the same synthetic rows through each path in-process (httpx +
+ASGITransport) and reports rows/sec.
+
+Usage:
+    python benchmarks/bench_bulk.py --rows 20000 --single-rows 2000
+    DATABASE_URL=postgresql://... python benchmarks/bench_bulk.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_database
+
+use_database("bench_bulk")
+
+import httpx
+import orjson
+
+from app import cache, logging_config
+from app.database import Base, async_engine, engine
+from app.main import app
+
+
+def rows(n, prefix):
+    return [{"title": f"{prefix} {i}", "author": f"Author {i % 97}"} for i in range(n)]
+
+
+async def single_rows(client, items):
+    for item in items:
+        response = await client.post("/books/", json=item)
+        response.raise_for_status()
+
+
+async def bulk_json(client, items):
+    response = await client.post("/books/bulk", content=orjson.dumps(items), headers={"Content-Type": "application/json"})
+    response.raise_for_status()
+    assert response.json()["inserted"] == len(items)
+
+
+async def bulk_ndjson(client, items):
+    async def stream():
+        for start in range(0, len(items), 500):
+            yield b"".join(orjson.dumps(item) + b"\n" for item in items[start:start + 500])
+
+    response = await client.post("/books/bulk", content=stream(), headers={"Content-Type": "application/x-ndjson"})
+    response.raise_for_status()
+    assert response.json()["inserted"] == len(items)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000, help="rows per bulk run")
+    parser.add_argument("--single-rows", type=int, default=2_000, help="rows for the (slow) single-row run")
+    args = parser.parse_args()
+
+    # Measure the database path only
+    cache.r = None
+    # Keep the one-INFO-line-per-create of the single POST run out of the output
+    logging_config.configure_logging(level="WARNING")
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    print(f"🔍 Ingesting books into {engine.url.render_as_string()}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        runs = (
+            ("single-row", single_rows, args.single_rows),
+            ("bulk json", bulk_json, args.rows),
+            ("bulk ndjson", bulk_ndjson, args.rows),
+        )
+        for name, fn, n in runs:
+            items = rows(n, name)
+            start = time.perf_counter()
+            await fn(client, items)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<12} rows={n:<8} seconds={elapsed:8.2f}  rows/sec={n / elapsed:10.0f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
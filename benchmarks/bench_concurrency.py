@@ -0,0 +1,105 @@
+"""
+Concurrency benchmark for GET /books/
+
+Fires N concurrent requests at the app in-process (httpx + ASGITransport) and
+reports p50/p95/p99 latency, once through the async database layer and once
+through a blocking sync Session (how the handlers used to call crud).
+
+Usage:
+    python benchmarks/bench_concurrency.py --concurrency 200 --books 2000
+    DATABASE_URL=postgresql://... python benchmarks/bench_concurrency.py --no-seed
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile, use_database
+
+use_database("bench_books")
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app import cache, crud, models
+from app.database import SessionLocal, async_engine, engine
+from app.main import app
+from benchmarks.datagen import seed_database
+
+
+async def blocking_get_books(db, skip=0, limit=10, after_id=None):
+    """Old code path: a sync Session query run directly on the event loop"""
+    with SessionLocal() as session:
+        stmt = select(models.Book).options(selectinload(models.Book.reviews))
+        return session.scalars(crud.paginate_books(stmt, skip, limit, after_id)).all()
+
+
+async def run_burst(concurrency, limit):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one(i):
+            start = time.perf_counter()
+            response = await client.get("/books/", params={"skip": i % 50, "limit": limit})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        return latencies, time.perf_counter() - start
+
+
+async def run_mode(concurrency, limit, rounds):
+    latencies, wall = [], 0.0
+    # Warm up the pools before measuring
+    await run_burst(min(concurrency, 10), limit)
+    for _ in range(rounds):
+        burst, elapsed = await run_burst(concurrency, limit)
+        latencies.extend(burst)
+        wall += elapsed
+    return [x * 1000 for x in latencies], wall
+
+
+def report(name, ms, wall):
+    print(
+        f"{name:<9} requests={len(ms):<6} req/s={len(ms) / wall:9.1f}  "
+        f"p50={percentile(ms, 50):8.2f}ms  p95={percentile(ms, 95):8.2f}ms  "
+        f"p99={percentile(ms, 99):8.2f}ms  mean={statistics.mean(ms):8.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--reviews-per-book", type=float, default=5, help="mean; the actual counts are skewed")
+    parser.add_argument("--no-seed", action="store_true", help="use the existing data as-is")
+    args = parser.parse_args()
+
+    # Measure the database path only
+    cache.r = None
+
+    if not args.no_seed:
+        seed_database(engine, args.books, args.reviews_per_book)
+
+    print(f"🔍 {args.concurrency} concurrent GET /books/ x {args.rounds} rounds against {engine.url.render_as_string()}")
+    async_get_books = crud.get_books
+    try:
+        for name, impl in (("async", async_get_books), ("blocking", blocking_get_books)):
+            crud.get_books = impl
+            ms, wall = await run_mode(args.concurrency, args.limit, args.rounds)
+            report(name, ms, wall)
+    finally:
+        crud.get_books = async_get_books
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Logging overhead benchmark for GET /books/
+
+Measures req/s in-process (httpx + ASGITransport) with the "app" logger set up
+three ways:
+  sync-debug   every per-request line written synchronously on the request
+               path, the way the old print() calls were
+  queue-debug  per-request DEBUG lines through the background writer thread
+  queue-info   the default: INFO through the background writer thread
+
+Log lines go to --output (line buffered, like stdout to a terminal or pipe).
+
+Usage:
+    python benchmarks/bench_logging.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_database
+
+use_database("bench_logging")
+
+import httpx
+
+from app import cache, logging_config
+from app.database import async_engine, engine
+from app.main import app
+from benchmarks.datagen import seed_database
+
+
+def configure_sync(stream):
+    """Old behaviour: format and write every line on the request path"""
+    logging_config.stop_logging()
+    logger = logging_config.logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel("DEBUG")
+
+
+async def run(n_requests, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for i in range(n_requests):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await client.get("/books/", params={"skip": i % 50, "limit": 10, "include_reviews": "false"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return n_requests / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--output", default=os.path.join(tempfile.gettempdir(), "bench_logging.log"))
+    args = parser.parse_args()
+
+    # Measure the handler path, not the cache
+    cache.r = None
+    seed_database(engine, args.books, reviews_per_book=0)
+
+    print(f"🔍 {args.requests} GET /books/ requests, concurrency {args.concurrency}, logging to {args.output}")
+    with open(args.output, "w", buffering=1) as stream:
+        modes = {
+            "sync-debug": lambda: configure_sync(stream),
+            "queue-debug": lambda: logging_config.configure_logging(level="DEBUG", stream=stream),
+            "queue-info": lambda: logging_config.configure_logging(level="INFO", stream=stream),
+        }
+        for name, configure in modes.items():
+            configure()
+            await run(min(args.requests, 200), args.concurrency)  # warm up
+            rps = await run(args.requests, args.concurrency)
+            logging_config.stop_logging()
+            print(f"{name:<12} req/s={rps:9.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
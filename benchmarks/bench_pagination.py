@@ -0,0 +1,69 @@
+"""
+Offset vs keyset pagination benchmark for GET /books/
+
+Seeds a books table and times crud.get_books at increasing depths, once with
+skip=<depth> (OFFSET) and once seeking past the id at that depth (cursor).
+
+Usage:
+    python benchmarks/bench_pagination.py --books 200000
+    DATABASE_URL=postgresql://... python benchmarks/bench_pagination.py --no-seed
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_database
+
+use_database("bench_pagination")
+
+from sqlalchemy import func, select
+
+from app import crud, models
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from benchmarks.datagen import seed_database
+
+
+async def time_query(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-seed", action="store_true", help="use the existing data as-is")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed_database(engine, args.books, reviews_per_book=0)
+    with SessionLocal() as db:
+        total = db.scalar(select(func.count(models.Book.id)))
+        ids = [row[0] for row in db.execute(select(models.Book.id).order_by(models.Book.id))]
+
+    depths = [d for d in (0, 1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000) if d < total]
+    depths.append(max(0, total - args.limit))
+
+    print(f"🔍 {total} books, limit={args.limit}, median of {args.repeat} runs")
+    print(f"{'depth':>10}  {'offset ms':>10}  {'keyset ms':>10}  {'speedup':>8}")
+    async with AsyncSessionLocal() as db:
+        for depth in depths:
+            after_id = ids[depth - 1] if depth else None
+            offset_ms = await time_query(lambda: crud.get_books(db, skip=depth, limit=args.limit), args.repeat)
+            keyset_ms = await time_query(lambda: crud.get_books(db, limit=args.limit, after_id=after_id), args.repeat)
+            print(f"{depth:>10}  {offset_ms:>10.3f}  {keyset_ms:>10.3f}  {offset_ms / keyset_ms:>7.1f}x")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
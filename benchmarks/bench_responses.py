@@ -0,0 +1,94 @@
+"""
+CPU per request for large GET /books/ pages (books with nested reviews)
+
+Runs requests one at a time in-process (httpx + ASGITransport) and reports
+process CPU time per request and bytes sent, for:
+  baseline           response_model validation of ORM rows + FastAPI's
+                     default JSONResponse, no compression (the old handler)
+  miss identity      the app with the cache off, client without gzip
+  miss gzip          the app with the cache off, gzip-accepting client
+  hit gzip           cached page (in-memory Redis stand-in): stored gzip
+                     bytes sent as-is
+  hit identity       cached page unpacked for a client without gzip
+
+Usage:
+    python benchmarks/bench_responses.py --books 2000 --limit 500 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_database
+
+use_database("bench_responses")
+
+import fakeredis
+import httpx
+from fastapi import FastAPI
+
+from app import cache, crud, schemas
+from app.database import AsyncSessionLocal, async_engine, engine
+from app.logging_config import configure_logging
+from app.main import app
+from benchmarks.datagen import seed_database
+
+baseline = FastAPI()
+
+
+@baseline.get("/books/", response_model=list[schemas.Book])
+async def baseline_read_books(limit: int = 10):
+    async with AsyncSessionLocal() as db:
+        return await crud.get_books(db, skip=0, limit=limit)
+
+
+async def run(target, n_requests, limit, accept_encoding):
+    """(CPU ms per request, bytes on the wire per request)"""
+    transport = httpx.ASGITransport(app=target)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = {"Accept-Encoding": accept_encoding}
+        params = {"limit": limit}
+        (await client.get("/books/", params=params, headers=headers)).raise_for_status()  # warm up
+        sent = 0
+        start = time.process_time()
+        for _ in range(n_requests):
+            response = await client.get("/books/", params=params, headers=headers)
+            response.raise_for_status()
+            sent += response.num_bytes_downloaded
+        return (time.process_time() - start) / n_requests * 1000, sent // n_requests
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--reviews-per-book", type=float, default=5, help="mean; the actual counts are skewed")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING")
+    seed_database(engine, args.books, args.reviews_per_book)
+    fake = fakeredis.FakeAsyncRedis()
+
+    modes = [
+        ("baseline", baseline, None, "identity"),
+        ("miss identity", app, None, "identity"),
+        ("miss gzip", app, None, "gzip"),
+        ("hit gzip", app, fake, "gzip"),
+        ("hit identity", app, fake, "identity"),
+    ]
+    print(f"🔍 GET /books/?limit={args.limit} ({args.reviews_per_book} reviews per book), {args.requests} requests per mode")
+    print(f"{'mode':<14} {'CPU ms/req':>11} {'bytes/req':>10}")
+    for name, target, redis, accept_encoding in modes:
+        cache.r = redis
+        cpu_ms, sent = await run(target, args.requests, args.limit, accept_encoding)
+        print(f"{name:<14} {cpu_ms:>11.2f} {sent:>10}")
+    cache.r = None
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Sustained POST /reviews/ throughput, synchronous vs write-behind
+
+Keeps --concurrency requests in flight in-process (httpx + ASGITransport)
+for --requests reviews spread over --books books and reports accepted
+requests per second, then how long the worker takes to drain the backlog:
+  sync           each request inserts its review and invalidates the cache
+  queue disk     write-behind, reviews appended to the on-disk queue
+  queue redis    write-behind, reviews appended to a Redis stream (in-memory
+                 stand-in, so this is an upper bound for a real server)
+
+Usage:
+    python benchmarks/bench_review_queue.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_database
+
+use_database("bench_review_queue")
+
+import fakeredis
+import httpx
+from sqlalchemy import func, select
+
+from app import cache, models, review_queue
+from app.database import async_engine, engine
+from app.logging_config import configure_logging
+from app.main import app
+from benchmarks.datagen import seed_database
+
+
+async def post_reviews(n_requests, concurrency, n_books):
+    """Accepted requests per second with `concurrency` requests in flight"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        pending = iter(range(n_requests))
+
+        async def worker():
+            for i in pending:
+                response = await client.post(
+                    "/reviews/", params={"book_id": 1 + i % n_books},
+                    json={"content": f"Review {i}: worth reading", "rating": 1 + i % 5},
+                )
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return n_requests / (time.perf_counter() - start)
+
+
+async def drain_all():
+    """Seconds for the worker to store everything queued"""
+    start = time.perf_counter()
+    while await review_queue.drain():
+        pass
+    return time.perf_counter() - start
+
+
+async def count_reviews():
+    async with async_engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(models.Review))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING")
+    queue_dir = tempfile.mkdtemp()
+    modes = [
+        ("sync", False, None),
+        ("queue disk", True, None),
+        ("queue redis", True, fakeredis.FakeAsyncRedis()),
+    ]
+    print(f"🔍 POST /reviews/ x {args.requests}, {args.concurrency} in flight, {args.books} books")
+    print(f"{'mode':<12} {'accepted/s':>11} {'drain s':>8} {'stored':>7}")
+    for name, write_behind, redis in modes:
+        seed_database(engine, args.books, reviews_per_book=0)
+        cache.r = redis
+        review_queue.REVIEW_WRITE_BEHIND = write_behind
+        review_queue.redis_queue = None
+        review_queue.local_queue = review_queue.LocalReviewQueue(os.path.join(queue_dir, f"{name}.db"))
+        await review_queue.local_queue.create()
+
+        rate = await post_reviews(args.requests, args.concurrency, args.books)
+        drained = await drain_all() if write_behind else 0.0
+        print(f"{name:<12} {rate:>11.0f} {drained:>8.2f} {await count_reviews():>7}")
+        await review_queue.local_queue.close()
+    cache.r = None
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
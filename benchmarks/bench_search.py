@@ -0,0 +1,82 @@
+"""
+Full-text search latency benchmark for GET /books/search
+
+Seeds a books table through datagen.py (titles from a small vocabulary),
+then times search.search_books (uncached) for rare, common and multi-word
+queries. On SQLite the first query includes building the in-process index;
+on Postgres the GIN indexes come from create_all / the Alembic migration.
+
+Usage:
+    python benchmarks/bench_search.py --books 1000000
+    DATABASE_URL=postgresql://... python benchmarks/bench_search.py --no-seed
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile, use_database
+
+use_database("bench_search")
+
+from sqlalchemy import func, select, update
+
+from app import models, search
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from benchmarks.datagen import seed_database
+
+# Titles come from datagen.WORDS; seed() adds the rare word to one book in RARE_EVERY
+RARE_EVERY = 10_000
+QUERIES = {
+    "rare word": "tolkien",
+    "common word": "shadow",
+    "two words": "shadow river",
+    "three words": "winter iron crown",
+    "no match": "zzzz",
+}
+
+
+def seed(n_books):
+    """Seed through datagen, then give every RARE_EVERYth book the rare word"""
+    seed_database(engine, n_books, reviews_per_book=0)
+    with engine.begin() as conn:
+        conn.execute(
+            update(models.Book)
+            .where(models.Book.id % RARE_EVERY == 1)
+            .values(title=models.Book.title + " Tolkien")
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-seed", action="store_true", help="use the existing data as-is")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed(args.books)
+    with SessionLocal() as db:
+        total = db.scalar(select(func.count(models.Book.id)))
+
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        await search.search_books(db, "shadow", limit=args.limit)
+        print(f"🔍 {total} books on {db.bind.dialect.name}, first query (index warm-up) {(time.perf_counter() - start) * 1000:.0f} ms")
+        print(f"{'query':<14} {'results':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, q in QUERIES.items():
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                page = await search.search_books(db, q, limit=args.limit)
+                samples.append((time.perf_counter() - start) * 1000)
+            print(f"{name:<14} {len(page):>8} {percentile(samples, 50):>9.2f} {percentile(samples, 95):>9.2f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Cache serialization micro-benchmark for a 100-book page
+
+Compares encode/decode cost and payload size of the cached page in the
+formats we could store in Redis, and the cost of a cache hit that has to
+decode + re-validate versus one that returns the stored bytes as-is.
+
+Usage:
+    python benchmarks/bench_serialization.py --books 100 --reviews-per-book 5
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+
+from app import models, schemas
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def make_page(n_books, reviews_per_book):
+    books = []
+    for i in range(n_books):
+        book = models.Book(id=i + 1, title=f"Book title number {i}", author=f"Author {i % 97}")
+        book.reviews = [
+            models.Review(
+                id=i * reviews_per_book + j + 1,
+                content=f"Review {j}: a thoughtful paragraph about book {i} and why it is worth reading.",
+                rating=1 + (i + j) % 5,
+                book_id=i + 1,
+            )
+            for j in range(reviews_per_book)
+        ]
+        books.append(book)
+    return books
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=100)
+    parser.add_argument("--reviews-per-book", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_page(args.books, args.reviews_per_book)
+    page = schemas.dump_rows(schemas.BookList, rows)
+
+    codecs = [
+        ("json", lambda v: json.dumps(v).encode(), json.loads),
+        ("orjson", orjson.dumps, orjson.loads),
+    ]
+    if msgpack is not None:
+        codecs.append(("msgpack", msgpack.packb, msgpack.unpackb))
+
+    print(f"🔍 {args.books} books x {args.reviews_per_book} reviews")
+    print(f"{'format':<8}  {'encode µs':>10}  {'decode µs':>10}  {'bytes':>8}")
+    for name, dumps, loads in codecs:
+        data = dumps(page)
+        encode_us = bench(lambda: dumps(page), args.number)
+        decode_us = bench(lambda: loads(data), args.number)
+        print(f"{name:<8}  {encode_us:>10.1f}  {decode_us:>10.1f}  {len(data):>8}")
+
+    cached = orjson.dumps(page)
+    validate_us = bench(lambda: schemas.dump_rows(schemas.BookList, rows), args.number)
+    revalidate_us = bench(
+        lambda: orjson.dumps(schemas.BookList.dump_python(schemas.BookList.validate_python(orjson.loads(cached)))),
+        args.number,
+    )
+    print()
+    print(f"cache miss: validate ORM rows          {validate_us:>10.1f} µs")
+    print(f"cache hit:  decode + validate + encode {revalidate_us:>10.1f} µs")
+    print(f"cache hit:  stored bytes as-is         {0.0:>10.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
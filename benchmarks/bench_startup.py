@@ -0,0 +1,95 @@
+"""
+Cold start: time to import the app and to serve the first requests
+
+  import        `import app.main` in a fresh interpreter
+  first live    server process spawned -> first 200 from GET /health/live
+  first read    the first GET /books/ after that (pool and cache still cold
+                unless the lifespan warmed them)
+
+Each measurement is repeated --runs times and the median reported. With
+--server gunicorn the app is started through gunicorn.conf.py (app preloaded,
+workers forked) with --workers workers; uvicorn --workers spawns workers that
+each import the app.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --server gunicorn --workers 4
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import ROOT, database_url, free_port
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+
+
+def server_command(server, port, workers):
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+                "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    return [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+            "--log-level", "warning"]
+
+
+def time_import(env):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_first_requests(server, workers, env, timeout=30):
+    """(seconds to the first live response, seconds for the first GET /books/ after it)"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(server_command(server, port, workers), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while True:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"{server} did not answer within {timeout}s")
+                try:
+                    if client.get("/health/live").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            live = time.perf_counter() - start
+            read_start = time.perf_counter()
+            client.get("/books/").raise_for_status()
+            return live, time.perf_counter() - read_start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", database_url("bench_startup"))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    subprocess.run([sys.executable, "-c", "from app.database import Base, engine; import app.models; Base.metadata.create_all(engine)"],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+    imports = [time_import(env) for _ in range(args.runs)]
+    served = [time_first_requests(args.server, args.workers, env) for _ in range(args.runs)]
+    print(f"🔍 {args.server}, {args.workers} worker(s), median of {args.runs} runs")
+    print(f"import app.main   {statistics.median(imports) * 1000:8.1f} ms")
+    print(f"first live        {statistics.median(live for live, _ in served) * 1000:8.1f} ms")
+    print(f"first GET /books/ {statistics.median(read for _, read in served) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
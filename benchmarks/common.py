@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmark scripts
+
+Each script puts the repository root on sys.path (so `app` and `benchmarks`
+import whether it runs as `python benchmarks/x.py` or is imported by the
+tests), then calls use_database() before importing the app, so that without
+DATABASE_URL it gets its own SQLite file in the temp directory.
+"""
+import os
+import socket
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def database_url(name: str) -> str:
+    """URL of the SQLite file `name`.db in the temp directory"""
+    return f"sqlite:///{tempfile.gettempdir()}/{name}.db"
+
+
+def use_database(name: str):
+    """Point the app at database_url(name) unless DATABASE_URL is already set"""
+    os.environ.setdefault("DATABASE_URL", database_url(name))
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of samples, pct in 0-100"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port() -> int:
+    """A TCP port on 127.0.0.1 that nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,118 @@
+"""
+Synthetic books and reviews at a configurable scale
+
+Titles, authors and review text are drawn from a small vocabulary so search
+has something to match, review counts per book are skewed (a few popular
+books, a long tail with none or one) and ratings lean positive. Books are
+inserted with their rating aggregates already filled in, so listings, top
+rated and batch reads see the same data the write paths would produce. The
+same --seed always generates the same data.
+
+Usage:
+    python benchmarks/datagen.py --books 100000 --reviews-per-book 5
+    DATABASE_URL=postgresql://... python benchmarks/datagen.py --books 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_database
+
+use_database("bench_suite")
+
+from sqlalchemy import insert, text
+
+from app import models
+from app.database import Base
+
+WORDS = (
+    "river night garden empire silent winter stone letters ocean city shadow light house fire "
+    "glass summer memory storm iron forest journey secret kingdom paper mountain road star "
+    "promise harbor crown island machine widow orchard thunder lantern"
+).split()
+FIRST_NAMES = "Ada Ben Clara Dev Elena Farid Grace Hiro Ines Jonas Kira Luis Maya Noor Omar Priya".split()
+LAST_NAMES = "Adler Brooks Chen Duarte Eze Fischer Gupta Haddad Ivanova Jensen Kowalski Laurent".split()
+PHRASES = (
+    "could not put it down", "slow start but worth it", "beautifully written",
+    "the ending felt rushed", "characters stayed with me", "not for me", "a modern classic",
+)
+# Ratings lean positive, as they do on real review sites
+RATING_WEIGHTS = (0.05, 0.08, 0.17, 0.35, 0.35)
+
+
+def review_count(rng: random.Random, mean: float) -> int:
+    """Skewed count with the given mean: most books get a few reviews, some get many"""
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def generate(n_books: int, reviews_per_book: float, seed: int = 42, chunk: int = 5000):
+    """Yield (book rows, review rows) chunks with ids starting at 1 and aggregates filled in"""
+    rng = random.Random(seed)
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(max(1, n_books // 20))]
+    review_id = 0
+    for start in range(0, n_books, chunk):
+        books, reviews = [], []
+        for book_id in range(start + 1, min(start + chunk, n_books) + 1):
+            ratings = rng.choices(models.RATINGS, RATING_WEIGHTS, k=review_count(rng, reviews_per_book))
+            book = {
+                "id": book_id,
+                "title": " ".join(rng.sample(WORDS, rng.randint(2, 5))).title(),
+                "author": rng.choice(authors),
+                "review_count": len(ratings),
+                "rating_sum": sum(ratings),
+                "average_rating": sum(ratings) / len(ratings) if ratings else None,
+            }
+            for rating in models.RATINGS:
+                book[f"rating_{rating}_count"] = ratings.count(rating)
+            books.append(book)
+            for rating in ratings:
+                review_id += 1
+                reviews.append({
+                    "id": review_id,
+                    "book_id": book_id,
+                    "rating": rating,
+                    "content": f"{rng.choice(PHRASES).capitalize()}. " + " ".join(rng.choices(WORDS, k=rng.randint(8, 40))),
+                })
+        yield books, reviews
+
+
+def seed_database(engine, n_books: int, reviews_per_book: float, seed: int = 42, chunk: int = 5000):
+    """Recreate the schema on a sync engine and fill it; returns (books, reviews) inserted"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    n_reviews = 0
+    with engine.begin() as conn:
+        for books, reviews in generate(n_books, reviews_per_book, seed, chunk):
+            conn.execute(insert(models.Book), books)
+            if reviews:
+                conn.execute(insert(models.Review), reviews)
+            n_reviews += len(reviews)
+        if engine.dialect.name == "postgresql":
+            # Ids were given explicitly, so move the sequences past them for the POST endpoints
+            for table in ("books", "reviews"):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+                ))
+    return n_books, n_reviews
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--reviews-per-book", type=float, default=5, help="mean; the actual counts are skewed")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    start = time.perf_counter()
+    books, reviews = seed_database(engine, args.books, args.reviews_per_book, args.seed)
+    print(f"🌱 {books} books, {reviews} reviews into {engine.url.render_as_string()} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
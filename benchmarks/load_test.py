@@ -0,0 +1,258 @@
+"""
+Load test for the API's hot paths, with a baseline regression check
+
+Seeds synthetic data (see datagen.py), then runs each scenario with
+--concurrency requests in flight until --requests have completed, and
+reports throughput and p50/p95/p99 latency. Every scenario runs twice:
+  cold   the cache is flushed first
+  warm   after an unmeasured pass over the same requests
+Scenarios:
+  books          GET /books/?skip=...&limit=20
+  book           GET /books/{id}
+  books_batch    GET /books/?ids=... (a shelf of 20 books)
+  reviews        GET /reviews/{book_id}
+  create_book    POST /books/
+  create_review  POST /reviews/?book_id=...
+
+Requests run in-process (httpx + ASGITransport) unless --url points at a
+running server. The cache is an in-memory Redis stand-in by default;
+--redis real uses the REDIS_* settings and --redis off disables it.
+
+Save a run with --save and compare later runs with --baseline. A run fails
+(exit status 1) when a scenario's p50 or p95 is more than --threshold slower
+than the baseline, and also more than --min-delta-ms slower, which filters
+out noise on very fast paths.
+
+Usage:
+    python benchmarks/load_test.py --books 10000 --save baseline.json
+    python benchmarks/load_test.py --books 10000 --baseline baseline.json --threshold 0.2
+    python benchmarks/load_test.py --url http://localhost:8000 --redis real --no-seed --scenarios books,reviews
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile, use_database
+
+use_database("bench_suite")
+
+import fakeredis
+import httpx
+
+from app import cache
+from app.database import async_engine, engine
+from app.logging_config import configure_logging
+from app.main import app
+from benchmarks.datagen import seed_database
+
+CACHE_MODES = ("cold", "warm")
+# Latency percentiles checked against the baseline (p99 is too noisy at these sample sizes)
+COMPARED = ("p50", "p95")
+
+
+def books_page(rng, n_books):
+    return "GET", "/books/", {"params": {"skip": rng.randrange(max(1, n_books - 20)), "limit": 20}}
+
+
+def one_book(rng, n_books):
+    return "GET", f"/books/{rng.randint(1, n_books)}", {}
+
+
+def books_batch(rng, n_books):
+    ids = rng.sample(range(1, n_books + 1), min(20, n_books))
+    return "GET", "/books/", {"params": {"ids": ",".join(map(str, ids))}}
+
+
+def book_reviews(rng, n_books):
+    return "GET", f"/reviews/{rng.randint(1, n_books)}", {}
+
+
+def create_book(rng, n_books):
+    return "POST", "/books/", {"json": {"title": f"Load test {rng.random():.8f}", "author": "Bench"}}
+
+
+def create_review(rng, n_books):
+    review = {"content": "Written by the load test", "rating": rng.randint(1, 5)}
+    return "POST", "/reviews/", {"params": {"book_id": rng.randint(1, n_books)}, "json": review}
+
+
+SCENARIOS = {
+    "books": books_page,
+    "book": one_book,
+    "books_batch": books_batch,
+    "reviews": book_reviews,
+    "create_book": create_book,
+    "create_review": create_review,
+}
+
+
+def summarize(latencies_ms, wall_seconds, errors):
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "rps": round(len(latencies_ms) / wall_seconds, 1),
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+        "mean": round(statistics.mean(latencies_ms), 3),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_delta_ms: float) -> list:
+    """Regressions of current against baseline results ({"books/warm": summary, ...}), as messages"""
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in COMPARED:
+            old, new = before[metric], result[metric]
+            if new > old * (1 + threshold) and new - old > min_delta_ms:
+                regressions.append(f"{name} {metric} {old:.2f}ms -> {new:.2f}ms (+{(new - old) / old:.0%})")
+    return regressions
+
+
+async def run_requests(client, requests, concurrency):
+    """Send requests with `concurrency` in flight; returns a summary"""
+    latencies, errors = [], 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for method, url, kwargs in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def flush_cache(redis):
+    """Empty Redis and this process's local tier (a remote server keeps its own for LOCAL_CACHE_TTL)"""
+    cache.local_cache.clear()
+    if redis is not None:
+        await redis.flushdb()
+
+
+async def run_suite(client, scenarios, n_books, n_requests, concurrency, redis, seed=0):
+    results = {}
+    for name in scenarios:
+        make_request = SCENARIOS[name]
+        rng = random.Random(f"{seed}-{name}")
+        requests = [make_request(rng, n_books) for _ in range(n_requests)]
+        for mode in CACHE_MODES:
+            await flush_cache(redis)
+            if mode == "warm":
+                await run_requests(client, requests, concurrency)
+            results[f"{name}/{mode}"] = result = await run_requests(client, requests, concurrency)
+            print(
+                f"{name:<14} {mode:<5} {result['rps']:>9.1f} {result['p50']:>9.2f} {result['p95']:>9.2f} "
+                f"{result['p99']:>9.2f} {result['errors']:>7}"
+            )
+    return results
+
+
+def make_client(url, concurrency):
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=30, limits=httpx.Limits(max_connections=concurrency))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+
+
+def make_redis(kind):
+    return {"fake": fakeredis.FakeAsyncRedis, "real": cache.make_redis, "off": lambda: None}[kind]()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=10_000, help="books to seed (with --no-seed: books already there)")
+    parser.add_argument("--reviews-per-book", type=float, default=5)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per scenario and cache mode")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--url", help="load test a running server instead of the app in-process")
+    parser.add_argument("--redis", choices=("fake", "real", "off"), default="fake")
+    parser.add_argument("--no-seed", action="store_true", help="use the existing data as-is")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --save to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.url and args.redis == "fake":
+        parser.error("--url needs --redis real (to flush the server's cache) or --redis off")
+
+    configure_logging(level="WARNING")
+    if not args.no_seed:
+        books, reviews = seed_database(engine, args.books, args.reviews_per_book)
+        print(f"🌱 seeded {books} books, {reviews} reviews")
+
+    redis = make_redis(args.redis)
+    if not args.url:
+        cache.r = redis
+    target = args.url or f"in-process, {engine.dialect.name}"
+    print(f"🔍 {target}, redis {args.redis}, {args.requests} requests per run, {args.concurrency} in flight")
+    print(f"{'scenario':<14} {'cache':<5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    try:
+        async with make_client(args.url, args.concurrency) as client:
+            results = await run_suite(client, scenarios, args.books, args.requests, args.concurrency, redis)
+    finally:
+        cache.r = None
+        if redis is not None:
+            await redis.aclose()
+        await async_engine.dispose()
+
+    run = {
+        "meta": {
+            "target": target,
+            "redis": args.redis,
+            "books": args.books,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 results saved to {args.save}")
+
+    failed = sum(result["errors"] for result in results.values())
+    if failed:
+        print(f"❌ {failed} requests failed")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = {key for key in ("target", "books", "concurrency") if baseline["meta"].get(key) != run["meta"][key]}
+        if changed:
+            print(f"⚠️  baseline was run with different {', '.join(sorted(changed))}")
+        regressions = compare(baseline["results"], results, args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f"❌ regression: {regression}")
+        if not regressions:
+            print(f"✅ no regressions beyond {args.threshold:.0%} against {args.baseline}")
+        failed += len(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,39 @@
+"""
+Production entry point: gunicorn managing uvicorn workers
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+The app is imported once in the master and the workers are forked from it
+(preload_app), so each worker starts without re-importing FastAPI,
+SQLAlchemy and the routers. Nothing connects at import time: every worker
+opens its own database pools and Redis client in main.lifespan after the
+fork, and warms them before taking traffic.
+
+Database connections: each worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW
+connections (plus as many per read replica), so keep
+workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's max_connections.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+# Requests are async and mostly wait on Postgres and Redis, so one worker per
+# core keeps every core busy; more workers only add connections
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+preload_app = True
+
+# Longer than a load balancer's idle timeout, so it never reuses a connection
+# we have just closed
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+# A worker whose event loop is blocked this long is killed and replaced
+timeout = int(os.getenv("WORKER_TIMEOUT", "30"))
+# In-flight requests get this long to finish on shutdown or reload
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Recycle workers now and then (jittered, so they don't all restart together)
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "INFO").lower()
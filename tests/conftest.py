@@ -0,0 +1,116 @@
+from collections import Counter
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import cache, database, metrics, warmer
+from app.database import Base, get_db, to_async_url
+from app.main import app
+
+
+# Module globals of app.database set up by init_engines
+ENGINE_GLOBALS = (
+    "engine", "SessionLocal", "async_engine", "AsyncSessionLocal",
+    "replica_engines", "ReplicaSessionLocals", "engines_ready",
+    "DATABASE_URL", "ASYNC_DATABASE_URL", "REPLICA_DATABASE_URLS",
+)
+
+
+def point_engines_at(url):
+    """Make the next init_engines() connect to `url` instead of the configured database"""
+    database.DATABASE_URL = url
+    database.ASYNC_DATABASE_URL = to_async_url(url)
+    database.REPLICA_DATABASE_URLS = []
+    database.engines_ready = False
+
+
+@pytest.fixture(autouse=True, scope="session")
+def default_database(tmp_path_factory):
+    """Engines the app creates on its own use a throwaway SQLite file, never DATABASE_URL"""
+    url = f"sqlite:///{tmp_path_factory.mktemp('db') / 'default.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    point_engines_at(url)
+    return url
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+@pytest.fixture
+def sync_engine(db_url):
+    """Sync engine on a throwaway SQLite file, used to seed test data"""
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def app_engines(sync_engine, db_url):
+    """The app's own engines (lifespan probe, pool warming, background sessions) on the test database"""
+    # vars() rather than getattr: reading a missing engine would create it
+    saved = {name: vars(database)[name] for name in ENGINE_GLOBALS if name in vars(database)}
+    point_engines_at(db_url)
+    database.init_engines()
+    try:
+        yield database
+    finally:
+        database.engine.dispose()
+        for name in ENGINE_GLOBALS:
+            if name in saved:
+                setattr(database, name, saved[name])
+            else:
+                vars(database).pop(name, None)
+
+
+@pytest.fixture
+def statements():
+    """SQL statements issued by the app during a test"""
+    return []
+
+
+@pytest.fixture
+def client(app_engines, db_url, statements, monkeypatch):
+    """TestClient bound to the throwaway database, with the Redis cache switched off"""
+    async_engine = create_async_engine(to_async_url(db_url))
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    metrics.instrument_engine(async_engine)
+    TestingSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with TestingSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    # Background cache refreshes open their own sessions; app_engines puts the original back
+    database.AsyncSessionLocal = TestingSessionLocal
+    monkeypatch.setattr(cache, "r", None)
+    monkeypatch.setattr(cache, "REDIS_ENABLED", False)
+    monkeypatch.setattr(warmer, "CACHE_WARM_ENABLED", False)
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+            test_client.portal.call(async_engine.dispose)
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def redis_cache(client, monkeypatch):
+    """In-memory stand-in for Redis behind app.cache"""
+    fake = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(cache, "r", fake)
+    monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+    monkeypatch.setattr(cache, "stats", Counter())
+    return fake
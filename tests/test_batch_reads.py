@@ -0,0 +1,167 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app import cache, crud, models
+
+
+def seed(engine, n_books=3):
+    """Books with i + 1 reviews each"""
+    with Session(engine) as db:
+        books = []
+        for i in range(n_books):
+            book = models.Book(title=f"Book {i}", author="Someone")
+            book.reviews = [models.Review(content=f"Review {j} of {i}", rating=5) for j in range(i + 1)]
+            books.append(book)
+        db.add_all(books)
+        db.commit()
+        return [book.id for book in books]
+
+
+@pytest.fixture
+def round_trips(redis_cache):
+    """Number of Redis round trips (commands or pipelines) made by the app"""
+    pool = redis_cache.connection_pool
+    get_connection = pool.get_connection
+    calls = []
+
+    async def counting_get_connection(*args, **kwargs):
+        calls.append(args)
+        return await get_connection(*args, **kwargs)
+
+    pool.get_connection = counting_get_connection
+    return calls
+
+
+class TestSingleBook:
+    def test_read_book(self, client, sync_engine):
+        first, _, _ = seed(sync_engine)
+        response = client.get(f"/books/{first}")
+        assert response.status_code == 200
+        book = response.json()
+        assert book["title"] == "Book 0"
+        assert [review["content"] for review in book["reviews"]] == ["Review 0 of 0"]
+        assert response.headers["ETag"]
+
+    def test_embedded_reviews_capped(self, client, sync_engine, monkeypatch):
+        monkeypatch.setattr(crud, "BOOK_REVIEWS_LIMIT", 3)
+        _, first, _, fourth = seed(sync_engine, n_books=4)
+        book = client.get(f"/books/{fourth}").json()
+        assert [review["content"] for review in book["reviews"]] == [f"Review {j} of 3" for j in range(3)]
+        batch = client.get(f"/books/?ids={fourth},{first}").json()
+        assert [len(book["reviews"]) for book in batch] == [3, 2]
+
+    def test_unknown_book(self, client, sync_engine):
+        assert client.get("/books/999").status_code == 404
+
+    def test_other_book_routes_still_resolve(self, client, sync_engine):
+        assert client.get("/books/test").status_code == 200
+        assert client.get("/books/top-rated").status_code == 200
+
+
+class TestBatchBooks:
+    def test_order_duplicates_and_unknown_ids(self, client, sync_engine):
+        first, second, third = seed(sync_engine)
+        response = client.get(f"/books/?ids={third},999,{first},{third}")
+        assert response.status_code == 200
+        assert [book["id"] for book in response.json()] == [third, first]
+        assert len(response.json()[0]["reviews"]) == 3
+
+    def test_unslashed_path(self, client, sync_engine):
+        first, second, _ = seed(sync_engine)
+        assert [book["id"] for book in client.get(f"/books?ids={second},{first}").json()] == [second, first]
+
+    def test_projection(self, client, sync_engine, redis_cache):
+        first, second, _ = seed(sync_engine)
+        response = client.get(f"/books/?ids={first},{second}&fields=title")
+        assert response.json() == [{"id": first, "title": "Book 0"}, {"id": second, "title": "Book 1"}]
+
+    @pytest.mark.parametrize("ids", ["", "1,x", ",".join(str(i) for i in range(1, 102))])
+    def test_invalid_ids(self, client, ids):
+        assert client.get(f"/books/?ids={ids}").status_code == 422
+
+    def test_round_trips(self, client, sync_engine, statements, round_trips):
+        first, second, third = seed(sync_engine)
+
+        # Cold: one MGET, one IN (...) query, one pipelined write-back
+        client.get(f"/books/?ids={first},{second}")
+        assert len(round_trips) == 2
+        assert len(statements) == 1
+        assert " IN (" in statements[0]
+
+        # Warm in Redis only: a single MGET, no SQL
+        cache.local_cache.clear()
+        round_trips.clear()
+        statements.clear()
+        response = client.get(f"/books/?ids={second},{first}")
+        assert [book["id"] for book in response.json()] == [second, first]
+        assert len(round_trips) == 1
+        assert statements == []
+
+        # Partly cached: only the miss is queried and written back
+        cache.local_cache.clear()
+        round_trips.clear()
+        response = client.get(f"/books/?ids={first},{second},{third}")
+        assert [book["id"] for book in response.json()] == [first, second, third]
+        assert len(round_trips) == 2
+        assert len(statements) == 1
+
+        # Held in the local tier: no round trips at all
+        round_trips.clear()
+        statements.clear()
+        client.get(f"/books/?ids={first},{second},{third}")
+        assert round_trips == []
+        assert statements == []
+
+    def test_single_and_batch_share_entries(self, client, sync_engine, statements, redis_cache):
+        first, second, _ = seed(sync_engine)
+        client.get(f"/books/?ids={first},{second}")
+        statements.clear()
+        assert client.get(f"/books/{second}").json()["title"] == "Book 1"
+        assert statements == []
+
+    def test_new_review_invalidates_its_book(self, client, sync_engine, redis_cache):
+        first, second, _ = seed(sync_engine)
+        before = client.get(f"/books/?ids={first},{second}").json()
+        client.post(f"/reviews/?book_id={first}", json={"content": "Fresh", "rating": 1})
+
+        after = client.get(f"/books/?ids={first},{second}").json()
+        assert after[0]["review_count"] == before[0]["review_count"] + 1
+        assert after[0]["reviews"][-1]["content"] == "Fresh"
+        assert after[1] == before[1]
+
+
+class TestBatchReviews:
+    def test_first_page_per_book(self, client, sync_engine):
+        first, second, third = seed(sync_engine)
+        response = client.get(f"/reviews/?book_ids={third},{first},999&limit=2")
+        assert response.status_code == 200
+        assert [(page["book_id"], [review["content"] for review in page["reviews"]]) for page in response.json()] == [
+            (third, ["Review 0 of 2", "Review 1 of 2"]),
+            (first, ["Review 0 of 0"]),
+            (999, []),
+        ]
+
+    def test_invalid_params(self, client):
+        assert client.get("/reviews/?book_ids=a").status_code == 422
+        assert client.get("/reviews/?book_ids=1&limit=0").status_code == 422
+
+    def test_round_trips(self, client, sync_engine, statements, round_trips):
+        ids = ",".join(str(book_id) for book_id in seed(sync_engine))
+        client.get(f"/reviews/?book_ids={ids}")
+        assert len(round_trips) == 2
+        assert len(statements) == 1
+
+        cache.local_cache.clear()
+        round_trips.clear()
+        statements.clear()
+        assert len(client.get(f"/reviews/?book_ids={ids}").json()) == 3
+        assert len(round_trips) == 1
+        assert statements == []
+
+    def test_new_review_invalidates(self, client, sync_engine, redis_cache):
+        first, second, _ = seed(sync_engine)
+        client.get(f"/reviews/?book_ids={first},{second}")
+        client.post(f"/reviews/?book_id={first}", json={"content": "Fresh", "rating": 1})
+        pages = client.get(f"/reviews/?book_ids={first},{second}").json()
+        assert [review["content"] for review in pages[0]["reviews"]] == ["Review 0 of 0", "Fresh"]
+        assert len(pages[1]["reviews"]) == 2
@@ -0,0 +1,43 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from benchmarks import datagen, load_test
+
+
+def result(p50, p95):
+    return {"requests": 100, "errors": 0, "rps": 100.0, "p50": p50, "p95": p95, "p99": p95, "mean": p50}
+
+
+class TestBenchmarkSuite:
+    def test_generated_aggregates_match_reviews(self, sync_engine):
+        books, reviews = datagen.seed_database(sync_engine, 200, 3, seed=7)
+        with Session(sync_engine) as db:
+            assert db.scalar(select(func.count()).select_from(models.Review)) == reviews
+            assert db.scalar(select(func.sum(models.Book.review_count))) == reviews
+            for book in db.scalars(select(models.Book).filter(models.Book.review_count > 0).limit(20)):
+                ratings = db.scalars(select(models.Review.rating).filter_by(book_id=book.id)).all()
+                assert book.rating_sum == sum(ratings)
+                assert book.average_rating == sum(ratings) / len(ratings)
+                assert sum(book.rating_histogram.values()) == len(ratings)
+
+    def test_generation_is_deterministic(self):
+        assert list(datagen.generate(50, 2, seed=1)) == list(datagen.generate(50, 2, seed=1))
+        assert list(datagen.generate(50, 2, seed=1)) != list(datagen.generate(50, 2, seed=2))
+
+    def test_summary_percentiles(self):
+        summary = load_test.summarize([float(ms) for ms in range(1, 101)], wall_seconds=2, errors=1)
+        assert summary["rps"] == 50
+        assert (summary["p50"], summary["p95"], summary["p99"]) == (51, 95, 99)
+
+    def test_compare_flags_only_real_regressions(self):
+        baseline = {"books/warm": result(10, 20), "book/warm": result(0.2, 0.4), "reviews/cold": result(30, 40)}
+        current = {
+            "books/warm": result(11, 30),      # p95 +50%
+            "book/warm": result(0.4, 0.8),     # doubled, but within the noise floor
+            "reviews/cold": result(29, 41),    # within the threshold
+            "create_book/cold": result(5, 9),  # not in the baseline
+        }
+        assert load_test.compare(baseline, current, threshold=0.2, min_delta_ms=1) == [
+            "books/warm p95 20.00ms -> 30.00ms (+50%)"
+        ]
@@ -0,0 +1,252 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import bulk, cache, models
+from app.main import app
+from app.pagination import MAX_PAGE_SIZE, encode_cursor
+
+
+def seed_books(engine, count, reviews_per_book=2):
+    with Session(engine) as db:
+        for i in range(count):
+            book = models.Book(title=f"Book {i}", author=f"Author {i}")
+            book.reviews = [
+                models.Review(content=f"Review {j}", rating=1 + j % 5)
+                for j in range(reviews_per_book)
+            ]
+            db.add(book)
+        db.commit()
+
+
+def select_statements(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+class TestBookListQueries:
+    def test_page_with_reviews_uses_two_queries(self, client, sync_engine, statements):
+        """A 100-book page loads all reviews in one batched query, not one per book"""
+        seed_books(sync_engine, 100)
+        response = client.get("/books/?limit=100")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 100
+        assert all(len(book["reviews"]) == 2 for book in data)
+        assert len(select_statements(statements)) == 2
+
+    def test_include_reviews_false_skips_reviews_table(self, client, sync_engine, statements):
+        seed_books(sync_engine, 20)
+        response = client.get("/books/?limit=20&include_reviews=false")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 20
+        assert set(data[0]) == {"id", "title", "author", "review_count", "average_rating"}
+        selects = select_statements(statements)
+        assert len(selects) == 1
+        assert "reviews" not in selects[0]
+
+    def test_fields_projection(self, client, sync_engine, statements):
+        seed_books(sync_engine, 5)
+        response = client.get("/books/?fields=id,title")
+        assert response.status_code == 200
+        assert response.json()[0] == {"id": 1, "title": "Book 0"}
+        assert len(select_statements(statements)) == 1
+
+    def test_fields_projection_with_reviews(self, client, sync_engine, statements):
+        seed_books(sync_engine, 5)
+        response = client.get("/books/?fields=title,reviews")
+        assert response.status_code == 200
+        book = response.json()[0]
+        assert set(book) == {"id", "title", "reviews"}
+        assert len(book["reviews"]) == 2
+        assert len(select_statements(statements)) == 2
+
+    def test_unknown_field_rejected(self, client):
+        response = client.get("/books/?fields=id,isbn")
+        assert response.status_code == 422
+
+
+class TestBookCursorPagination:
+    def test_walk_all_pages_with_cursor(self, client, sync_engine):
+        seed_books(sync_engine, 25, reviews_per_book=0)
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 10}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/books/", params=params)
+            assert response.status_code == 200
+            seen.extend(book["id"] for book in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        assert seen == list(range(1, 26))
+
+    def test_cursor_seeks_instead_of_offset(self, client, sync_engine, statements):
+        seed_books(sync_engine, 15, reviews_per_book=0)
+        first = client.get("/books/?limit=10")
+        statements.clear()
+        response = client.get("/books/", params={"limit": 10, "cursor": first.headers["X-Next-Cursor"]})
+        assert [book["id"] for book in response.json()] == list(range(11, 16))
+        assert "X-Next-Cursor" not in response.headers
+        assert "books.id >" in select_statements(statements)[0]
+
+    def test_cursor_with_projection(self, client, sync_engine):
+        seed_books(sync_engine, 4, reviews_per_book=0)
+        first = client.get("/books/?limit=2&fields=title")
+        assert first.json() == [{"id": 1, "title": "Book 0"}, {"id": 2, "title": "Book 1"}]
+        response = client.get("/books/", params={"limit": 2, "fields": "title", "cursor": first.headers["X-Next-Cursor"]})
+        assert [book["id"] for book in response.json()] == [3, 4]
+
+    def test_invalid_cursor(self, client):
+        response = client.get("/books/?cursor=not-a-cursor")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("book_id", [10**30, 2**63, -2**63 - 1, True, 1.5])
+    def test_cursor_id_out_of_range(self, client, book_id):
+        response = client.get("/books/", params={"cursor": encode_cursor({"id": book_id})})
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("path", ["/books/", "/books/search?q=book", "/books/top-rated"])
+    @pytest.mark.parametrize("limit", [-1, 0, MAX_PAGE_SIZE + 1])
+    def test_limit_out_of_range(self, client, path, limit):
+        assert client.get(path, params={"limit": limit}).status_code == 422
+
+    def test_negative_skip(self, client):
+        assert client.get("/books/?skip=-1").status_code == 422
+
+
+class TestBookListCache:
+    def test_cache_hit_serves_stored_bytes(self, client, redis_cache, sync_engine, statements):
+        seed_books(sync_engine, 12)
+        first = client.get("/books/?limit=10")
+        assert first.status_code == 200
+        statements.clear()
+
+        second = client.get("/books/?limit=10")
+        assert second.status_code == 200
+        assert second.content == first.content
+        assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+        assert statements == []
+
+    def test_create_book_invalidates_first_page(self, client, redis_cache, sync_engine):
+        seed_books(sync_engine, 3)
+        assert len(client.get("/books/").json()) == 3
+        client.post("/books/", json={"title": "New", "author": "Someone"})
+        assert len(client.get("/books/").json()) == 4
+
+    def test_create_book_invalidates_every_page(self, client, redis_cache, sync_engine):
+        seed_books(sync_engine, 5)
+        pages = ["/books/?limit=2", "/books/?skip=2&limit=2", "/books/?limit=50", "/books/?fields=title"]
+        for page in pages:
+            client.get(page)
+        cursor = client.get("/books/?limit=4").headers["X-Next-Cursor"]
+        client.get("/books/", params={"limit": 4, "cursor": cursor})
+        assert len(client.portal.call(redis_cache.keys, "books_*")) == 6
+
+        client.post("/books/", json={"title": "New", "author": "Someone"})
+        assert client.portal.call(redis_cache.keys, "books_*") == []
+        assert len(client.get("/books/?limit=50").json()) == 6
+        assert client.get("/books/?fields=title").json()[-1] == {"id": 6, "title": "New"}
+        assert [b["id"] for b in client.get("/books/", params={"limit": 4, "cursor": cursor}).json()] == [5, 6]
+
+
+class TestBookListStampede:
+    def test_burst_of_misses_runs_one_query(self, client, redis_cache, sync_engine, statements):
+        """500 concurrent requests for a cold page cost one page fetch, not 500"""
+        seed_books(sync_engine, 20)
+
+        async def burst():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await asyncio.gather(*(http.get("/books/?limit=10") for _ in range(500)))
+
+        responses = client.portal.call(burst)
+        assert all(response.status_code == 200 for response in responses)
+        assert len({response.content for response in responses}) == 1
+        # books page + its batched reviews
+        assert len(select_statements(statements)) == 2
+
+    def test_stale_page_served_while_refreshing(self, client, redis_cache, sync_engine, monkeypatch):
+        seed_books(sync_engine, 2)
+        assert len(client.get("/books/").json()) == 2
+        # A write that bypassed the API, so nothing was invalidated
+        seed_books(sync_engine, 1)
+
+        real_time = time.time
+        monkeypatch.setattr(time, "time", lambda: real_time() + cache.CACHE_TTL + 1)
+        assert len(client.get("/books/").json()) == 2
+
+        for _ in range(100):
+            if not cache.inflight:
+                break
+            client.portal.call(asyncio.sleep, 0.01)
+        monkeypatch.setattr(time, "time", real_time)
+        assert len(client.get("/books/").json()) == 3
+        assert cache.stats["stale_served"] == 1
+        assert cache.stats["refreshes"] == 1
+
+
+class TestBulkBooks:
+    def test_json_array_with_invalid_rows(self, client, monkeypatch):
+        monkeypatch.setattr(bulk, "BULK_CHUNK_SIZE", 2)
+        rows = [
+            {"title": "A", "author": "X"},
+            {"title": "B"},
+            {"title": "C", "author": "Y"},
+            {"title": "D", "author": "Z"},
+        ]
+        response = client.post("/books/bulk", json=rows)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["inserted"] == 3
+        assert data["ids"] == [1, None, 2, 3]
+        assert [error["index"] for error in data["errors"]] == [1]
+        assert [book["title"] for book in client.get("/books/").json()] == ["A", "C", "D"]
+
+    def test_ndjson_stream(self, client):
+        lines = [b'{"title": "A", "author": "X"}', b"{not json", b'{"title": "B", "author": "Y"}']
+
+        def body():
+            # Split mid-line to exercise the streaming parser
+            payload = b"\n".join(lines) + b"\n"
+            yield payload[:7]
+            yield payload[7:]
+
+        response = client.post("/books/bulk", content=body(), headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["ids"] == [1, None, 2]
+        assert data["errors"][0]["index"] == 1
+
+    def test_body_must_be_array(self, client):
+        response = client.post("/books/bulk", json={"title": "A", "author": "X"})
+        assert response.status_code == 400
+
+    def test_invalidates_cache_once(self, client, redis_cache, sync_engine):
+        seed_books(sync_engine, 2)
+        client.get("/books/")
+        client.post("/books/bulk", json=[{"title": f"T{i}", "author": "A"} for i in range(5)])
+        assert len(client.get("/books/").json()) == 7
+
+
+class TestBulkChunkFallback:
+    def test_failed_chunk_retried_row_by_row(self):
+        class FakeSession:
+            async def commit(self):
+                pass
+
+            async def rollback(self):
+                pass
+
+        async def insert_chunk(db, rows):
+            if "bad" in rows:
+                raise IntegrityError("INSERT", {}, Exception("constraint failed"))
+            return [len(row) for row in rows]
+
+        outcomes = asyncio.run(bulk.insert_chunk_or_rows(FakeSession(), insert_chunk, ["a", "bad", "ccc"]))
+        assert outcomes == [1, "constraint failed", 3]
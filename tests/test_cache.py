@@ -0,0 +1,174 @@
+import asyncio
+import time
+from collections import Counter
+
+import fakeredis
+
+from app import cache
+
+
+class TestLocalCache:
+    def test_evicts_least_recently_used(self):
+        local = cache.LocalCache(max_entries=2, ttl=60)
+        local.set("a", b"1")
+        local.set("b", b"2")
+        assert local.get("a") == b"1"
+        local.set("c", b"3")
+        assert local.get("b") is None
+        assert local.get("a") == b"1"
+        assert local.get("c") == b"3"
+
+    def test_entries_expire(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+        local = cache.LocalCache(max_entries=10, ttl=5)
+        local.set("a", b"1")
+        local.set("b", b"2", ex=1)
+        now[0] += 2
+        assert local.get("a") == b"1"
+        assert local.get("b") is None
+        now[0] += 4
+        assert local.get("a") is None
+
+
+class TestTwoTierCache:
+    def test_hit_counters_per_tier(self, monkeypatch):
+        monkeypatch.setattr(cache, "r", fakeredis.FakeAsyncRedis())
+        monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+        monkeypatch.setattr(cache, "stats", Counter())
+
+        async def scenario():
+            assert await cache.get_raw("books_0_10") is None
+            await cache.r.set("books_0_10", b"[1]")
+            assert await cache.get_raw("books_0_10") == b"[1]"
+            assert await cache.get_raw("books_0_10") == b"[1]"
+
+        asyncio.run(scenario())
+        report = cache.cache_stats()
+        assert report["local"]["hits"] == 1
+        assert report["local"]["misses"] == 2
+        assert report["redis"]["hits"] == 1
+        assert report["redis"]["misses"] == 1
+
+    def test_invalidation_reaches_other_workers(self, monkeypatch):
+        server = fakeredis.FakeServer()
+        worker_a = fakeredis.FakeAsyncRedis(server=server)
+        worker_b = fakeredis.FakeAsyncRedis(server=server)
+        local_b = cache.LocalCache()
+        monkeypatch.setattr(cache, "r", worker_a)
+        monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+
+        async def scenario():
+            listener = asyncio.create_task(cache.listen_for_invalidations(worker_b, local_b))
+            await asyncio.sleep(0.05)
+            local_b.set("reviews_1", b"stale")
+            local_b.set("reviews_2", b"fresh")
+
+            await cache.set_raw("reviews_1", b"stale", tags=[cache.reviews_tag(1)])
+            await cache.invalidate_tags(cache.reviews_tag(1))
+            for _ in range(50):
+                if local_b.get("reviews_1") is None:
+                    break
+                await asyncio.sleep(0.01)
+            listener.cancel()
+
+        asyncio.run(scenario())
+        assert local_b.get("reviews_1") is None
+        assert local_b.get("reviews_2") == b"fresh"
+
+
+class TestStampedeProtection:
+    def test_single_flight_shares_one_call(self):
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "page"
+
+        async def scenario():
+            return await asyncio.gather(*(cache.single_flight("books_0_10", slow) for _ in range(50)))
+
+        assert asyncio.run(scenario()) == ["page"] * 50
+        assert len(calls) == 1
+        assert cache.inflight == {}
+
+    def test_waits_for_worker_holding_lock(self, monkeypatch):
+        server = fakeredis.FakeServer()
+        this_worker = fakeredis.FakeAsyncRedis(server=server)
+        other_worker = fakeredis.FakeAsyncRedis(server=server)
+        monkeypatch.setattr(cache, "r", this_worker)
+        monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+        calls = []
+
+        async def compute(db):
+            calls.append(db)
+            return b"[]", {}, []
+
+        async def scenario():
+            # The other worker holds the lock and publishes the page shortly
+            await other_worker.set("lock:reviews_7", "token")
+
+            async def other_worker_finishes():
+                await asyncio.sleep(0.1)
+                meta = cache.encode({"headers": {}, "fresh_until": time.time() + 60})
+                await other_worker.set("reviews_7", meta + b"\n[1]")
+
+            asyncio.ensure_future(other_worker_finishes())
+            return await cache.cached_response("reviews_7", compute, db=None, lock=True)
+
+        assert asyncio.run(scenario()) == (b"[1]", {})
+        assert calls == []
+
+
+class TestTaggedInvalidation:
+    def test_tag_set_outlives_its_longest_lived_member(self, monkeypatch):
+        fake = fakeredis.FakeAsyncRedis()
+        monkeypatch.setattr(cache, "r", fake)
+        monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+
+        async def scenario():
+            await cache.set_raw("books_0_10", b"[]", ex=90, tags=[cache.BOOKS_TAG])
+            await cache.set_many_raw([("book:1", b"{}", [cache.BOOKS_TAG])], ex=60)
+            return await fake.ttl("books_0_10"), await fake.ttl(cache.tag_key(cache.BOOKS_TAG))
+
+        page_ttl, tag_ttl = asyncio.run(scenario())
+        assert page_ttl == 90
+        assert tag_ttl >= page_ttl
+
+    def test_page_read_before_a_write_is_not_stored_after_it(self, monkeypatch):
+        fake = fakeredis.FakeAsyncRedis()
+        monkeypatch.setattr(cache, "r", fake)
+        monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+        monkeypatch.setattr(cache, "stats", Counter())
+        read_done, write_done = asyncio.Event(), asyncio.Event()
+        calls = []
+
+        async def compute(db):
+            calls.append(db)
+            if len(calls) == 1:
+                # Read the old rows, then lose the race with a write
+                read_done.set()
+                await write_done.wait()
+                return b"[old]", {}, [cache.BOOKS_TAG]
+            return b"[new]", {}, [cache.BOOKS_TAG]
+
+        async def write():
+            await read_done.wait()
+            await cache.invalidate_tags(cache.BOOKS_TAG)
+            # A reader arriving after the write gets its own computation
+            after_write = await cache.cached_response("books_0_10", compute, db=None, lock=False)
+            write_done.set()
+            return after_write
+
+        async def scenario():
+            before_write, after_write = await asyncio.gather(
+                cache.cached_response("books_0_10", compute, db=None, lock=False), write()
+            )
+            return before_write, after_write, await cache.cached_response("books_0_10", compute, db=None, lock=False)
+
+        before_write, after_write, later = asyncio.run(scenario())
+        assert before_write[0] == b"[old]"
+        assert after_write[0] == later[0] == b"[new]"
+        assert len(calls) == 2
+        assert cache.stats["stale_writes_skipped"] == 1
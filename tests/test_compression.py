@@ -0,0 +1,93 @@
+import gzip
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import cache, compression, models
+
+
+def seed(engine, count):
+    with Session(engine) as db:
+        for i in range(count):
+            book = models.Book(title=f"Book title number {i}", author=f"Author {i}")
+            book.reviews = [models.Review(content=f"Review {j} of book {i}", rating=1 + j) for j in range(3)]
+            db.add(book)
+        db.commit()
+
+
+class TestCompression:
+    def test_large_page_cached_gzipped(self, client, sync_engine, redis_cache):
+        seed(sync_engine, 50)
+        response = client.get("/books/?limit=50", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert len(response.json()) == 50
+
+        # Stored compressed once; a hit sends the stored bytes unchanged
+        body, headers = client.portal.call(cache.get_cached_response, "books_0_50")
+        assert headers["Content-Encoding"] == "gzip"
+        with client.stream("GET", "/books/?limit=50", headers={"Accept-Encoding": "gzip"}) as hit:
+            assert b"".join(hit.iter_raw()) == body
+
+    def test_identity_client_gets_plain_json(self, client, sync_engine, redis_cache):
+        seed(sync_engine, 50)
+        gzipped = client.get("/books/?limit=50", headers={"Accept-Encoding": "gzip"})
+        plain = client.get("/books/?limit=50", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.json() == gzipped.json()
+        # Each representation has its own strong ETag, and each revalidates
+        assert plain.headers["ETag"] != gzipped.headers["ETag"]
+        for response, accept in ((plain, "identity"), (gzipped, "gzip")):
+            revalidated = client.get(
+                "/books/?limit=50",
+                headers={"Accept-Encoding": accept, "If-None-Match": response.headers["ETag"]}
+            )
+            assert revalidated.status_code == 304
+
+    def test_wildcard_gets_stored_gzip(self, client, sync_engine, redis_cache, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", None)
+        seed(sync_engine, 50)
+        client.get("/books/?limit=50", headers={"Accept-Encoding": "gzip"})
+        body, _ = client.portal.call(cache.get_cached_response, "books_0_50")
+        # "*" accepts gzip for the cached entry just as it does for the middleware
+        with client.stream("GET", "/books/?limit=50", headers={"Accept-Encoding": "*"}) as hit:
+            assert b"".join(hit.iter_raw()) == body
+            assert hit.headers["ETag"].endswith('-gzip"')
+        refused = client.get("/books/?limit=50", headers={"Accept-Encoding": "gzip;q=0, *"})
+        assert "content-encoding" not in refused.headers
+        assert len(refused.json()) == 50
+
+    def test_small_responses_not_compressed(self, client, sync_engine):
+        seed(sync_engine, 1)
+        response = client.get("/books/?limit=1", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    def test_uncached_responses_compressed_by_middleware(self, client):
+        response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json()["info"]["title"] == "Book Review API"
+
+    def test_export_not_compressed_twice(self, client, sync_engine):
+        seed(sync_engine, 50)
+        with client.stream("GET", "/books/export", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+        assert response.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(raw).count(b"\n") == 50
+
+    def test_brotli_preferred_when_available(self, client, sync_engine):
+        brotli = pytest.importorskip("brotli")
+        response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip, br"})
+        assert response.headers["content-encoding"] == "br"
+        with client.stream("GET", "/openapi.json", headers={"Accept-Encoding": "br"}) as stream:
+            assert brotli.decompress(b"".join(stream.iter_raw())).startswith(b"{")
+
+    def test_accept_encoding_parsing(self, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", None)
+        assert compression.accepted_encodings("gzip, deflate;q=0.5, br;q=0") == {"gzip", "deflate"}
+        assert compression.preferred_encoding("gzip;q=0, deflate") is None
+        assert compression.preferred_encoding("*") == "gzip"
+        assert compression.preferred_encoding("br") is None
+        assert compression.accepts_encoding("*", "gzip")
+        assert not compression.accepts_encoding("gzip;q=0, *", "gzip")
+        assert not compression.accepts_encoding("deflate", "gzip")
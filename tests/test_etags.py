@@ -0,0 +1,72 @@
+from sqlalchemy.orm import Session
+
+from app import http_cache, models
+
+
+def seed(engine):
+    with Session(engine) as db:
+        books = [models.Book(title=f"Book {i}", author="Someone") for i in range(2)]
+        db.add_all(books)
+        db.commit()
+        return [book.id for book in books]
+
+
+class TestConditionalRequests:
+    def test_matching_etag_gets_304_without_database(self, client, sync_engine, statements, redis_cache):
+        seed(sync_engine)
+        response = client.get("/books/")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag.startswith('"') and etag.endswith('"')
+        assert response.headers["Cache-Control"] == http_cache.CACHE_CONTROL
+
+        executed = len(statements)
+        response = client.get("/books/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        assert response.headers["Cache-Control"] == http_cache.CACHE_CONTROL
+        assert len(statements) == executed
+
+    def test_create_book_changes_etag(self, client, sync_engine, redis_cache):
+        seed(sync_engine)
+        etag = client.get("/books/").headers["ETag"]
+        assert client.post("/books/", json={"title": "New", "author": "Writer"}).status_code == 200
+
+        response = client.get("/books/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert len(response.json()) == 3
+        assert client.get("/books/", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    def test_create_review_changes_only_that_books_etag(self, client, sync_engine, redis_cache):
+        first, second = seed(sync_engine)
+        first_etag = client.get(f"/reviews/{first}").headers["ETag"]
+        second_etag = client.get(f"/reviews/{second}").headers["ETag"]
+        client.post(f"/reviews/?book_id={first}", json={"content": "Great", "rating": 5})
+
+        response = client.get(f"/reviews/{first}", headers={"If-None-Match": first_etag})
+        assert response.status_code == 200
+        assert [review["content"] for review in response.json()] == ["Great"]
+        assert client.get(f"/reviews/{second}", headers={"If-None-Match": second_etag}).status_code == 304
+
+    def test_etag_is_content_hash(self, client, sync_engine, redis_cache):
+        """A page recomputed after an unrelated write keeps its ETag"""
+        seed(sync_engine)
+        etag = client.get("/books/top-rated").headers["ETag"]
+        # Invalidates every books page, but a book without reviews isn't top rated
+        client.post("/books/", json={"title": "Unrated", "author": "Writer"})
+        assert client.get("/books/top-rated", headers={"If-None-Match": etag}).status_code == 304
+
+    def test_304_without_redis(self, client, sync_engine):
+        seed(sync_engine)
+        etag = client.get("/books/").headers["ETag"]
+        assert client.get("/books/", headers={"If-None-Match": etag}).status_code == 304
+
+    def test_if_none_match_forms(self):
+        etag = '"abc"'
+        assert http_cache.etag_matches('"abc"', etag)
+        assert http_cache.etag_matches('W/"abc"', etag)
+        assert http_cache.etag_matches('"xyz", "abc"', etag)
+        assert http_cache.etag_matches("*", etag)
+        assert not http_cache.etag_matches('"xyz"', etag)
@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import json
+import os
+
+import pytest
+from sqlalchemy import insert
+
+from app import export, models
+from app.main import app
+from tests.test_books import seed_books
+
+# Rows exported by the memory test; override with EXPORT_TEST_ROWS for a quick run
+EXPORT_TEST_ROWS = int(os.getenv("EXPORT_TEST_ROWS", "1000000"))
+
+
+def ndjson(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def seed_many_books(engine, count, chunk_size=50_000):
+    with engine.begin() as conn:
+        for start in range(0, count, chunk_size):
+            rows = [
+                {"title": f"Book {i}", "author": f"Author {i % 1000}"}
+                for i in range(start, min(start + chunk_size, count))
+            ]
+            conn.execute(insert(models.Book.__table__), rows)
+
+
+class TestExport:
+    def test_books_export_is_ndjson(self, client, sync_engine):
+        seed_books(sync_engine, 5)
+        response = client.get("/books/export", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-encoding" not in response.headers
+        books = ndjson(response.content)
+        assert [book["title"] for book in books] == [f"Book {i}" for i in range(5)]
+        assert set(books[0]) == {"id", "title", "author", "review_count", "average_rating"}
+
+    def test_reviews_export_is_ndjson(self, client, sync_engine):
+        seed_books(sync_engine, 3, reviews_per_book=4)
+        response = client.get("/reviews/export", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        reviews = ndjson(response.content)
+        assert len(reviews) == 12
+        assert set(reviews[0]) == {"id", "book_id", "content", "rating"}
+
+    def test_export_gzipped_on_request(self, client, sync_engine, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 7)
+        seed_books(sync_engine, 50)
+        response = client.get("/books/export", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(ndjson(response.content)) == 50
+        with client.stream("GET", "/books/export", headers={"Accept-Encoding": "gzip"}) as stream:
+            raw = b"".join(stream.iter_raw())
+        assert ndjson(gzip.decompress(raw)) == ndjson(response.content)
+
+    @pytest.mark.parametrize("accept_encoding", ["gzip;q=0", "x-gzip", "identity"])
+    def test_export_not_gzipped_unless_accepted(self, client, sync_engine, accept_encoding):
+        seed_books(sync_engine, 3)
+        response = client.get("/books/export", headers={"Accept-Encoding": accept_encoding})
+        assert "content-encoding" not in response.headers
+        assert len(ndjson(response.content)) == 3
+
+    def test_empty_export(self, client):
+        response = client.get("/books/export")
+        assert response.status_code == 200
+        assert response.content == b""
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc to read RSS")
+class TestExportMemory:
+    def test_export_memory_stays_flat(self, client, sync_engine):
+        """Exporting the whole table keeps RSS bounded by the batch size, not the row count"""
+        seed_many_books(sync_engine, EXPORT_TEST_ROWS)
+
+        async def run_export():
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                "method": "GET", "scheme": "http", "path": "/books/export", "raw_path": b"/books/export",
+                "query_string": b"", "root_path": "", "headers": [(b"host", b"test")],
+                "client": ("test", 1), "server": ("test", 80),
+            }
+
+            requested = asyncio.Event()
+
+            async def receive():
+                # The request has no body; after that, wait for a disconnect that never comes
+                if requested.is_set():
+                    await asyncio.Event().wait()
+                requested.set()
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            # Count what is sent without keeping it, sampling RSS as we go
+            sent = {"bytes": 0, "lines": 0, "peak": 0}
+            start = rss_bytes()
+
+            async def send(message):
+                if message["type"] == "http.response.body":
+                    body = message.get("body", b"")
+                    sent["bytes"] += len(body)
+                    sent["lines"] += body.count(b"\n")
+                    sent["peak"] = max(sent["peak"], rss_bytes() - start)
+
+            await app(scope, receive, send)
+            return sent
+
+        sent = client.portal.call(run_export)
+        assert sent["lines"] == EXPORT_TEST_ROWS
+        # Well under the size of the export itself (tens of MB at 1M rows)
+        assert sent["peak"] < 50 * 1024 * 1024
+        assert sent["peak"] < sent["bytes"]
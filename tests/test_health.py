@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import database, health
+from app.database import to_async_url
+
+
+def report(**overrides):
+    base = {
+        "checked_at": time.time(),
+        "database": {"status": "ok", "latency_ms": 0.5},
+        "redis": {"status": "ok", "latency_ms": 0.2},
+        "replicas": [],
+    }
+    return {**base, **overrides}
+
+
+class TestHealth:
+    def test_liveness_touches_nothing(self, client, statements):
+        response = client.get("/health/live")
+        assert response.status_code == 200
+        assert response.json() == {"status": "alive"}
+        assert statements == []
+
+    def test_ready_after_startup_probe(self, client):
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "ready"
+        assert body["database"]["status"] == "ok"
+        # The client fixture switches the Redis cache off
+        assert body["redis"] == {"status": "disabled"}
+        assert body["pool"]["saturation"] == 0
+        assert client.get("/health").json() == {
+            "status": "healthy", "database": "connected", "redis": "disabled", "errors": []
+        }
+
+    def test_database_down(self, client, tmp_path):
+        broken = create_async_engine(to_async_url(f"sqlite:///{tmp_path}/missing/dir/books.db"))
+        client.portal.call(health.probe, broken, [])
+        client.portal.call(broken.dispose)
+
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["reasons"] == ["database unavailable"]
+        legacy = client.get("/health").json()
+        assert legacy["status"] == "unhealthy"
+        assert legacy["database"] == "error"
+
+    def test_probe_times_out(self, monkeypatch):
+        monkeypatch.setattr(health, "HEALTH_CHECK_TIMEOUT", 0.05)
+        start = time.perf_counter()
+        result = asyncio.run(health.timed(asyncio.sleep(10)))
+        assert result["status"] == "error"
+        assert "timed out" in result["error"]
+        assert time.perf_counter() - start < 1
+
+    def test_saturated_pool_not_ready(self, client, db_url, monkeypatch):
+        monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 0)
+        monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+        engine = create_async_engine(to_async_url(db_url), **database.engine_options(db_url))
+
+        async def check_while_busy():
+            async with engine.connect():
+                return health.readiness(report(), engine=engine)
+
+        ready, body = client.portal.call(check_while_busy)
+        client.portal.call(engine.dispose)
+        assert not ready
+        assert body["pool"] == {"in_use": 1, "overflow": 0, "capacity": 1, "saturation": 1.0}
+        assert body["reasons"] == ["connection pool 100% in use"]
+        assert health.readiness(report(), engine=engine)[0]
+
+    def test_pool_usage_counts_overflow(self, db_url, monkeypatch):
+        monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 3)
+        monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+        engine = create_engine(db_url, **database.engine_options(db_url))
+        with engine.connect(), engine.connect():
+            assert health.pool_usage(engine) == {"in_use": 2, "overflow": 1, "capacity": 4, "saturation": 0.5}
+        engine.dispose()
+
+    def test_stale_report_not_ready(self):
+        stale = report(checked_at=time.time() - 10 * health.HEALTH_CHECK_INTERVAL)
+        ready, body = health.readiness(stale)
+        assert not ready
+        assert "old" in body["reasons"][0]
+
+    def test_redis_down_and_replica_lag_only_degrade(self):
+        degraded = report(
+            redis={"status": "error", "error": "Connection refused"},
+            replicas=[{"url": "postgresql+asyncpg://replica/books", "status": "ok", "lag_seconds": 42.0}],
+        )
+        ready, body = health.readiness(degraded)
+        assert ready
+        assert body["status"] == "degraded"
+        assert body["warnings"] == ["redis unavailable", "replica postgresql+asyncpg://replica/books is 42s behind"]
+
+    def test_replicas_probed(self, client, db_url):
+        replica = create_async_engine(to_async_url(db_url))
+        result = client.portal.call(health.probe, database.async_engine, [replica])
+        client.portal.call(replica.dispose)
+        assert result["replicas"][0]["status"] == "ok"
+        assert result["replicas"][0]["lag_seconds"] is None
@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from app import logging_config
+
+
+@pytest.fixture
+def log_output():
+    """Route the "app" logger into a buffer, restoring the default setup afterwards"""
+    stream = io.StringIO()
+    handler = logging_config.configure_logging(level="DEBUG", fmt="json", stream=stream)
+    yield stream, handler
+    logging_config.configure_logging()
+
+
+def records(stream):
+    logging_config.stop_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestLogging:
+    def test_json_lines_carry_extra_fields(self, log_output):
+        stream, _ = log_output
+        logging.getLogger("app.routers.books").info("Created book", extra={"book_id": 7})
+        [entry] = records(stream)
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "app.routers.books"
+        assert entry["msg"] == "Created book"
+        assert entry["book_id"] == 7
+
+    def test_traceback_formatted_by_writer(self, log_output):
+        stream, _ = log_output
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("app").exception("Failed")
+        [entry] = records(stream)
+        assert "ValueError: boom" in entry["exc"]
+
+    def test_args_merged_at_call_time(self, log_output):
+        stream, _ = log_output
+        values = ["before"]
+        logging.getLogger("app").info("value=%s", values)
+        values[0] = "after"
+        assert records(stream)[0]["msg"] == "value=['before']"
+
+    def test_debug_lines_are_sampled(self):
+        stream = io.StringIO()
+        try:
+            logging_config.configure_logging(level="DEBUG", stream=stream, sample_rate=0)
+            logger = logging.getLogger("app")
+            for _ in range(100):
+                logger.debug("GET /books/")
+            logger.warning("kept")
+            assert [entry["msg"] for entry in records(stream)] == ["kept"]
+        finally:
+            logging_config.configure_logging()
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = logging_config.NonBlockingQueueHandler(queue.Queue(2))
+        logger = logging.Logger("bench")
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.warning("line %d", i)
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_info_level_skips_request_lines(self, client, sync_engine):
+        stream = io.StringIO()
+        try:
+            logging_config.configure_logging(level="INFO", stream=stream)
+            client.get("/books/")
+            client.post("/books/", json={"title": "Logged", "author": "Someone"})
+            assert [entry["msg"] for entry in records(stream)] == ["Created book"]
+        finally:
+            logging_config.configure_logging()
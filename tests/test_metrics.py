@@ -0,0 +1,90 @@
+from sqlalchemy import create_engine
+
+from app import metrics
+from tests.test_books import seed_books
+
+
+def sample(text, series):
+    """Value of one series line, e.g. 'http_requests_total{method="GET",...}'"""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def scrape(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return response.text
+
+
+class TestMetrics:
+    def test_route_latency_by_template(self, client, sync_engine):
+        seed_books(sync_engine, 3)
+        before = scrape(client)
+        client.get("/reviews/1")
+        client.get("/reviews/2")
+        after = scrape(client)
+
+        count = 'http_request_duration_seconds_count{method="GET",route="/reviews/{book_id}"}'
+        assert sample(after, count) - sample(before, count) == 2
+        inf = 'http_request_duration_seconds_bucket{method="GET",route="/reviews/{book_id}",le="+Inf"}'
+        assert sample(after, inf) == sample(after, count)
+        status = 'http_requests_total{method="GET",route="/reviews/{book_id}",status="200"}'
+        assert sample(after, status) - sample(before, status) == 2
+        assert sample(after, 'http_requests_in_flight{method="GET"}') == 1  # the scrape itself
+
+    def test_queries_per_request(self, client, sync_engine):
+        seed_books(sync_engine, 5)
+        before = scrape(client)
+        client.get("/books/?limit=5")
+        after = scrape(client)
+        total = 'db_queries_per_request_sum{route="/books/"}'
+        # One query for the page and one batched query for its reviews
+        assert sample(after, total) - sample(before, total) == 2
+        assert sample(after, "db_pool_checkout_wait_seconds_count") > sample(before, "db_pool_checkout_wait_seconds_count")
+
+    def test_cache_hit_ratio_by_prefix(self, client, sync_engine, redis_cache):
+        seed_books(sync_engine, 3)
+        for _ in range(4):
+            client.get("/books/")
+        client.get("/reviews/1")
+        text = scrape(client)
+        assert sample(text, 'cache_requests_total{prefix="books",tier="local",result="hit"}') >= 3
+        assert sample(text, 'cache_requests_total{prefix="reviews",tier="redis",result="miss"}') >= 1
+        assert 0 < sample(text, 'cache_hit_ratio{prefix="books"}') < 1
+        assert sample(text, 'redis_command_duration_seconds_count{operation="get"}') >= 2
+
+    def test_unmatched_routes_share_one_label(self, client):
+        client.get("/no/such/path")
+        assert 'route="<unmatched>",status="404"' in scrape(client)
+
+
+class TestHistogram:
+    def test_buckets_are_cumulative(self):
+        histogram = metrics.HistogramMetric("test_seconds", "Test", buckets=(0.1, 1))
+        metrics.registry.remove(histogram)
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        lines = histogram.render()
+        assert 'test_seconds_bucket{le="0.1"} 2' in lines
+        assert 'test_seconds_bucket{le="1"} 3' in lines
+        assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+        assert "test_seconds_count 4" in lines
+
+    def test_pool_waits_timed_after_dispose(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+        metrics.instrument_engine(engine)
+
+        def checkouts():
+            series = metrics.POOL_CHECKOUT_WAIT.values.get(())
+            return series[-1] if series else 0
+
+        # Also how a forked worker drops its parent's pool
+        engine.dispose()
+        before = checkouts()
+        with engine.connect():
+            assert metrics.POOL_WAITING.values.get((), 0) == 0
+        assert checkouts() == before + 1
+        engine.dispose()
@@ -0,0 +1,59 @@
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+
+from app import database
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+
+def alembic_upgrade(engine, monkeypatch, revision):
+    # alembic/env.py runs migrations on app.database.engine
+    monkeypatch.setattr(database, "engine", engine)
+    command.upgrade(Config(ALEMBIC_INI), revision)
+
+
+class TestRatingAggregatesMigration:
+    def test_backfills_existing_reviews(self, tmp_path, monkeypatch):
+        engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+        alembic_upgrade(engine, monkeypatch, "5c1e9a7d3f20")
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO books (id, title, author) VALUES (1, 'A', 'X'), (2, 'B', 'Y')"))
+            conn.execute(text(
+                "INSERT INTO reviews (content, rating, book_id) VALUES ('a', 5, 1), ('b', 2, 1), ('c', 5, 1)"
+            ))
+
+        alembic_upgrade(engine, monkeypatch, "8f3b2d6c4a91")
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, review_count, rating_sum, average_rating, rating_2_count, rating_5_count "
+                "FROM books ORDER BY id"
+            )).all()
+        assert rows == [(1, 3, 12, 4.0, 1, 2), (2, 0, 0, None, 0, 0)]
+        engine.dispose()
+
+    def test_clamps_out_of_range_legacy_ratings(self, tmp_path, monkeypatch):
+        engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+        alembic_upgrade(engine, monkeypatch, "5c1e9a7d3f20")
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO books (id, title, author) VALUES (1, 'A', 'X')"))
+            conn.execute(text(
+                "INSERT INTO reviews (content, rating, book_id) VALUES ('a', 9, 1), ('b', 0, 1), ('c', 3, 1)"
+            ))
+
+        alembic_upgrade(engine, monkeypatch, "8f3b2d6c4a91")
+        with engine.connect() as conn:
+            ratings = conn.scalars(text("SELECT rating FROM reviews ORDER BY id")).all()
+            book = conn.execute(text(
+                "SELECT review_count, rating_sum, average_rating, rating_1_count, rating_2_count, "
+                "rating_3_count, rating_4_count, rating_5_count FROM books"
+            )).one()
+        assert ratings == [5, 1, 3]
+        review_count, rating_sum, average_rating, *histogram = book
+        assert histogram == [1, 0, 1, 0, 1]
+        assert review_count == sum(histogram) == 3
+        assert rating_sum == 9
+        assert average_rating == 3.0
+        engine.dispose()
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import cache, database
+from app.database import get_db, to_async_url
+from app.main import app
+
+
+def test_engine_options_from_settings(monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 20)
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 5000)
+
+    options = database.engine_options("postgresql+asyncpg://u:p@db/books")
+    assert options["pool_size"] == 20
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    options = database.engine_options("postgresql://u:p@db/books", pool_timeout=0.1)
+    assert options["pool_timeout"] == 0.1
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+    # SQLite has no statement timeout; in-memory databases have no sized pool
+    assert "connect_args" not in database.engine_options("sqlite:///books.db")
+    assert database.engine_options("sqlite://") == {}
+
+
+def test_redis_pool_is_bounded(monkeypatch):
+    monkeypatch.setattr(cache, "REDIS_MAX_CONNECTIONS", 7)
+    client = cache.make_redis()
+    pool = client.connection_pool
+    assert pool.max_connections == 7
+    assert pool.timeout == cache.REDIS_POOL_TIMEOUT
+    assert pool.connection_kwargs["socket_timeout"] == cache.REDIS_SOCKET_TIMEOUT
+
+
+def test_exhausted_pool_fails_fast_with_503(client, db_url):
+    """Load test: 50 concurrent requests against a pool of one busy connection"""
+    engine = create_async_engine(
+        to_async_url(db_url),
+        **database.engine_options(db_url, pool_size=1, max_overflow=0, pool_timeout=0.2)
+    )
+    SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with SessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    async def fire(n):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            async def timed_get(i):
+                start = time.perf_counter()
+                response = await http.get("/books/", params={"limit": i + 1})
+                return response, time.perf_counter() - start
+            return await asyncio.gather(*(timed_get(i) for i in range(n)))
+
+    async def load_test():
+        held = await engine.connect()
+        try:
+            busy = await fire(50)
+        finally:
+            await held.close()
+        idle = await fire(5)
+        await engine.dispose()
+        return busy, idle
+
+    busy, idle = client.portal.call(load_test)
+
+    assert {response.status_code for response, _ in busy} == {503}
+    assert all(response.headers["Retry-After"] == "1" for response, _ in busy)
+    # Every request gave up after pool_timeout instead of queueing behind the others
+    assert max(elapsed for _, elapsed in busy) < 1.0
+    assert {response.status_code for response, _ in idle} == {200}
@@ -0,0 +1,130 @@
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import database, models, profiling
+
+
+def seed(engine):
+    with Session(engine) as db:
+        book = models.Book(title="Profiled", author="Someone")
+        book.reviews = [models.Review(content="Fine", rating=4)]
+        db.add(book)
+        db.commit()
+        return book.id
+
+
+@pytest.fixture
+def profile_log(caplog, monkeypatch):
+    """Captured profiler records (alembic's fileConfig in the migration tests disables existing loggers)"""
+    monkeypatch.setattr(profiling.logger, "disabled", False)
+    return caplog
+
+
+@pytest.fixture
+def profile_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    return "s3cret"
+
+
+def timings(response):
+    """Server-Timing entries by name"""
+    entries = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, *params = entry.split(";")
+        entries.setdefault(name, dict(param.split("=", 1) for param in params))
+    return entries
+
+
+class TestProfiling:
+    def test_not_profiled_by_default(self, client, sync_engine):
+        seed(sync_engine)
+        assert "Server-Timing" not in client.get("/books/").headers
+
+    def test_header_enables_profile(self, client, sync_engine, redis_cache, profile_log, profile_token):
+        seed(sync_engine)
+        with profile_log.at_level(logging.INFO, logger="app.profiling"):
+            response = client.get("/books/", headers={"X-Profile": profile_token})
+        entries = timings(response)
+        # Page of books plus the selectinload of their reviews
+        assert entries["db"]["desc"] == '"2 statements"'
+        assert float(entries["db"]["dur"]) > 0
+        # Cache lookup and write-back
+        assert entries["cache"]["desc"] == '"2 calls"'
+        assert float(entries["app"]["dur"]) >= float(entries["db"]["dur"])
+        assert "n_plus_one" not in entries
+
+        [record] = [record for record in profile_log.records if record.msg == "Request profile"]
+        assert record.path == "/books/"
+        assert record.statements == 2
+        assert record.duplicates == []
+
+        # Served from the cache: no statements at all
+        assert timings(client.get("/books/", headers={"X-Profile": profile_token}))["db"]["desc"] == '"0 statements"'
+
+    def test_token_required(self, client, sync_engine, monkeypatch):
+        # Without a configured token nobody can ask for a profile
+        assert "Server-Timing" not in client.get("/books/", headers={"X-Profile": ""}).headers
+        assert "Server-Timing" not in client.get("/books/", headers={"X-Profile": "1"}).headers
+        monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+        assert "Server-Timing" not in client.get("/books/", headers={"X-Profile": "1"}).headers
+        assert "Server-Timing" in client.get("/books/", headers={"X-Profile": "s3cret"}).headers
+
+    def test_sampled_requests_only_logged(self, client, sync_engine, monkeypatch, profile_log):
+        monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+        with profile_log.at_level(logging.INFO, logger="app.profiling"):
+            assert "Server-Timing" not in client.get("/books/").headers
+        assert [record.path for record in profile_log.records if record.msg == "Request profile"] == ["/books/"]
+
+    def test_repeated_statements_flagged(self, client, sync_engine):
+        book_id = seed(sync_engine)
+
+        async def lazy_style_loads():
+            # One query per book, the pattern selectinload exists to avoid
+            async with database.AsyncSessionLocal() as db:
+                for _ in range(4):
+                    await db.execute(select(models.Review).filter(models.Review.book_id == book_id))
+
+        profile = profiling.RequestProfile()
+
+        async def profiled():
+            token = profiling.current_profile.set(profile)
+            try:
+                await lazy_style_loads()
+            finally:
+                profiling.current_profile.reset(token)
+
+        client.portal.call(profiled)
+        [(statement, count)] = profile.duplicates()
+        assert count == 4
+        assert "FROM reviews" in statement
+        # Only the count goes out in the header, the statement stays in the log
+        assert 'n_plus_one;desc="repeated 4x"' in profile.server_timing()
+        assert "reviews" not in profile.server_timing()
+
+    def test_slow_query_logged_with_plan(self, client, sync_engine, monkeypatch, profile_log):
+        book_id = seed(sync_engine)
+        monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+        monkeypatch.setattr(profiling, "explained", {})
+        with profile_log.at_level(logging.WARNING, logger="app.profiling"):
+            assert client.get(f"/reviews/{book_id}").status_code == 200
+
+        [record] = [record for record in profile_log.records if record.msg == "Slow query"]
+        assert "FROM reviews" in record.statement
+        assert record.path == f"/reviews/{book_id}"
+        assert any("ix_reviews_book_id" in line for line in record.plan)
+
+        # The plan of a statement is only captured once per interval
+        profile_log.clear()
+        with profile_log.at_level(logging.WARNING, logger="app.profiling"):
+            client.get(f"/reviews/{book_id}?limit=5")
+        assert [record.plan for record in profile_log.records if record.msg == "Slow query"] == [None]
+
+    def test_writes_are_not_explained(self, client, sync_engine, monkeypatch, profile_log):
+        monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+        with profile_log.at_level(logging.WARNING, logger="app.profiling"):
+            assert client.post("/books/", json={"title": "New", "author": "Writer"}).status_code == 200
+        slow = [record for record in profile_log.records if record.msg == "Slow query"]
+        assert any(record.statement.startswith("INSERT") and record.plan is None for record in slow)
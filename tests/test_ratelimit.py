@@ -0,0 +1,145 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import fakeredis
+import httpx
+import pytest
+
+from app import cache, metrics, ratelimit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Rate limiting on, with a bucket of 3 that doesn't refill during a test"""
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_RATE", 0.001)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_BURST", 3)
+    monkeypatch.setattr(ratelimit, "local_buckets", ratelimit.LocalBuckets())
+    monkeypatch.setattr(ratelimit, "redis_retry_at", 0.0)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestRateLimit:
+    def test_bucket_per_client_in_redis(self, client, redis_cache, limits):
+        assert [client.get("/").headers["X-RateLimit-Remaining"] for _ in range(3)] == ["2", "1", "0"]
+        limited = client.get("/")
+        assert limited.status_code == 429
+        assert int(limited.headers["Retry-After"]) >= 1
+        # Another API key has its own bucket
+        assert client.get("/", headers={"X-API-Key": "other"}).status_code == 200
+        assert client.portal.call(redis_cache.exists, ratelimit.bucket_key("ip:testclient"))
+        # The script was loaded once and is run by its SHA
+        assert client.portal.call(redis_cache.script_exists, ratelimit.token_bucket().sha) == [True]
+        # Probes are never limited
+        assert client.get("/health/live").status_code == 200
+
+    def test_deep_offsets_cost_more(self, client, sync_engine, redis_cache, limits):
+        response = client.get("/books/?skip=2000")
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Remaining"] == "0"
+        assert client.get("/books/").status_code == 429
+
+    def test_local_fallback_without_redis(self, client, limits):
+        assert cache.r is None
+        assert [client.get("/").status_code for _ in range(4)] == [200, 200, 200, 429]
+
+    def test_local_fallback_on_redis_error(self, client, limits, monkeypatch):
+        server = fakeredis.FakeServer()
+        server.connected = False
+        down = fakeredis.FakeAsyncRedis(server=server)
+        monkeypatch.setattr(cache, "r", down)
+        attempts = []
+        evalsha = down.evalsha
+
+        async def counting_evalsha(*args):
+            attempts.append(args)
+            return await evalsha(*args)
+
+        monkeypatch.setattr(down, "evalsha", counting_evalsha)
+        assert [client.get("/").status_code for _ in range(4)] == [200, 200, 200, 429]
+        # Redis is left alone for RATE_LIMIT_REDIS_BACKOFF after the first error
+        assert len(attempts) == 1
+
+        # Tried again once the backoff is over
+        monkeypatch.setattr(ratelimit, "redis_retry_at", 0.0)
+        server.connected = True
+        assert client.get("/", headers={"X-API-Key": "fresh"}).headers["X-RateLimit-Remaining"] == "2"
+        assert client.portal.call(down.keys, "ratelimit:key:*")
+
+    def test_limits_hold_across_workers(self, tmp_path):
+        # Three separate server processes sharing one Redis stand-in
+        redis_port = free_port()
+        server = fakeredis.TcpFakeServer(("127.0.0.1", redis_port), server_type="redis")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{tmp_path / 'workers.db'}",
+            "REDIS_HOST": "127.0.0.1",
+            "REDIS_PORT": str(redis_port),
+            "RATE_LIMIT_ENABLED": "true",
+            "RATE_LIMIT_RATE": "0.001",
+            "RATE_LIMIT_BURST": "10",
+            "CACHE_WARM_ENABLED": "false",
+            "LOG_LEVEL": "WARNING",
+        }
+        ports = [free_port() for _ in range(3)]
+        workers = [
+            subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                             cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for port in ports
+        ]
+        try:
+            clients = [httpx.Client(base_url=f"http://127.0.0.1:{port}") for port in ports]
+            deadline = time.monotonic() + 30
+            for worker in clients:
+                while True:
+                    try:
+                        if worker.get("/health/live").status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        assert time.monotonic() < deadline, "workers did not start"
+                        time.sleep(0.05)
+
+            statuses = [clients[i % 3].get("/").status_code for i in range(30)]
+            assert statuses.count(200) == 10
+            assert statuses.count(429) == 20
+            for worker in clients:
+                worker.close()
+        finally:
+            for worker in workers:
+                worker.terminate()
+                worker.wait(timeout=30)
+            server.shutdown()
+            server.server_close()
+
+
+class TestLoadShedding:
+    def test_low_priority_shed_while_requests_wait_for_connections(self, client, sync_engine, monkeypatch):
+        monkeypatch.setitem(metrics.POOL_WAITING.values, (), ratelimit.SHED_POOL_WAITING)
+        shed_before = metrics.REQUESTS_SHED.values.get((), 0)
+        for url in ("/books/export", "/books/search?q=x", "/books/?skip=5000"):
+            response = client.get(url)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == ratelimit.SHED_RETRY_AFTER
+        assert metrics.REQUESTS_SHED.values[()] == shed_before + 3
+        # Regular pages, writes and probes still go through
+        assert client.get("/books/").status_code == 200
+        assert client.post("/books/", json={"title": "Kept", "author": "Someone"}).status_code == 200
+        assert client.get("/health/ready").status_code == 200
+
+    def test_shed_on_slow_checkouts_only_while_recent(self, client, sync_engine, monkeypatch):
+        monkeypatch.setattr(metrics, "pool_wait", {"seconds": 0.5, "at": time.monotonic()})
+        assert client.get("/books/export").status_code == 503
+        monkeypatch.setattr(metrics, "pool_wait", {"seconds": 0.5, "at": time.monotonic() - 5})
+        assert client.get("/books/export").status_code == 200
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import database, models
+from app.database import Base, get_db, to_async_url
+from app.main import app
+
+
+def titles(response):
+    assert response.status_code == 200
+    return sorted(book["title"] for book in response.json())
+
+
+@pytest.fixture
+def replica(client, sync_engine, tmp_path, monkeypatch):
+    """Route reads to a second SQLite file standing in for a lagging replica.
+
+    The replica holds only "Replica book"; the primary has that plus
+    everything written during the test.
+    """
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica_sync = create_engine(replica_url)
+    Base.metadata.create_all(replica_sync)
+    for engine in (sync_engine, replica_sync):
+        with Session(engine) as db:
+            db.add(models.Book(title="Replica book", author="Someone"))
+            db.commit()
+
+    replica_engine = create_async_engine(to_async_url(replica_url))
+    monkeypatch.setattr(database, "ReplicaSessionLocals", [async_sessionmaker(bind=replica_engine, expire_on_commit=False)])
+    # Use the real get_db; the client fixture already points the primary at its database
+    app.dependency_overrides.pop(get_db)
+    yield replica_engine
+    client.portal.call(replica_engine.dispose)
+    replica_sync.dispose()
+
+
+class TestReplicaRouting:
+    def test_reads_go_to_replica(self, client, replica, statements):
+        assert titles(client.get("/books/?include_reviews=false")) == ["Replica book"]
+        # The client fixture records statements on the primary only
+        assert statements == []
+
+    def test_writes_go_to_primary_and_stick(self, client, replica):
+        response = client.post("/books/", json={"title": "New book", "author": "Writer"})
+        assert response.status_code == 200
+        assert database.STICKY_COOKIE in response.cookies
+
+        # Read-your-writes: the writer sees its book although the replica lags
+        assert titles(client.get("/books/?include_reviews=false")) == ["New book", "Replica book"]
+
+        # Other clients keep reading from the replica
+        client.cookies.clear()
+        assert titles(client.get("/books/?include_reviews=false")) == ["Replica book"]
+
+    def test_failed_write_does_not_stick(self, client, replica):
+        response = client.post("/books/", json={"title": "No author"})
+        assert response.status_code == 422
+        assert database.STICKY_COOKIE not in response.cookies
+
+    def test_stickiness_expires(self, client, replica, monkeypatch):
+        monkeypatch.setattr(database, "DB_STICKY_SECONDS", 0)
+        assert client.post("/books/", json={"title": "New book", "author": "Writer"}).status_code == 200
+        assert titles(client.get("/books/?include_reviews=false")) == ["Replica book"]
+
+    def test_forged_cookie_is_ignored(self, client, replica):
+        client.cookies.set(database.STICKY_COOKIE, "99999999999")
+        assert titles(client.get("/books/?include_reviews=false")) == ["Replica book"]
+
+    def test_cache_is_filled_from_primary(self, client, replica, redis_cache):
+        assert titles(client.get("/books/?include_reviews=false")) == ["Replica book"]
+        client.post("/books/", json={"title": "New book", "author": "Writer"})
+        # The write invalidated the page; the next reader, not the writer,
+        # refills it from the primary rather than the lagging replica
+        client.cookies.clear()
+        assert titles(client.get("/books/?include_reviews=false")) == ["New book", "Replica book"]
+        assert titles(client.get("/books/?include_reviews=false")) == ["New book", "Replica book"]
+        assert titles(client.get("/books/?ids=1,2&include_reviews=false")) == ["New book", "Replica book"]
+
+    def test_no_replicas_uses_primary(self, client, sync_engine, statements):
+        app.dependency_overrides.pop(get_db)
+        with Session(sync_engine) as db:
+            db.add(models.Book(title="Primary book", author="Someone"))
+            db.commit()
+        response = client.post("/books/", json={"title": "New book", "author": "Writer"})
+        assert database.STICKY_COOKIE not in response.cookies
+        assert titles(client.get("/books/?include_reviews=false")) == ["New book", "Primary book"]
@@ -0,0 +1,176 @@
+import fakeredis
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import cache, models, review_queue
+
+
+def seed_book(engine):
+    with Session(engine) as db:
+        book = models.Book(title="Queued", author="Someone")
+        db.add(book)
+        db.commit()
+        return book.id
+
+
+def stored_reviews(engine, book_id):
+    with Session(engine) as db:
+        return db.scalars(select(models.Review.content).filter_by(book_id=book_id).order_by(models.Review.id)).all()
+
+
+@pytest.fixture
+def write_behind(client, tmp_path, monkeypatch):
+    """Write-behind mode with the on-disk queue in a throwaway file"""
+    path = tmp_path / "review_queue.db"
+    local = review_queue.LocalReviewQueue(path)
+    monkeypatch.setattr(review_queue, "REVIEW_WRITE_BEHIND", True)
+    monkeypatch.setattr(review_queue, "REVIEW_QUEUE_PATH", str(path))
+    monkeypatch.setattr(review_queue, "local_queue", local)
+    monkeypatch.setattr(review_queue, "redis_queue", None)
+    yield local
+    client.portal.call(local.close)
+
+
+def drain(client):
+    return client.portal.call(review_queue.drain)
+
+
+class TestWriteBehind:
+    def test_accepted_then_stored_in_batch(self, client, sync_engine, write_behind, monkeypatch):
+        book_id = seed_book(sync_engine)
+        invalidations = []
+
+        async def record_invalidation(*tags):
+            invalidations.append(tags)
+
+        monkeypatch.setattr(review_queue, "invalidate_tags", record_invalidation)
+
+        ids = []
+        for i in range(20):
+            response = client.post(f"/reviews/?book_id={book_id}", json={"content": f"Review {i}", "rating": 1 + i % 5})
+            assert response.status_code == 202
+            body = response.json()
+            assert body["status"] == "queued"
+            assert response.headers["Location"] == f"/reviews/submissions/{body['id']}"
+            ids.append(body["id"])
+        assert stored_reviews(sync_engine, book_id) == []
+
+        assert drain(client) == 20
+        assert stored_reviews(sync_engine, book_id) == [f"Review {i}" for i in range(20)]
+        # One cache invalidation for the whole batch
+        assert invalidations == [(f"reviews:{book_id}", "ratings")]
+
+        status = client.get(f"/reviews/submissions/{ids[0]}").json()
+        assert status["status"] == "stored"
+        assert isinstance(status["review_id"], int)
+        with Session(sync_engine) as db:
+            assert db.get(models.Book, book_id).review_count == 20
+
+    def test_idempotency_key(self, client, sync_engine, write_behind):
+        book_id = seed_book(sync_engine)
+        review = {"content": "Only once", "rating": 5}
+        headers = {"Idempotency-Key": "client-retry-1"}
+        first = client.post(f"/reviews/?book_id={book_id}", json=review, headers=headers)
+        again = client.post(f"/reviews/?book_id={book_id}", json=review, headers=headers)
+        assert first.json()["id"] == again.json()["id"]
+
+        drain(client)
+        replay = client.post(f"/reviews/?book_id={book_id}", json=review, headers=headers)
+        assert replay.status_code == 202
+        assert replay.json()["status"] == "stored"
+        assert drain(client) == 0
+        assert stored_reviews(sync_engine, book_id) == ["Only once"]
+
+        conflict = client.post(f"/reviews/?book_id={book_id}", json={"content": "Other", "rating": 1}, headers=headers)
+        assert conflict.status_code == 409
+
+    def test_unknown_book_fails(self, client, sync_engine, write_behind):
+        submission_id = client.post("/reviews/?book_id=999", json={"content": "Lost", "rating": 3}).json()["id"]
+        drain(client)
+        status = client.get(f"/reviews/submissions/{submission_id}").json()
+        assert status["status"] == "failed"
+        assert "999" in status["error"]
+
+    def test_abandoned_claims_are_retried(self, client, sync_engine, write_behind, monkeypatch):
+        book_id = seed_book(sync_engine)
+        client.post(f"/reviews/?book_id={book_id}", json={"content": "Retried", "rating": 4})
+        # A worker claims the batch and dies before storing it
+        assert len(client.portal.call(write_behind.claim, 10)) == 1
+        assert drain(client) == 0
+
+        monkeypatch.setattr(review_queue, "REVIEW_QUEUE_CLAIM_TIMEOUT", 0)
+        assert drain(client) == 1
+        assert stored_reviews(sync_engine, book_id) == ["Retried"]
+
+    def test_unknown_submission(self, client, write_behind):
+        assert client.get("/reviews/submissions/nope").status_code == 404
+
+    def test_redis_stream(self, client, sync_engine, write_behind, redis_cache):
+        book_id = seed_book(sync_engine)
+        assert client.get(f"/reviews/{book_id}").json() == []
+        submission_id = client.post(f"/reviews/?book_id={book_id}", json={"content": "Streamed", "rating": 5}).json()["id"]
+        assert client.portal.call(redis_cache.xlen, review_queue.STREAM_KEY) == 1
+        assert client.get(f"/reviews/submissions/{submission_id}").json()["status"] == "queued"
+
+        assert drain(client) == 1
+        assert client.portal.call(redis_cache.xlen, review_queue.STREAM_KEY) == 0
+        assert client.get(f"/reviews/submissions/{submission_id}").json()["status"] == "stored"
+        # The cached page was invalidated by the batch
+        assert [review["content"] for review in client.get(f"/reviews/{book_id}").json()] == ["Streamed"]
+
+    def test_falls_back_to_disk_when_redis_is_down(self, client, sync_engine, write_behind, monkeypatch):
+        book_id = seed_book(sync_engine)
+        server = fakeredis.FakeServer()
+        server.connected = False
+        monkeypatch.setattr(cache, "r", fakeredis.FakeAsyncRedis(server=server))
+
+        response = client.post(f"/reviews/?book_id={book_id}", json={"content": "On disk", "rating": 2})
+        assert response.status_code == 202
+        assert drain(client) == 1
+        assert stored_reviews(sync_engine, book_id) == ["On disk"]
+
+    def test_idempotency_across_redis_outage(self, client, sync_engine, write_behind, redis_cache, monkeypatch):
+        book_id = seed_book(sync_engine)
+        review = {"content": "Only once", "rating": 5}
+        server = fakeredis.FakeServer()
+        down = fakeredis.FakeAsyncRedis(server=server)
+        server.connected = False
+
+        # Queued on disk during an outage, retried once Redis is back
+        monkeypatch.setattr(cache, "r", down)
+        first = client.post(f"/reviews/?book_id={book_id}", json=review, headers={"Idempotency-Key": "on-disk"})
+        monkeypatch.setattr(cache, "r", redis_cache)
+        retry = client.post(f"/reviews/?book_id={book_id}", json=review, headers={"Idempotency-Key": "on-disk"})
+        assert retry.json()["id"] == first.json()["id"]
+        assert client.portal.call(redis_cache.xlen, review_queue.STREAM_KEY) == 0
+
+        # Queued in Redis, retried onto disk during an outage
+        client.post(f"/reviews/?book_id={book_id}", json=review, headers={"Idempotency-Key": "in-redis"})
+        monkeypatch.setattr(cache, "r", down)
+        client.post(f"/reviews/?book_id={book_id}", json=review, headers={"Idempotency-Key": "in-redis"})
+        monkeypatch.setattr(cache, "r", redis_cache)
+
+        assert drain(client) == 3
+        assert stored_reviews(sync_engine, book_id) == ["Only once", "Only once"]
+
+    def test_status_of_review_queued_on_disk_by_another_worker(self, client, sync_engine, write_behind, redis_cache, monkeypatch):
+        book_id = seed_book(sync_engine)
+        server = fakeredis.FakeServer()
+        server.connected = False
+        monkeypatch.setattr(cache, "r", fakeredis.FakeAsyncRedis(server=server))
+        submission_id = client.post(f"/reviews/?book_id={book_id}", json={"content": "On disk", "rating": 2}).json()["id"]
+
+        # Redis is back, and this worker never opened the on-disk queue itself
+        monkeypatch.setattr(cache, "r", redis_cache)
+        monkeypatch.setattr(review_queue, "local_queue", None)
+        response = client.get(f"/reviews/submissions/{submission_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "queued"
+        client.portal.call(review_queue.local_queue.close)
+
+    def test_synchronous_by_default(self, client, sync_engine):
+        book_id = seed_book(sync_engine)
+        response = client.post(f"/reviews/?book_id={book_id}", json={"content": "Now", "rating": 5})
+        assert response.status_code == 200
+        assert stored_reviews(sync_engine, book_id) == ["Now"]
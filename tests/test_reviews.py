@@ -0,0 +1,152 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app import models
+from app.pagination import MAX_PAGE_SIZE, encode_cursor
+
+
+def seed_reviews(engine, ratings):
+    with Session(engine) as db:
+        book = models.Book(title="Popular Book", author="Someone")
+        book.reviews = [
+            models.Review(content=f"Review {i}", rating=rating)
+            for i, rating in enumerate(ratings)
+        ]
+        db.add(book)
+        db.commit()
+        return book.id
+
+
+def walk(client, book_id, **params):
+    """Follow X-Next-Cursor until the last page, returning every review seen"""
+    reviews, cursor = [], None
+    while True:
+        query = dict(params)
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get(f"/reviews/{book_id}", params=query)
+        assert response.status_code == 200
+        reviews.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return reviews
+
+
+class TestReviewPagination:
+    def test_default_page_is_limited(self, client, sync_engine):
+        book_id = seed_reviews(sync_engine, [5] * 60)
+        response = client.get(f"/reviews/{book_id}")
+        assert len(response.json()) == 50
+        assert "X-Next-Cursor" in response.headers
+
+    def test_walk_by_id(self, client, sync_engine):
+        book_id = seed_reviews(sync_engine, [3] * 23)
+        reviews = walk(client, book_id, limit=5)
+        assert [r["id"] for r in reviews] == list(range(1, 24))
+
+    def test_walk_by_rating(self, client, sync_engine):
+        ratings = [4, 1, 5, 1, 3, 5, 2, 4, 4, 1, 2]
+        book_id = seed_reviews(sync_engine, ratings)
+        ascending = walk(client, book_id, limit=3, sort="rating")
+        assert [(r["rating"], r["id"]) for r in ascending] == sorted(
+            (rating, i + 1) for i, rating in enumerate(ratings)
+        )
+        descending = walk(client, book_id, limit=3, sort="-rating")
+        assert [(r["rating"], r["id"]) for r in descending] == sorted(
+            ((rating, i + 1) for i, rating in enumerate(ratings)), reverse=True
+        )
+
+    def test_cursor_must_match_sort(self, client, sync_engine):
+        book_id = seed_reviews(sync_engine, [1] * 4)
+        first = client.get(f"/reviews/{book_id}?limit=2")
+        response = client.get(f"/reviews/{book_id}", params={"sort": "rating", "cursor": first.headers["X-Next-Cursor"]})
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("after", [{"id": 10**30}, {"id": False}, {"rating": 2**63, "id": 1}])
+    def test_cursor_out_of_range(self, client, sync_engine, after):
+        book_id = seed_reviews(sync_engine, [1] * 4)
+        sort = "rating" if "rating" in after else "id"
+        response = client.get(f"/reviews/{book_id}", params={"sort": sort, "cursor": encode_cursor(after)})
+        assert response.status_code == 400
+
+    def test_unknown_sort(self, client):
+        response = client.get("/reviews/1?sort=content")
+        assert response.status_code == 422
+
+    @pytest.mark.parametrize("limit", [-1, 0, MAX_PAGE_SIZE + 1])
+    def test_limit_out_of_range(self, client, sync_engine, limit):
+        book_id = seed_reviews(sync_engine, [3] * 60)
+        assert client.get(f"/reviews/{book_id}", params={"limit": limit}).status_code == 422
+
+
+class TestReviewCacheInvalidation:
+    def test_create_review_invalidates_dependent_pages(self, client, redis_cache, sync_engine):
+        first = seed_reviews(sync_engine, [3, 4])
+        second = seed_reviews(sync_engine, [5])
+        pages = [f"/reviews/{first}", f"/reviews/{first}?sort=-rating&limit=1", "/books/", f"/reviews/{second}"]
+        for page in pages:
+            client.get(page)
+
+        client.post(f"/reviews/?book_id={first}", json={"content": "Late", "rating": 5})
+        keys = {key.decode() for key in client.portal.call(redis_cache.keys, "*_*")}
+        assert keys == {f"reviews_{second}"}
+
+        assert len(client.get(f"/reviews/{first}").json()) == 3
+        assert client.get(f"/reviews/{first}?sort=-rating&limit=1").json()[0]["content"] == "Late"
+        books = {book["id"]: book for book in client.get("/books/").json()}
+        assert len(books[first]["reviews"]) == 3
+
+
+class TestRatingAggregates:
+    def test_create_review_updates_aggregates(self, client, sync_engine):
+        book_id = client.post("/books/", json={"title": "Rated", "author": "Someone"}).json()["id"]
+        for rating in (5, 4, 4):
+            client.post(f"/reviews/?book_id={book_id}", json={"content": "ok", "rating": rating})
+
+        book = client.get("/books/?include_reviews=false").json()[0]
+        assert book["review_count"] == 3
+        assert book["average_rating"] == 13 / 3
+
+        top = client.get("/books/top-rated").json()[0]
+        assert top["rating_histogram"] == {"1": 0, "2": 0, "3": 0, "4": 2, "5": 1}
+
+    def test_rating_out_of_range_rejected(self, client):
+        for rating in (0, 6):
+            response = client.post("/reviews/?book_id=1", json={"content": "ok", "rating": rating})
+            assert response.status_code == 422
+        result = client.post("/reviews/bulk", json=[{"book_id": 1, "content": "ok", "rating": 6}]).json()
+        assert result["inserted"] == 0
+        assert result["errors"][0]["index"] == 0
+
+    def test_top_rated_order(self, client, sync_engine, statements):
+        ids = [client.post("/books/", json={"title": f"Book {i}", "author": "A"}).json()["id"] for i in range(4)]
+        for book_id, ratings in zip(ids, ([3, 3], [5], [5, 5], [])):
+            for rating in ratings:
+                client.post(f"/reviews/?book_id={book_id}", json={"content": "ok", "rating": rating})
+
+        statements.clear()
+        top = client.get("/books/top-rated").json()
+        assert [book["id"] for book in top] == [ids[2], ids[1], ids[0]]
+        assert len(statements) == 1
+        assert "reviews" not in statements[0]
+        assert [book["id"] for book in client.get("/books/top-rated?min_reviews=2").json()] == [ids[2], ids[0]]
+
+
+class TestBulkReviews:
+    def test_bulk_reviews_update_aggregates(self, client, sync_engine):
+        book_id = seed_reviews(sync_engine, [])
+        rows = [
+            {"book_id": book_id, "content": "a", "rating": 5},
+            {"book_id": 999, "content": "b", "rating": 4},
+            {"book_id": book_id, "content": "c", "rating": 9},
+            {"book_id": book_id, "content": "d", "rating": 3},
+        ]
+        data = client.post("/reviews/bulk", json=rows).json()
+        assert data["inserted"] == 2
+        assert data["ids"][1] is None and data["ids"][2] is None
+        assert data["errors"][0] == {"index": 1, "error": "Book 999 not found"}
+
+        book = client.get("/books/?include_reviews=false").json()[0]
+        assert book["review_count"] == 2
+        assert book["average_rating"] == 4.0
+        assert [r["content"] for r in client.get(f"/reviews/{book_id}").json()] == ["a", "d"]
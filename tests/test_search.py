@@ -0,0 +1,109 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app import models, search
+from app.pagination import encode_cursor
+
+
+def seed_catalogue(engine):
+    with Session(engine) as db:
+        db.add_all([
+            models.Book(title="The Hobbit", author="J. R. R. Tolkien"),
+            models.Book(title="Tolkien: A Biography", author="Humphrey Carpenter"),
+            models.Book(title="Dune", author="Frank Herbert"),
+            models.Book(title="Dune Messiah", author="Frank Herbert", reviews=[
+                models.Review(content="Darker than the first Dune, and not a dragon in sight", rating=4),
+            ]),
+            models.Book(title="Children of Dune", author="Frank Herbert"),
+        ])
+        db.commit()
+
+
+def titles(response):
+    assert response.status_code == 200
+    return [book["title"] for book in response.json()]
+
+
+class TestSearch:
+    def test_title_match_outranks_author_match(self, client, sync_engine):
+        seed_catalogue(sync_engine)
+        assert titles(client.get("/books/search", params={"q": "tolkien"})) == [
+            "Tolkien: A Biography", "The Hobbit"
+        ]
+
+    def test_every_word_must_match(self, client, sync_engine):
+        seed_catalogue(sync_engine)
+        assert titles(client.get("/books/search", params={"q": "DUNE herbert"})) == [
+            "Dune", "Dune Messiah", "Children of Dune"
+        ]
+        assert titles(client.get("/books/search", params={"q": "dune tolkien"})) == []
+
+    def test_match_reviews(self, client, sync_engine):
+        seed_catalogue(sync_engine)
+        assert titles(client.get("/books/search", params={"q": "dragon"})) == []
+        response = client.get("/books/search", params={"q": "dragon", "match_reviews": "true"})
+        assert titles(response) == ["Dune Messiah"]
+        assert response.json()[0]["review_count"] == 0
+        # A matching review lifts a book above equal title matches
+        assert titles(client.get("/books/search", params={"q": "dune", "match_reviews": "true"}))[0] == "Dune Messiah"
+
+    def test_cursor_walks_every_result_once(self, client, sync_engine):
+        with Session(sync_engine) as db:
+            db.add_all(models.Book(title=f"Dune {i}" + " dune" * (i % 3), author="Anon") for i in range(25))
+            db.commit()
+        seen, cursor = [], None
+        while True:
+            params = {"q": "dune", "limit": 4}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/books/search", params=params)
+            seen.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert sorted(book["id"] for book in seen) == list(range(1, 26))
+        ranks = [book["rank"] for book in seen]
+        assert ranks == sorted(ranks, reverse=True)
+
+    def test_new_books_are_found(self, client, sync_engine, redis_cache):
+        seed_catalogue(sync_engine)
+        assert titles(client.get("/books/search", params={"q": "dune"})) == ["Dune", "Dune Messiah", "Children of Dune"]
+        client.post("/books/", json={"title": "Dune", "author": "Someone Else"})
+        assert len(titles(client.get("/books/search", params={"q": "dune"}))) == 4
+
+    def test_cached(self, client, sync_engine, redis_cache, statements):
+        seed_catalogue(sync_engine)
+        first = client.get("/books/search", params={"q": "dune"})
+        statements.clear()
+        second = client.get("/books/search", params={"q": "dune"})
+        assert second.content == first.content
+        assert statements == []
+
+    def test_invalid_queries(self, client):
+        assert client.get("/books/search", params={"q": "  "}).status_code == 422
+        assert client.get("/books/search").status_code == 422
+        cursor = encode_cursor({"id": 1})
+        assert client.get("/books/search", params={"q": "dune", "cursor": cursor}).status_code == 400
+        cursor = encode_cursor({"rank": 0.5, "id": 1.5})
+        assert client.get("/books/search", params={"q": "dune", "cursor": cursor}).status_code == 400
+        for rank in (float("inf"), float("nan"), 10**30, True):
+            cursor = encode_cursor({"rank": rank, "id": 1})
+            assert client.get("/books/search", params={"q": "dune", "cursor": cursor}).status_code == 400
+
+
+class TestPostgresSearch:
+    def compile(self, **kwargs):
+        stmt = search.build_postgres_search("dune", 10, None, **kwargs)
+        return str(stmt.compile(dialect=postgresql.dialect()))
+
+    def test_query_uses_indexed_expressions(self):
+        """The WHERE clause must repeat the GIN index expressions verbatim"""
+        sql = self.compile(match_reviews=True)
+        assert (
+            "(setweight(to_tsvector('english', books.title), 'A') || "
+            "setweight(to_tsvector('english', books.author), 'B')) @@ websearch_to_tsquery('english', "
+        ) in sql
+        assert "to_tsvector('english', reviews.content) @@ websearch_to_tsquery('english', " in sql
+
+    def test_reviews_only_joined_on_request(self):
+        assert "reviews" not in self.compile(match_reviews=False)
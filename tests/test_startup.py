@@ -0,0 +1,77 @@
+import asyncio
+import os
+import subprocess
+import sys
+from collections import Counter
+
+import fakeredis
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import cache, database, warmer
+from app.database import engine_options, to_async_url
+from app.main import app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_opens_nothing():
+    # A server preloading the app forks its workers after this import
+    snippet = "import app.main; from app import cache, database; print(database.engines_ready, cache.r)"
+    result = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["False", "None"]
+    assert result.stderr == ""
+
+
+def test_lifespan_creates_and_releases_worker_resources(app_engines, monkeypatch):
+    server = fakeredis.FakeServer()
+    fakeredis.FakeRedis(server=server).set("books_0_10", b"[]")
+    fake = fakeredis.FakeAsyncRedis(server=server)
+    monkeypatch.setattr(cache, "REDIS_ENABLED", True)
+    monkeypatch.setattr(warmer, "CACHE_WARM_ENABLED", False)
+    monkeypatch.setattr(cache, "r", None)
+    monkeypatch.setattr(cache, "make_redis", lambda: fake)
+    monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+    monkeypatch.setattr(cache, "stats", Counter())
+
+    with TestClient(app) as client:
+        assert cache.r is fake
+        assert database.engines_ready
+        # Hot keys were copied into the local tier before the first request
+        assert cache.local_cache.get("books_0_10") == b"[]"
+        assert database.async_engine.pool.checkedin() > 0
+        assert client.get("/health/live").status_code == 200
+    assert cache.r is None
+
+
+def test_warm_pool_opens_connections(tmp_path):
+    url = to_async_url(f"sqlite:///{tmp_path / 'warm.db'}")
+    engine = create_async_engine(url, **engine_options(url))
+
+    async def warm():
+        try:
+            await database.warm_pool(engine, 3)
+            return engine.pool.checkedin()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(warm()) == 3
+
+
+def test_forked_worker_does_not_reuse_parent_connections(app_engines):
+    with database.engine.connect():
+        pass
+    pooled = database.engine.pool.checkedin()
+    assert pooled > 0
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, str(database.engine.pool.checkedin()).encode())
+        os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as child:
+        assert child.read() == "0"
+    # The parent's pool is untouched
+    assert database.engine.pool.checkedin() == pooled
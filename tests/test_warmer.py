@@ -0,0 +1,109 @@
+from collections import Counter
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import cache, models, warmer
+
+
+def seed(engine, n_books=3):
+    """Books with i + 1 reviews each"""
+    with Session(engine) as db:
+        books = []
+        for i in range(n_books):
+            book = models.Book(title=f"Book {i}", author="Someone")
+            book.reviews = [models.Review(content=f"Review {j} of {i}", rating=5) for j in range(i + 1)]
+            books.append(book)
+        db.add_all(books)
+        db.commit()
+        return [book.id for book in books]
+
+
+@pytest.fixture
+def hot_keys(redis_cache, monkeypatch):
+    hot = cache.HotKeys()
+    monkeypatch.setattr(cache, "hot_keys", hot)
+    return hot
+
+
+def restart(client, redis_cache, monkeypatch, flush=True):
+    """A fresh worker: empty local tier and counters, and Redis flushed (as after a deploy that lost it)"""
+    if flush:
+        client.portal.call(redis_cache.flushall)
+    monkeypatch.setattr(cache, "local_cache", cache.LocalCache())
+    monkeypatch.setattr(cache, "stats", Counter())
+
+
+def test_hot_keys_are_bounded_and_keep_the_head():
+    hot = cache.HotKeys(capacity=10)
+    for i in range(1000):
+        hot.record(f"book_{i}")
+        if i % 2 == 0:
+            hot.record("books_0_10")
+        if i % 5 == 0:
+            hot.record("reviews_1")
+    assert len(hot) <= 20
+    assert hot.top(2) == ["books_0_10", "reviews_1"]
+    assert hot.drain()["books_0_10"] == 500
+    assert len(hot) == 0
+
+
+def test_hit_ratio_after_restart(client, sync_engine, redis_cache, hot_keys, statements, monkeypatch, tmp_path):
+    book_ids = seed(sync_engine, 25)
+    urls = [f"/books/?skip={skip}&limit=10" for skip in (0, 10, 20)] + [f"/reviews/{book_id}" for book_id in book_ids[:5]]
+    before = [client.get(url).content for url in urls]
+    client.portal.call(warmer.share_counts)
+
+    # Record the hot keys, as `python -m app.warmer --save` does
+    keys_file = tmp_path / "hot_keys.txt"
+    keys_file.write_text("".join(f"{key}\n" for key in client.portal.call(warmer.hottest_keys)))
+
+    # Restarted cold: every first request goes to the database
+    restart(client, redis_cache, monkeypatch)
+    for url in urls:
+        client.get(url)
+    assert cache.cache_stats()["redis"]["hit_ratio"] == 0.0
+
+    # Restarted and warmed from the key list: batched queries, then every request hits
+    restart(client, redis_cache, monkeypatch)
+    statements.clear()
+    assert client.portal.call(warmer.warm, warmer.load_keys(keys_file)) == len(urls)
+    # One query for the adjacent pages of books, one for their reviews, one for the books' reviews
+    assert len(statements) == 3
+    restart(client, redis_cache, monkeypatch, flush=False)
+    statements.clear()
+    assert [client.get(url).content for url in urls] == before
+    assert cache.cache_stats()["redis"]["hit_ratio"] == 1.0
+    assert statements == []
+
+
+def test_cycle_warms_hottest_keys_once_per_interval(client, sync_engine, redis_cache, hot_keys, monkeypatch):
+    first, second, _ = seed(sync_engine)
+    monkeypatch.setattr(warmer, "CACHE_WARM_TOP_K", 2)
+    for _ in range(3):
+        client.get("/books/")
+    for _ in range(2):
+        client.get(f"/reviews/{first}")
+    client.get(f"/reviews/{second}")
+    client.get(f"/books/{first}")  # not a page the warmer rebuilds
+    warmed = ["books_0_10", f"reviews_{first}"]
+    client.portal.call(redis_cache.delete, *warmed, f"reviews_{second}")
+
+    assert client.portal.call(warmer.run_cycle) == 2
+    assert client.portal.call(redis_cache.exists, *warmed) == 2
+    assert not client.portal.call(redis_cache.exists, f"reviews_{second}")
+    # Counts decay so the warmer follows current traffic
+    assert client.portal.call(redis_cache.zscore, warmer.HOT_KEYS_KEY, "books_0_10") == 1.5
+
+    # Another worker's cycle within the interval leaves the work done
+    assert client.portal.call(warmer.run_cycle) == 0
+
+
+def test_books_pages_grouped_into_runs(monkeypatch):
+    monkeypatch.setattr(warmer, "CACHE_WARM_MAX_ROWS", 50)
+    pages = [("a", 20, 10), ("b", 0, 10), ("c", 10, 20), ("d", 100, 10), ("e", 40, 20)]
+    assert [(start, end, [key for key, _, _ in run]) for start, end, run in warmer.book_page_runs(pages)] == [
+        (0, 30, ["b", "c", "a"]),
+        (40, 60, ["e"]),
+        (100, 110, ["d"]),
+    ]